@@ -1,12 +1,9 @@
 import os
 import argparse
-from pathlib import Path
 from loguru import logger
 from dotenv import load_dotenv
 
-from utils.pdf_utils import parse_pdf_to_files
-from utils.docx_utils import convert_markdown_to_word_with_pandoc
-from utils.pdf_converter import process_and_convert_pdf
+from utils.model_server import get_server_url, serve, server_available, submit_job
 
 
 os.environ["MINERU_MODEL_SOURCE"] = "modelscope"
@@ -25,54 +22,53 @@ def main():
         default="format", 
         help="转换模式: 'content' (只保留内容，格式流畅), 'format' (尽量保留原始格式), 'debug' (仅解析PDF，不进行格式转换)"
     )
+    parser.add_argument(
+        "-w", "--page-window",
+        type=int,
+        default=None,
+        help="流式页面窗口大小: 每次只渲染并推理指定页数，适用于超长文档以限制页面图像的内存占用 (默认整本一次处理)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="断点续跑: 按页面窗口保存每页的模型结果和解析结果，重新运行时跳过已完成的页面 (checkpoint默认保存在输出目录下的 .checkpoints)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="增量转换: 按页面内容哈希复用之前转换过的页面，修订后的文档只重新处理新增或修改的页面"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="启动常驻模型服务: 模型只加载一次，之后的转换任务通过 --server 提交，不再重复初始化模型"
+    )
+    parser.add_argument(
+        "--server",
+        nargs="?",
+        const=get_server_url(),
+        default=os.getenv("MINERU_SERVER_URL"),
+        help="将转换任务提交到常驻模型服务 (默认地址 %(const)s，也可通过环境变量 MINERU_SERVER_URL 设置)，服务不可用时在本地执行"
+    )
 
     args = parser.parse_args()
 
-    # 确保输入文件存在
-    if not os.path.exists(args.input):
-        logger.error(f"输入文件不存在: {args.input}")
+    if args.serve:
+        serve()
         return
 
-    # 确保输出目录存在
-    os.makedirs(args.output, exist_ok=True)
-
-    file_base_name = Path(args.input).stem
-
-    logger.info(f"开始处理文件: {args.input}, 使用模式: {args.mode}")
-
-    if args.mode == 'content':
-        # --- 内容模式 ---
-        # 1. 解析PDF到Markdown
-        md_file_path = parse_pdf_to_files(args.input, args.output)
-
-        if md_file_path and os.path.exists(md_file_path):
-            logger.info(f"PDF解析完成，生成的Markdown文件: {md_file_path}")
-            
-            # 2. 将Markdown转换为Word
-            docx_file_name = f"{file_base_name}_content.docx"
-            docx_file_path = os.path.join(args.output, docx_file_name)
-            
-            logger.info(f"正在将Markdown转换为Word: {docx_file_path}")
-            try:
-                convert_markdown_to_word_with_pandoc(md_file_path, docx_file_path)
-                logger.info(f"内容模式转换成功! 输出文件: {docx_file_path}")
-            except Exception as e:
-                logger.error(f"从Markdown转换为Word失败: {e}")
-        else:
-            logger.error("PDF解析失败，未生成Markdown文件。")
-
-    elif args.mode == 'format':
-        # --- 格式模式 ---
-        docx_file_name = f"{file_base_name}_format.docx"
-        docx_file_path = os.path.join(args.output, docx_file_name)
+    if args.server:
+        if server_available(args.server):
+            logger.info(f"提交任务到模型服务: {args.server}")
+            submit_job(args.input, args.output, args.mode, args.page_window, args.resume, args.incremental,
+                       server_url=args.server)
+            return
+        logger.warning(f"模型服务不可用: {args.server}，将在本地执行转换")
 
-        logger.info(f"正在转换PDF为Word（格式模式）: {docx_file_path}")
-        try:
-            process_and_convert_pdf(args.input, docx_file_path)
-            logger.info(f"格式模式转换成功! 输出文件: {docx_file_path}")
-        except Exception as e:
-            logger.error(f"PDF到Word转换失败: {e}", exc_info=True)
+    # 本地执行时才导入模型相关模块，提交到服务的CLI进程只需要标准库
+    from utils.job_runner import run_conversion
+    run_conversion(args.input, args.output, args.mode, args.page_window, args.resume, args.incremental)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
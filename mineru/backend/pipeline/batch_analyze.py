@@ -1,3 +1,7 @@
+import os
+import time
+from functools import partial
+
 import cv2
 from loguru import logger
 from tqdm import tqdm
@@ -5,54 +9,132 @@ from collections import defaultdict
 import numpy as np
 
 from .model_init import AtomModelSingleton
+from ...model.table.rapid_table import is_complete_table_html
+from .ocr_rec_queue import OcrRecQueue, apply_layout_ocr_result
+from .staged_executor import StagedExecutor
 from ...utils.config_reader import get_formula_enable, get_table_enable
 from ...utils.model_utils import crop_img, get_res_list_from_layout_res
-from ...utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, OcrConfidence
+from ...utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, \
+    pack_ocr_det_canvases, build_padded_batch
+from ...utils.yolo_utils import PageTensorCache
 
 YOLO_LAYOUT_BASE_BATCH_SIZE = 1
 MFD_BASE_BATCH_SIZE = 1
 MFR_BASE_BATCH_SIZE = 16
+# 分阶段流水线中每个chunk的页数，设置为0时关闭流水线，整批逐阶段顺序执行
+STAGE_CHUNK_PAGES = int(os.getenv('MINERU_STAGE_CHUNK_PAGES', '16'))
+# 相邻阶段之间的有界队列长度
+STAGE_QUEUE_SIZE = int(os.getenv('MINERU_STAGE_QUEUE_SIZE', '2'))
+# 同时拷贝到设备上的页面张量最多包含的页数，与chunk大小无关(MINERU_STAGE_CHUNK_PAGES=0时整批也按该页数分组上传)
+PAGE_TENSOR_CACHE_PAGES = max(1, int(os.getenv('MINERU_PAGE_TENSOR_CACHE_PAGES', '16')))
+# OCR检测装箱时单张裁剪图在画布中允许的最大padding面积占比
+OCR_DET_MAX_PAD_RATIO = float(os.getenv('MINERU_OCR_DET_MAX_PAD_RATIO', '0.3'))
+
+
+def get_detector_batch_sizes(batch_ratio: int):
+    """
+    layout与MFD检测的batch size随显存档位(batch_ratio)线性增长，
+    可通过环境变量MINERU_LAYOUT_BATCH_SIZE、MINERU_MFD_BATCH_SIZE直接指定
+    """
+    layout_batch_size = int(os.getenv('MINERU_LAYOUT_BATCH_SIZE', batch_ratio * YOLO_LAYOUT_BASE_BATCH_SIZE))
+    mfd_batch_size = int(os.getenv('MINERU_MFD_BATCH_SIZE', batch_ratio * MFD_BASE_BATCH_SIZE))
+    return max(1, layout_batch_size), max(1, mfd_batch_size)
 
 
 class BatchAnalyze:
-    def __init__(self, model_manager, batch_ratio: int, formula_enable, table_enable, enable_ocr_det_batch: bool = True):
+    def __init__(self, model_manager, batch_ratio: int, formula_enable, table_enable, enable_ocr_det_batch: bool = True,
+                 ocr_rec_queue=None):
         self.batch_ratio = batch_ratio
+        self.layout_batch_size, self.mfd_batch_size = get_detector_batch_sizes(batch_ratio)
         self.formula_enable = get_formula_enable(formula_enable)
         self.table_enable = get_table_enable(table_enable)
         self.model_manager = model_manager
         self.enable_ocr_det_batch = enable_ocr_det_batch
+        # 文档级OCR识别队列，传入时文本行识别延迟到调用方flush
+        self.ocr_rec_queue = ocr_rec_queue
 
     def __call__(self, images_with_extra_info: list) -> list:
         if len(images_with_extra_info) == 0:
             return []
 
-        images_layout_res = []
-
         self.model = self.model_manager.get_model(
             lang=None,
             formula_enable=self.formula_enable,
             table_enable=self.table_enable,
         )
-        atom_model_manager = AtomModelSingleton()
+        self.atom_model_manager = AtomModelSingleton()
+        self._rec_queue = self.ocr_rec_queue if self.ocr_rec_queue is not None else OcrRecQueue()
+
+        """
+        按页切分为多个chunk依次流过各阶段：
+        layout/公式检测识别 -> 裁剪 -> OCR检测 -> 表格识别 -> 登记OCR识别队列，
+        相邻阶段通过有界队列连接，某个chunk做CPU裁剪/后处理时，其他chunk的模型推理可以同时进行
+        """
+        stages = [
+            ('layout_formula', self._layout_formula_stage),
+            ('crop', self._crop_stage),
+            ('ocr_det', self._ocr_det_stage),
+            ('table', self._table_stage),
+            ('ocr_rec', self._ocr_rec_stage),
+        ]
+        chunk_pages = STAGE_CHUNK_PAGES if STAGE_CHUNK_PAGES > 0 else len(images_with_extra_info)
+        chunks = [
+            {'images_with_extra_info': images_with_extra_info[i:i + chunk_pages]}
+            for i in range(0, len(images_with_extra_info), chunk_pages)
+        ]
+
+        executor = StagedExecutor(stages, queue_size=STAGE_QUEUE_SIZE)
+        start_time = time.perf_counter()
+        if len(chunks) == 1:
+            # 只有一个chunk时没有可重叠的阶段，直接在当前线程顺序执行
+            ctx = chunks[0]
+            for timing, (_, stage_func) in zip(executor.timings, stages):
+                stage_start = time.perf_counter()
+                ctx = stage_func(ctx)
+                timing.busy += time.perf_counter() - stage_start
+                timing.items += 1
+            chunks = [ctx]
+        else:
+            chunks = executor.run(chunks)
+        executor.log_timings(time.perf_counter() - start_time)
 
-        images = [image for image, _, _ in images_with_extra_info]
+        if self.ocr_rec_queue is None:
+            # 未传入文档级队列时，在本批结束时统一识别
+            rec_start = time.perf_counter()
+            self._rec_queue.flush()
+            logger.info(f"OCR-rec finished in {time.perf_counter() - rec_start:.2f}s")
 
-        # doclayout_yolo
-        layout_images = []
-        for image_index, image in enumerate(images):
-            layout_images.append(image)
+        images_layout_res = []
+        for ctx in chunks:
+            images_layout_res += ctx['images_layout_res']
+        return images_layout_res
 
+    def _layout_formula_stage(self, ctx):
+        images_layout_res = []
+        images = [image for image, _, _ in ctx['images_with_extra_info']]
+
+        # 页面只转换、拷贝到设备上一次，layout与公式检测共用；
+        # 设备上同时只保留一组页面，组大小不小于检测的batch size，避免拆小batch
+        cache_pages = max(PAGE_TENSOR_CACHE_PAGES, self.layout_batch_size, self.mfd_batch_size)
+        images_mfd_res = []
+        for group_start in range(0, len(images), cache_pages):
+            group_images = images[group_start: group_start + cache_pages]
+            page_tensors = PageTensorCache(group_images, self.model.device)
+
+            # doclayout_yolo
+            images_layout_res += self.model.layout_model.batch_predict(
+                group_images, self.layout_batch_size, page_tensors=page_tensors
+            )
 
-        images_layout_res += self.model.layout_model.batch_predict(
-            layout_images, YOLO_LAYOUT_BASE_BATCH_SIZE
-        )
+            if self.formula_enable:
+                # 公式检测
+                images_mfd_res += self.model.mfd_model.batch_predict(
+                    group_images, self.mfd_batch_size, page_tensors=page_tensors
+                )
+            # 检测完成后释放设备上的页面张量，给下一组页面和公式识别腾出显存
+            del page_tensors
 
         if self.formula_enable:
-            # 公式检测
-            images_mfd_res = self.model.mfd_model.batch_predict(
-                images, MFD_BASE_BATCH_SIZE
-            )
-
             # 公式识别
             images_formula_list = self.model.mfr_model.batch_predict(
                 images_mfd_res,
@@ -67,6 +149,15 @@ class BatchAnalyze:
         # 清理显存
         # clean_vram(self.model.device, vram_threshold=8)
 
+        ctx['images'] = images
+        ctx['images_layout_res'] = images_layout_res
+        return ctx
+
+    def _crop_stage(self, ctx):
+        images_with_extra_info = ctx['images_with_extra_info']
+        images = ctx['images']
+        images_layout_res = ctx['images_layout_res']
+
         ocr_res_list_all_page = []
         table_res_list_all_page = []
         for index in range(len(images)):
@@ -93,12 +184,9 @@ class BatchAnalyze:
                                                 'table_img':table_img,
                                               })
 
-        # OCR检测处理
+        # 批处理模式下提前完成OCR检测所需的裁剪和BGR转换
+        all_cropped_images_info = []
         if self.enable_ocr_det_batch:
-            # 批处理模式 - 按语言和分辨率分组
-            # 收集所有需要OCR检测的裁剪图像
-            all_cropped_images_info = []
-
             for ocr_res_list_dict in ocr_res_list_all_page:
                 _lang = ocr_res_list_dict['lang']
 
@@ -117,7 +205,19 @@ class BatchAnalyze:
                         new_image, useful_list, ocr_res_list_dict, res, adjusted_mfdetrec_res, _lang
                     ))
 
-            # 按语言分组
+        ctx['ocr_res_list_all_page'] = ocr_res_list_all_page
+        ctx['table_res_list_all_page'] = table_res_list_all_page
+        ctx['all_cropped_images_info'] = all_cropped_images_info
+        return ctx
+
+    def _ocr_det_stage(self, ctx):
+        atom_model_manager = self.atom_model_manager
+        ocr_res_list_all_page = ctx['ocr_res_list_all_page']
+        all_cropped_images_info = ctx.pop('all_cropped_images_info')
+
+        # OCR检测处理
+        if self.enable_ocr_det_batch:
+            # 批处理模式 - 按语言和分辨率分组
             lang_groups = defaultdict(list)
             for crop_info in all_cropped_images_info:
                 lang = crop_info[5]
@@ -137,41 +237,30 @@ class BatchAnalyze:
                     lang=lang
                 )
 
-                # 按分辨率分组并同时完成padding
-                resolution_groups = defaultdict(list)
-                for crop_info in lang_crop_list:
-                    cropped_img = crop_info[0]
-                    h, w = cropped_img.shape[:2]
-                    # 使用更大的分组容差，减少分组数量
-                    # 将尺寸标准化到32的倍数
-                    normalized_h = ((h + 32) // 32) * 32  # 向上取整到32的倍数
-                    normalized_w = ((w + 32) // 32) * 32
-                    group_key = (normalized_h, normalized_w)
-                    resolution_groups[group_key].append(crop_info)
-
-                # 对每个分辨率组进行批处理
-                for group_key, group_crops in tqdm(resolution_groups.items(), desc=f"OCR-det {lang}"):
-
-                    # 计算目标尺寸（组内最大尺寸，向上取整到32的倍数）
-                    max_h = max(crop_info[0].shape[0] for crop_info in group_crops)
-                    max_w = max(crop_info[0].shape[1] for crop_info in group_crops)
-                    target_h = ((max_h + 32 - 1) // 32) * 32
-                    target_w = ((max_w + 32 - 1) // 32) * 32
-
-                    # 对所有图像进行padding到统一尺寸
-                    batch_images = []
-                    for crop_info in group_crops:
-                        img = crop_info[0]
-                        h, w = img.shape[:2]
-                        # 创建目标尺寸的白色背景
-                        padded_img = np.ones((target_h, target_w, 3), dtype=np.uint8) * 255
-                        # 将原图像粘贴到左上角
-                        padded_img[:h, :w] = img
-                        batch_images.append(padded_img)
+                # 按尺寸装箱到少量画布中，长边不超过检测模型缩放上限的画布才合并不同尺寸的图像
+                det_args = ocr_model.text_detector.args
+                max_canvas_side = det_args.det_limit_side_len if det_args.det_limit_type == 'max' else None
+                canvases = pack_ocr_det_canvases(
+                    [crop_info[0].shape[:2] for crop_info in lang_crop_list],
+                    max_pad_ratio=OCR_DET_MAX_PAD_RATIO,
+                    max_canvas_side=max_canvas_side,
+                )
+                content_area = sum(crop_info[0].shape[0] * crop_info[0].shape[1] for crop_info in lang_crop_list)
+                canvas_area = sum(h * w * len(indices) for (h, w), indices in canvases)
+                logger.debug(
+                    f"OCR-det {lang}: {len(lang_crop_list)} crops packed into {len(canvases)} canvas shapes, "
+                    f"padding efficiency: {content_area / max(canvas_area, 1):.2%}"
+                )
+
+                # 对每个画布组进行批处理
+                for canvas_shape, crop_indices in tqdm(canvases, desc=f"OCR-det {lang}"):
+                    group_crops = [lang_crop_list[i] for i in crop_indices]
+
+                    # 一次性分配uint8 batch缓冲区，原图像粘贴到白色画布左上角
+                    batch_images = build_padded_batch([crop_info[0] for crop_info in group_crops], canvas_shape)
 
                     # 批处理检测
                     batch_size = min(len(batch_images), self.batch_ratio * 16)  # 增加批处理大小
-                    # logger.debug(f"OCR-det batch: {batch_size} images, target size: {target_h}x{target_w}")
                     batch_results = ocr_model.text_detector.batch_predict(batch_images, batch_size)
 
                     # 处理批处理结果
@@ -244,19 +333,35 @@ class BatchAnalyze:
 
                         ocr_res_list_dict['layout_res'].extend(ocr_result_list)
 
+        return ctx
+
+    def _table_stage(self, ctx):
+        atom_model_manager = self.atom_model_manager
+        table_res_list_all_page = ctx.pop('table_res_list_all_page')
+
         # 表格识别 table recognition
         if self.table_enable:
-            for table_res_dict in tqdm(table_res_list_all_page, desc="Table Predict"):
-                _lang = table_res_dict['lang']
+            # 按语言分组后并发请求，结果按原顺序回填
+            table_lang_groups = defaultdict(list)
+            for table_res_dict in table_res_list_all_page:
+                table_lang_groups[table_res_dict['lang']].append(table_res_dict)
+
+            table_predict_results = []
+            for _lang, table_res_group in table_lang_groups.items():
                 table_model = atom_model_manager.get_atom_model(
                     atom_model_name='table',
                     lang=_lang,
                 )
-                html_code, table_cell_bboxes, logic_points, elapse = table_model.predict(table_res_dict['table_img'])
+                logger.info(f'Table Predict: {len(table_res_group)} tables, concurrency: {table_model.concurrency}')
+                group_results = table_model.batch_predict(
+                    [table_res_dict['table_img'] for table_res_dict in table_res_group]
+                )
+                table_predict_results.extend(zip(table_res_group, group_results))
+
+            for table_res_dict, (html_code, table_cell_bboxes, logic_points, elapse) in table_predict_results:
                 # 判断是否返回正常
                 if html_code:
-                    expected_ending = html_code.strip().endswith('</html>') or html_code.strip().endswith('</table>')
-                    if expected_ending:
+                    if is_complete_table_html(html_code):
                         table_res_dict['table_res']['html'] = html_code
                     else:
                         logger.warning(
@@ -267,58 +372,54 @@ class BatchAnalyze:
                         'table recognition processing fails, not get html return'
                     )
 
-        # Create dictionaries to store items by language
-        need_ocr_lists_by_lang = {}  # Dict of lists for each language
-        img_crop_lists_by_lang = {}  # Dict of lists for each language
+        return ctx
+
+    def _ocr_rec_stage(self, ctx):
+        images_layout_res = ctx['images_layout_res']
+        ctx.pop('ocr_res_list_all_page', None)
 
+        # 需要识别的文本行登记到OCR识别队列，由队列统一按语言批量识别后回写
         for layout_res in images_layout_res:
             for layout_res_item in layout_res:
                 if layout_res_item['category_id'] in [15]:
                     if 'np_img' in layout_res_item and 'lang' in layout_res_item:
-                        lang = layout_res_item['lang']
-
-                        # Initialize lists for this language if not exist
-                        if lang not in need_ocr_lists_by_lang:
-                            need_ocr_lists_by_lang[lang] = []
-                            img_crop_lists_by_lang[lang] = []
-
-                        # Add to the appropriate language-specific lists
-                        need_ocr_lists_by_lang[lang].append(layout_res_item)
-                        img_crop_lists_by_lang[lang].append(layout_res_item['np_img'])
-
-                        # Remove the fields after adding to lists
-                        layout_res_item.pop('np_img')
-                        layout_res_item.pop('lang')
-
-        if len(img_crop_lists_by_lang) > 0:
-
-            # Process OCR by language
-            total_processed = 0
-
-            # Process each language separately
-            for lang, img_crop_list in img_crop_lists_by_lang.items():
-                if len(img_crop_list) > 0:
-                    # Get OCR results for this language's images
-
-                    ocr_model = atom_model_manager.get_atom_model(
-                        atom_model_name='ocr',
-                        det_db_box_thresh=0.3,
-                        lang=lang
-                    )
-                    ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
-
-                    # Verify we have matching counts
-                    assert len(ocr_res_list) == len(
-                        need_ocr_lists_by_lang[lang]), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(need_ocr_lists_by_lang[lang])} for lang: {lang}'
-
-                    # Process OCR results for this language
-                    for index, layout_res_item in enumerate(need_ocr_lists_by_lang[lang]):
-                        ocr_text, ocr_score = ocr_res_list[index]
-                        layout_res_item['text'] = ocr_text
-                        layout_res_item['score'] = float(f"{ocr_score:.3f}")
-                        if ocr_score < OcrConfidence.min_confidence:
-                            layout_res_item['category_id'] = 16
-
-                    total_processed += len(img_crop_list)
+                        self._rec_queue.add(
+                            layout_res_item.pop('np_img'),
+                            layout_res_item.pop('lang'),
+                            partial(apply_layout_ocr_result, layout_res_item),
+                        )
 
-        return images_layout_res
+        return ctx
+
+if __name__ == '__main__':
+    """
+    layout与MFD检测吞吐benchmark：
+    python -m mineru.backend.pipeline.batch_analyze demo.pdf [batch_ratio]
+    分别以batch size 1和显存自适应的batch size运行检测模型，输出pages/s
+    """
+    import sys
+
+    from .pipeline_analyze import ModelSingleton
+    from ...utils.pdf_image_tools import load_images_from_pdf
+
+    pdf_path = sys.argv[1]
+    bench_batch_ratio = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    with open(pdf_path, 'rb') as f:
+        images_list, _ = load_images_from_pdf(f.read())
+    bench_images = [image_dict['img_pil'] for image_dict in images_list]
+    bench_model = ModelSingleton().get_model(lang=None, formula_enable=True, table_enable=False)
+
+    layout_bs, mfd_bs = get_detector_batch_sizes(bench_batch_ratio)
+    bench_cases = [
+        ('layout', bench_model.layout_model, [1, layout_bs]),
+        ('mfd', bench_model.mfd_model, [1, mfd_bs]),
+    ]
+    # 预热，排除模型首次加载与cudnn选择算法的耗时
+    for _, detector, _ in bench_cases:
+        detector.batch_predict(bench_images[:1], 1)
+    for name, detector, batch_sizes in bench_cases:
+        for bench_batch_size in sorted(set(batch_sizes)):
+            start = time.perf_counter()
+            detector.batch_predict(bench_images, bench_batch_size)
+            cost = time.perf_counter() - start
+            logger.info(f'{name} batch_size={bench_batch_size}: {len(bench_images) / cost:.2f} pages/s')
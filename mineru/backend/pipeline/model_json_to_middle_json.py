@@ -1,32 +1,33 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import time
+from functools import partial
 
 from loguru import logger
 from tqdm import tqdm
 
 from mineru.utils.config_reader import get_device, get_llm_aided_config, get_formula_enable
-from mineru.backend.pipeline.model_init import AtomModelSingleton
+from mineru.backend.pipeline.ocr_rec_queue import OcrRecQueue, apply_span_ocr_result
 from mineru.backend.pipeline.para_split import para_split
+from mineru.utils.bbox_index import PageGeometryIndex
 from mineru.utils.block_pre_proc import prepare_block_bboxes, process_groups
-from mineru.utils.block_sort import sort_blocks_by_bbox
+from mineru.utils.block_sort import sort_blocks_by_bbox, prepare_reading_order, predict_reading_orders, \
+    finish_reading_order
 from mineru.utils.boxbase import calculate_overlap_area_in_bbox1_area_ratio
 from mineru.utils.cut_image import cut_image_and_table
 from mineru.utils.enum_class import ContentType
 from mineru.utils.llm_aided import llm_aided_title
 from mineru.utils.model_utils import clean_memory
 from mineru.backend.pipeline.pipeline_magic_model import MagicModel
-from mineru.utils.ocr_utils import OcrConfidence
 from mineru.utils.span_block_fix import fill_spans_in_blocks, fix_discarded_block, fix_block_spans
 from mineru.utils.span_pre_proc import remove_outside_spans, remove_overlaps_low_confidence_spans, \
     remove_overlaps_min_spans, txt_spans_extract
 from mineru.version import __version__
-from mineru.utils.hash_utils import str_md5
 
 
-def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer, page_index, ocr_enable=False, formula_enabled=True):
+def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer, page_index, ocr_enable=False, formula_enabled=True, reading_order_jobs=None):
     scale = image_dict["scale"]
     page_pil_img = image_dict["img_pil"]
-    page_img_md5 = str_md5(image_dict["img_base64"])
+    page_img_md5 = image_dict["img_md5"]
     page_w, page_h = map(int, page.get_size())
     magic_model = MagicModel(page_model_info, scale)
 
@@ -51,11 +52,26 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
     """获取所有的spans信息"""
     spans = magic_model.get_all_spans()
 
+    """将所有区块的bbox整理到一起"""
+    if formula_enabled:
+        interline_equation_blocks = []
+
+    if len(interline_equation_blocks) > 0:
+        for block in interline_equation_blocks:
+            spans.append({
+                "type": ContentType.INTERLINE_EQUATION,
+                'score': block['score'],
+                "bbox": block['bbox'],
+            })
+
+    """构建页面级几何索引，后续span与block的匹配都通过它查询"""
+    geometry_index = PageGeometryIndex(spans)
+
     """某些图可能是文本块，通过简单的规则判断一下"""
     if len(maybe_text_image_blocks) > 0:
         for block in maybe_text_image_blocks:
             span_in_block_list = []
-            for span in spans:
+            for span in geometry_index.query_spans(block['bbox']):
                 if span['type'] == 'text' and calculate_overlap_area_in_bbox1_area_ratio(span['bbox'], block['bbox']) > 0.7:
                     span_in_block_list.append(span)
             if len(span_in_block_list) > 0:
@@ -77,19 +93,7 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
                 img_body_blocks.append(block)
 
 
-    """将所有区块的bbox整理到一起"""
-    if formula_enabled:
-        interline_equation_blocks = []
-
     if len(interline_equation_blocks) > 0:
-
-        for block in interline_equation_blocks:
-            spans.append({
-                "type": ContentType.INTERLINE_EQUATION,
-                'score': block['score'],
-                "bbox": block['bbox'],
-            })
-
         all_bboxes, all_discarded_blocks, footnote_blocks = prepare_block_bboxes(
             img_body_blocks, img_caption_blocks, img_footnote_blocks,
             table_body_blocks, table_caption_blocks, table_footnote_blocks,
@@ -114,7 +118,8 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
 
     """在删除重复span之前，应该通过image_body和table_body的block过滤一下image和table的span"""
     """顺便删除大水印并保留abandon的span"""
-    spans = remove_outside_spans(spans, all_bboxes, all_discarded_blocks)
+    geometry_index.set_blocks(all_bboxes, all_discarded_blocks)
+    spans = remove_outside_spans(spans, all_bboxes, all_discarded_blocks, geometry_index)
 
     """删除重叠spans中置信度较低的那些"""
     spans, dropped_spans_by_confidence = remove_overlaps_low_confidence_spans(spans)
@@ -126,11 +131,11 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
         pass
     else:
         """使用新版本的混合ocr方案."""
-        spans = txt_spans_extract(page, spans, page_pil_img, scale, all_bboxes, all_discarded_blocks)
+        spans = txt_spans_extract(page, spans, page_pil_img, scale, all_bboxes, all_discarded_blocks, geometry_index)
 
     """先处理不需要排版的discarded_blocks"""
     discarded_block_with_spans, spans = fill_spans_in_blocks(
-        all_discarded_blocks, spans, 0.4
+        all_discarded_blocks, spans, 0.4, geometry_index
     )
     fix_discarded_blocks = fix_discarded_block(discarded_block_with_spans)
 
@@ -146,7 +151,7 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
             )
 
     """span填充进block"""
-    block_with_spans, spans = fill_spans_in_blocks(all_bboxes, spans, 0.5)
+    block_with_spans, spans = fill_spans_in_blocks(all_bboxes, spans, 0.5, geometry_index)
 
     """对block进行fix操作"""
     fix_blocks = fix_block_spans(block_with_spans)
@@ -155,6 +160,11 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
     # merge_title_blocks(fix_blocks)
 
     """对block进行排序"""
+    if reading_order_jobs is not None:
+        """延迟排序：收集阅读顺序预测任务，由调用方跨页面批量推理后回填preproc_blocks"""
+        page_info = make_page_info_dict([], page_index, page_w, page_h, fix_discarded_blocks)
+        reading_order_jobs.append((prepare_reading_order(fix_blocks, page_w, page_h, footnote_blocks), page_info))
+        return page_info
     sorted_blocks = sort_blocks_by_bbox(fix_blocks, page_w, page_h, footnote_blocks)
 
     """构造page_info"""
@@ -164,24 +174,54 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
 
 
 def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=None, ocr_enable=False, formula_enabled=True):
-    middle_json = {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
+    middle_json = init_middle_json()
+    append_pages_to_middle_json(
+        middle_json, model_list, images_list, pdf_doc, image_writer,
+        lang=lang, ocr_enable=ocr_enable, formula_enabled=formula_enabled,
+    )
+    finalize_middle_json(middle_json)
+
+    """清理内存"""
+    pdf_doc.close()
+    clean_memory(get_device())
+
+    return middle_json
+
+
+def init_middle_json():
+    return {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
+
+
+def append_pages_to_middle_json(middle_json, model_list, images_list, pdf_doc, image_writer, page_start=0, lang=None, ocr_enable=False, formula_enabled=True, page_indices=None):
+    """
+    将一段连续页面(从page_start开始)的模型结果转换为page_info并追加到middle_json中，
+    供整本文档一次性处理和按页面窗口流式处理共用。
+    传入page_indices时各页的页码取自page_indices，用于增量转换中不连续的页面。
+    """
     formula_enabled = get_formula_enable(formula_enabled)
-    for page_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
+    window_page_infos = []
+    reading_order_jobs = []
+    for window_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
+        page_index = page_indices[window_index] if page_indices is not None else page_start + window_index
         page = pdf_doc[page_index]
-        image_dict = images_list[page_index]
+        image_dict = images_list[window_index]
         page_info = page_model_info_to_page_info(
-            page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable, formula_enabled=formula_enabled
+            page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable,
+            formula_enabled=formula_enabled, reading_order_jobs=reading_order_jobs,
         )
         if page_info is None:
             page_w, page_h = map(int, page.get_size())
             page_info = make_page_info_dict([], page_index, page_w, page_h, [])
-        middle_json["pdf_info"].append(page_info)
+        window_page_infos.append(page_info)
+
+    """跨页面批量预测阅读顺序"""
+    orders_list = predict_reading_orders([job['boxes'] for job, _ in reading_order_jobs])
+    for (job, page_info), orders in zip(reading_order_jobs, orders_list):
+        page_info['preproc_blocks'] = finish_reading_order(job, orders)
 
     """后置ocr处理"""
-    need_ocr_list = []
-    img_crop_list = []
     text_block_list = []
-    for page_info in middle_json["pdf_info"]:
+    for page_info in window_page_infos:
         for block in page_info['preproc_blocks']:
             if block['type'] in ['table', 'image']:
                 for sub_block in block['blocks']:
@@ -191,32 +231,19 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 text_block_list.append(block)
         for block in page_info['discarded_blocks']:
             text_block_list.append(block)
+    ocr_rec_queue = OcrRecQueue()
     for block in text_block_list:
         for line in block['lines']:
             for span in line['spans']:
                 if 'np_img' in span:
-                    need_ocr_list.append(span)
-                    img_crop_list.append(span['np_img'])
-                    span.pop('np_img')
-    if len(img_crop_list) > 0:
-        atom_model_manager = AtomModelSingleton()
-        ocr_model = atom_model_manager.get_atom_model(
-            atom_model_name='ocr',
-            ocr_show_log=False,
-            det_db_box_thresh=0.3,
-            lang=lang
-        )
-        ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
-        assert len(ocr_res_list) == len(
-            need_ocr_list), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(need_ocr_list)}'
-        for index, span in enumerate(need_ocr_list):
-            ocr_text, ocr_score = ocr_res_list[index]
-            if ocr_score > OcrConfidence.min_confidence:
-                span['content'] = ocr_text
-                span['score'] = float(f"{ocr_score:.3f}")
-            else:
-                span['content'] = ''
-                span['score'] = 0.0
+                    ocr_rec_queue.add(span.pop('np_img'), lang, partial(apply_span_ocr_result, span))
+    ocr_rec_queue.flush()
+
+    middle_json["pdf_info"].extend(window_page_infos)
+
+
+def finalize_middle_json(middle_json):
+    """全部页面追加完成后执行跨页处理：分段与llm优化"""
 
     """分段"""
     para_split(middle_json["pdf_info"])
@@ -233,10 +260,6 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 llm_aided_title(middle_json["pdf_info"], title_aided_config)
                 logger.info(f'llm aided title time: {round(time.time() - llm_aided_title_start_time, 2)}')
 
-    """清理内存"""
-    pdf_doc.close()
-    clean_memory(get_device())
-
     return middle_json
 
 
@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import defaultdict
+
+from loguru import logger
+
+from .model_init import AtomModelSingleton
+from ...utils.ocr_utils import OcrConfidence
+
+"""
+队列中累积的裁剪图数量达到该值时提前执行一次识别，限制整篇文档裁剪图常驻内存的峰值，
+可通过环境变量MINERU_OCR_REC_QUEUE_MAX_SIZE设置，默认值为8192。
+"""
+OCR_REC_QUEUE_MAX_SIZE = int(os.getenv('MINERU_OCR_REC_QUEUE_MAX_SIZE', '8192'))
+
+
+class OcrRecQueue:
+    """文档级OCR文本识别队列。
+
+    各处需要识别的文本行裁剪图(版面分析中的ocr文本、txt模式下需要ocr补全的span)先登记到队列中，
+    flush时按语言分组，每种语言只调用一次TextRecognizer(内部按宽度排序组batch)，再通过回调把结果写回。
+    这样即使每页只有少量文本行，也能凑满识别batch。
+    """
+
+    def __init__(self, max_size=OCR_REC_QUEUE_MAX_SIZE):
+        self.max_size = max_size
+        self._pending = defaultdict(list)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, img, lang, callback):
+        """登记一张裁剪图，识别完成后以callback(text, score)回写结果"""
+        with self._lock:
+            self._pending[lang].append((img, callback))
+            self._size += 1
+            need_flush = self.max_size > 0 and self._size >= self.max_size
+        if need_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._size = 0
+        if not pending:
+            return
+        atom_model_manager = AtomModelSingleton()
+        for lang, items in pending.items():
+            ocr_model = atom_model_manager.get_atom_model(
+                atom_model_name='ocr',
+                det_db_box_thresh=0.3,
+                lang=lang
+            )
+            logger.debug(f'OCR-rec queue: {len(items)} text lines, lang: {lang}')
+            ocr_res_list = ocr_model.ocr([img for img, _ in items], det=False, tqdm_enable=True)[0]
+            assert len(ocr_res_list) == len(items), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(items)} for lang: {lang}'
+            for (_, callback), (ocr_text, ocr_score) in zip(items, ocr_res_list):
+                callback(ocr_text, ocr_score)
+
+
+def apply_layout_ocr_result(layout_res_item, ocr_text, ocr_score):
+    """版面分析中ocr文本框的识别结果，置信度过低的转为category 16"""
+    layout_res_item['text'] = ocr_text
+    layout_res_item['score'] = float(f"{ocr_score:.3f}")
+    if ocr_score < OcrConfidence.min_confidence:
+        layout_res_item['category_id'] = 16
+
+
+def apply_span_ocr_result(span, ocr_text, ocr_score):
+    """txt模式下需要ocr补全的span的识别结果，置信度过低时清空内容"""
+    if ocr_score > OcrConfidence.min_confidence:
+        span['content'] = ocr_text
+        span['score'] = float(f"{ocr_score:.3f}")
+    else:
+        span['content'] = ''
+        span['score'] = 0.0
@@ -2,12 +2,14 @@ import os
 import time
 from typing import List, Tuple
 import PIL.Image
+import pypdfium2 as pdfium
 from loguru import logger
 
 from .model_init import MineruPipelineModel
+from .ocr_rec_queue import OcrRecQueue
 from mineru.utils.config_reader import get_device
 from ...utils.pdf_classify import classify
-from ...utils.pdf_image_tools import load_images_from_pdf
+from ...utils.pdf_image_tools import load_images_from_pdf, load_images_from_pdf_doc
 from ...utils.model_utils import get_vram, clean_memory
 
 
@@ -87,12 +89,7 @@ def doc_analyze(
     ocr_enabled_list = []
     for pdf_idx, pdf_bytes in enumerate(pdf_bytes_list):
         # 确定OCR设置
-        _ocr_enable = False
-        if parse_method == 'auto':
-            if classify(pdf_bytes) == 'ocr':
-                _ocr_enable = True
-        elif parse_method == 'ocr':
-            _ocr_enable = True
+        _ocr_enable = get_ocr_enable(pdf_bytes, parse_method)
 
         ocr_enabled_list.append(_ocr_enable)
         _lang = lang_list[pdf_idx]
@@ -116,8 +113,9 @@ def doc_analyze(
         for i in range(0, len(images_with_extra_info), batch_size)
     ]
 
-    # 执行批处理
+    # 执行批处理，所有批次的文本行识别合并到文档级队列中统一执行
     results = []
+    ocr_rec_queue = OcrRecQueue()
     processed_images_count = 0
     for index, batch_image in enumerate(batch_images):
         processed_images_count += len(batch_image)
@@ -125,8 +123,9 @@ def doc_analyze(
             f'Batch {index + 1}/{len(batch_images)}: '
             f'{processed_images_count} pages/{len(images_with_extra_info)} pages'
         )
-        batch_results = batch_image_analyze(batch_image, formula_enable, table_enable)
+        batch_results = batch_image_analyze(batch_image, formula_enable, table_enable, ocr_rec_queue)
         results.extend(batch_results)
+    ocr_rec_queue.flush()
 
     # 构建返回结果
     infer_results = []
@@ -146,10 +145,118 @@ def doc_analyze(
     return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
 
 
+def doc_analyze_streaming(
+        pdf_bytes,
+        lang,
+        parse_method: str = 'auto',
+        formula_enable=True,
+        table_enable=True,
+        page_window_size=None,
+        model_loader=None,
+        skip_render=None,
+):
+    """
+    按页面窗口流式分析单个PDF，每次只渲染并推理page_window_size页，
+    页面图像占用的内存随窗口大小而不是文档页数增长；模型结果由调用方累积。
+    窗口大小可通过环境变量MINERU_PAGE_WINDOW_SIZE设置，默认值为64。
+
+    每个窗口yield (page_start, model_list, images_list, pdf_doc, ocr_enable)，
+    images_list在下一个窗口开始渲染前即可释放，pdf_doc由调用方在全部窗口处理完后关闭。
+
+    model_loader(page_start, page_end)返回该窗口已有的model_list(如断点续跑的checkpoint)时跳过推理；
+    此时若skip_render(page_start, page_end)也返回True，则连页面渲染也跳过，yield的images_list为None。
+    """
+    if page_window_size is None:
+        page_window_size = int(os.environ.get('MINERU_PAGE_WINDOW_SIZE', 64))
+    page_window_size = max(1, page_window_size)
+
+    _ocr_enable = get_ocr_enable(pdf_bytes, parse_method)
+
+    pdf_doc = pdfium.PdfDocument(pdf_bytes)
+    pdf_page_num = len(pdf_doc)
+
+    for page_start in range(0, pdf_page_num, page_window_size):
+        page_end = min(page_start + page_window_size, pdf_page_num) - 1
+        logger.info(f'Page window: {page_start + 1}-{page_end + 1}/{pdf_page_num} pages')
+
+        model_list = model_loader(page_start, page_end) if model_loader is not None else None
+        if model_list is not None and skip_render is not None and skip_render(page_start, page_end):
+            logger.info(f'Page window {page_start + 1}-{page_end + 1} already processed, skipped')
+            yield page_start, model_list, None, pdf_doc, _ocr_enable
+            continue
+
+        images_list = load_images_from_pdf_doc(
+            pdf_doc, start_page_id=page_start, end_page_id=page_end, pdf_bytes=pdf_bytes
+        )
+        if model_list is not None:
+            logger.info(f'Page window {page_start + 1}-{page_end + 1} model results loaded, inference skipped')
+            yield page_start, model_list, images_list, pdf_doc, _ocr_enable
+            continue
+
+        model_list = _analyze_window(
+            images_list, list(range(page_start, page_end + 1)), _ocr_enable, lang, formula_enable, table_enable
+        )
+        yield page_start, model_list, images_list, pdf_doc, _ocr_enable
+
+
+def doc_analyze_pages(
+        pdf_bytes,
+        lang,
+        page_indices,
+        ocr_enable,
+        formula_enable=True,
+        table_enable=True,
+        page_window_size=None,
+):
+    """
+    只渲染并推理page_indices中的页面(可以不连续)，按page_window_size页一个窗口流式处理，
+    用于增量转换时只处理内容有变化的页面。
+    每个窗口yield (window_page_indices, model_list, images_list, pdf_doc)，pdf_doc由调用方关闭。
+    """
+    if page_window_size is None:
+        page_window_size = int(os.environ.get('MINERU_PAGE_WINDOW_SIZE', 64))
+    page_window_size = max(1, page_window_size)
+
+    pdf_doc = pdfium.PdfDocument(pdf_bytes)
+    for window_start in range(0, len(page_indices), page_window_size):
+        window_page_indices = page_indices[window_start: window_start + page_window_size]
+        logger.info(
+            f'Page window: {window_start + 1}-{window_start + len(window_page_indices)}/{len(page_indices)} changed pages'
+        )
+        images_list = load_images_from_pdf_doc(pdf_doc, pdf_bytes=pdf_bytes, page_indices=window_page_indices)
+        model_list = _analyze_window(
+            images_list, window_page_indices, ocr_enable, lang, formula_enable, table_enable
+        )
+        yield window_page_indices, model_list, images_list, pdf_doc
+
+
+def get_ocr_enable(pdf_bytes, parse_method):
+    """根据解析方法确定文档是否整体使用OCR，auto模式下按文档分类结果决定"""
+    if parse_method == 'auto':
+        return classify(pdf_bytes) == 'ocr'
+    return parse_method == 'ocr'
+
+
+def _analyze_window(images_list, page_indices, ocr_enable, lang, formula_enable, table_enable):
+    """推理一个窗口内的页面，返回与images_list一一对应的model_list"""
+    images_with_extra_info = [(img_dict['img_pil'], ocr_enable, lang) for img_dict in images_list]
+    ocr_rec_queue = OcrRecQueue()
+    results = batch_image_analyze(images_with_extra_info, formula_enable, table_enable, ocr_rec_queue)
+    ocr_rec_queue.flush()
+
+    model_list = []
+    for i, img_dict in enumerate(images_list):
+        pil_img = img_dict['img_pil']
+        page_info_dict = {'page_no': page_indices[i], 'width': pil_img.width, 'height': pil_img.height}
+        model_list.append({'layout_dets': results[i], 'page_info': page_info_dict})
+    return model_list
+
+
 def batch_image_analyze(
         images_with_extra_info: List[Tuple[PIL.Image.Image, bool, str]],
         formula_enable=True,
-        table_enable=True):
+        table_enable=True,
+        ocr_rec_queue=None):
     # os.environ['CUDA_VISIBLE_DEVICES'] = str(idx)
 
     from .batch_analyze import BatchAnalyze
@@ -190,7 +297,7 @@ def batch_image_analyze(
             batch_ratio = 1
             logger.info(f'Could not determine GPU memory, using default batch_ratio: {batch_ratio}')
 
-    batch_model = BatchAnalyze(model_manager, batch_ratio, formula_enable, table_enable)
+    batch_model = BatchAnalyze(model_manager, batch_ratio, formula_enable, table_enable, ocr_rec_queue=ocr_rec_queue)
     results = batch_model(images_with_extra_info)
 
     clean_memory(get_device())
@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+
+from loguru import logger
+
+_STOP = object()
+
+
+class StageTiming:
+    """单个阶段的耗时统计，busy为实际处理时间，wait为等待上游数据的时间"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.wait = 0.0
+
+    def __repr__(self):
+        return f"{self.name}: items={self.items}, busy={self.busy:.2f}s, wait={self.wait:.2f}s"
+
+
+class StagedExecutor:
+    """多阶段生产者/消费者执行器。
+
+    每个阶段运行在独立线程中，阶段之间通过有界队列连接。输入被切分为若干个chunk依次流过各阶段，
+    使得第N+1个阶段的CPU预处理可以与第N个阶段对后续chunk的模型推理重叠执行。
+    每个阶段只有一个线程，chunk按输入顺序依次经过各阶段，输出顺序与输入一致。
+    任一阶段抛出异常后，后续chunk不再处理，异常在run返回前重新抛出。
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.timings = [StageTiming(name) for name, _ in stages]
+
+    def run(self, items) -> list:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        errors = []
+        failed = threading.Event()
+
+        def feed():
+            for item in items:
+                if failed.is_set():
+                    break
+                queues[0].put(item)
+            queues[0].put(_STOP)
+
+        def work(stage_idx):
+            _, func = self.stages[stage_idx]
+            timing = self.timings[stage_idx]
+            in_queue, out_queue = queues[stage_idx], queues[stage_idx + 1]
+            while True:
+                wait_start = time.perf_counter()
+                item = in_queue.get()
+                timing.wait += time.perf_counter() - wait_start
+                if item is _STOP:
+                    out_queue.put(_STOP)
+                    break
+                # 出错后继续消费上游数据直到结束标记，避免上游阻塞在有界队列上
+                if failed.is_set():
+                    continue
+                busy_start = time.perf_counter()
+                try:
+                    result = func(item)
+                except BaseException as e:
+                    errors.append(e)
+                    failed.set()
+                    continue
+                finally:
+                    timing.busy += time.perf_counter() - busy_start
+                timing.items += 1
+                out_queue.put(result)
+
+        threads = [threading.Thread(target=feed, name="stage_feed", daemon=True)]
+        for stage_idx, (name, _) in enumerate(self.stages):
+            threads.append(threading.Thread(target=work, args=(stage_idx,), name=f"stage_{name}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is _STOP:
+                break
+            results.append(item)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
+
+    def log_timings(self, total_time):
+        logger.info(
+            f"Staged pipeline finished in {total_time:.2f}s, "
+            + "; ".join(repr(timing) for timing in self.timings)
+        )
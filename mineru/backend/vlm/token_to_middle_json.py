@@ -2,7 +2,6 @@ import re
 
 from mineru.utils.cut_image import cut_image_and_table
 from mineru.utils.enum_class import BlockType, ContentType
-from mineru.utils.hash_utils import str_md5
 from mineru.backend.vlm.vlm_magic_model import MagicModel
 from mineru.version import __version__
 
@@ -16,7 +15,7 @@ def token_to_page_info(token, image_dict, page, image_writer, page_index) -> dic
 
     scale = image_dict["scale"]
     page_pil_img = image_dict["img_pil"]
-    page_img_md5 = str_md5(image_dict["img_base64"])
+    page_img_md5 = image_dict["img_md5"]
     width, height = map(int, page.get_size())
 
     magic_model = MagicModel(token, width, height)
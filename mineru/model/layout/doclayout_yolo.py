@@ -1,64 +1,46 @@
 from doclayout_yolo import YOLOv10
-from tqdm import tqdm
+
+from ...utils.yolo_utils import yolo_batch_predict
 
 
 class DocLayoutYOLOModel(object):
     def __init__(self, weight, device):
         self.model = YOLOv10(weight)
         self.device = device
+        self.imgsz = 1280
+        self.conf = 0.10
+        self.iou = 0.45
 
     def predict(self, image):
-        layout_res = []
-        doclayout_yolo_res = self.model.predict(
-            image,
-            imgsz=1280,
-            conf=0.10,
-            iou=0.45,
-            verbose=False, device=self.device
-        )[0]
-        for xyxy, conf, cla in zip(
-            doclayout_yolo_res.boxes.xyxy.cpu(),
-            doclayout_yolo_res.boxes.conf.cpu(),
-            doclayout_yolo_res.boxes.cls.cpu(),
-        ):
-            xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
-            new_item = {
-                "category_id": int(cla.item()),
-                "poly": [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
-                "score": round(float(conf.item()), 3),
-            }
-            layout_res.append(new_item)
-        return layout_res
+        return self.batch_predict([image], 1)[0]
 
-    def batch_predict(self, images: list, batch_size: int) -> list:
+    def batch_predict(self, images: list, batch_size: int, page_tensors=None) -> list:
         images_layout_res = []
-        # for index in range(0, len(images), batch_size):
-        for index in tqdm(range(0, len(images), batch_size), desc="Layout Predict"):
-            doclayout_yolo_res = [
-                image_res.cpu()
-                for image_res in self.model.predict(
-                    images[index : index + batch_size],
-                    imgsz=1280,
-                    conf=0.10,
-                    iou=0.45,
-                    verbose=False,
-                    device=self.device,
-                )
-            ]
-            for image_res in doclayout_yolo_res:
-                layout_res = []
-                for xyxy, conf, cla in zip(
-                    image_res.boxes.xyxy,
-                    image_res.boxes.conf,
-                    image_res.boxes.cls,
-                ):
-                    xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
-                    new_item = {
-                        "category_id": int(cla.item()),
-                        "poly": [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
-                        "score": round(float(conf.item()), 3),
-                    }
-                    layout_res.append(new_item)
-                images_layout_res.append(layout_res)
+        doclayout_yolo_res = yolo_batch_predict(
+            self.model,
+            images,
+            batch_size,
+            imgsz=self.imgsz,
+            device=self.device,
+            desc="Layout Predict",
+            page_tensors=page_tensors,
+            conf=self.conf,
+            iou=self.iou,
+        )
+        for image_res in doclayout_yolo_res:
+            layout_res = []
+            for xyxy, conf, cla in zip(
+                image_res.boxes.xyxy,
+                image_res.boxes.conf,
+                image_res.boxes.cls,
+            ):
+                xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
+                new_item = {
+                    "category_id": int(cla.item()),
+                    "poly": [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
+                    "score": round(float(conf.item()), 3),
+                }
+                layout_res.append(new_item)
+            images_layout_res.append(layout_res)
 
         return images_layout_res
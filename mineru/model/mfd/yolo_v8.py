@@ -1,33 +1,28 @@
-from tqdm import tqdm
 from ultralytics import YOLO
 
+from ...utils.yolo_utils import yolo_batch_predict
+
 
 class YOLOv8MFDModel(object):
     def __init__(self, weight, device="cpu"):
         self.mfd_model = YOLO(weight)
         self.device = device
+        self.imgsz = 1888
+        self.conf = 0.25
+        self.iou = 0.45
 
     def predict(self, image):
-        mfd_res = self.mfd_model.predict(
-            image, imgsz=1888, conf=0.25, iou=0.45, verbose=False, device=self.device
-        )[0]
-        return mfd_res
+        return self.batch_predict([image], 1)[0]
 
-    def batch_predict(self, images: list, batch_size: int) -> list:
-        images_mfd_res = []
-        # for index in range(0, len(images), batch_size):
-        for index in tqdm(range(0, len(images), batch_size), desc="MFD Predict"):
-            mfd_res = [
-                image_res.cpu()
-                for image_res in self.mfd_model.predict(
-                    images[index : index + batch_size],
-                    imgsz=1888,
-                    conf=0.25,
-                    iou=0.45,
-                    verbose=False,
-                    device=self.device,
-                )
-            ]
-            for image_res in mfd_res:
-                images_mfd_res.append(image_res)
-        return images_mfd_res
+    def batch_predict(self, images: list, batch_size: int, page_tensors=None) -> list:
+        return yolo_batch_predict(
+            self.mfd_model,
+            images,
+            batch_size,
+            imgsz=self.imgsz,
+            device=self.device,
+            desc="MFD Predict",
+            page_tensors=page_tensors,
+            conf=self.conf,
+            iou=self.iou,
+        )
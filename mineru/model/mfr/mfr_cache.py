@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from mineru.model.mfr.unimernet.unimernet_hf.unimer_swin.image_processing_unimer_swin import UnimerSwinImageProcessor
+from mineru.utils.result_cache import SqliteLRUCache
+
+
+def mfr_cache_signature(weight_dir, model):
+    """
+    识别模型与解码设置的签名，作为缓存key的一部分：权重目录、目录中各文件的大小和修改时间、
+    生成配置、最大解码长度和推理精度，任何一项变化时磁盘缓存中旧模型的结果不会再被命中
+    """
+    hasher = hashlib.sha256()
+    weight_dir = os.path.abspath(weight_dir)
+    hasher.update(f"{weight_dir}\n".encode('utf-8'))
+    for file_name in sorted(os.listdir(weight_dir)):
+        file_path = os.path.join(weight_dir, file_name)
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            hasher.update(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    hasher.update(model.generation_config.to_json_string(use_diff=False).encode('utf-8'))
+    hasher.update(f"max_new_tokens={model.tokenizer.tokenizer.model_max_length}\n".encode('utf-8'))
+    hasher.update(f"dtype={model.dtype}\n".encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def mfr_cache_key(image, signature=''):
+    """
+    公式图像经crop_margin_numpy裁掉空白边距并归一化为灰度图后，与模型签名(见mfr_cache_signature)一起计算sha256作为缓存key，
+    同一公式在不同位置、不同边距下的裁剪图得到相同的key；图像无效时返回None
+    """
+    try:
+        img = np.asarray(image.convert('RGB'))
+        cropped = UnimerSwinImageProcessor.crop_margin_numpy(img)
+        if cropped.shape[0] == 0 or cropped.shape[1] == 0:
+            return None
+        gray = cv2.cvtColor(cropped, cv2.COLOR_RGB2GRAY)
+    except Exception:
+        return None
+    min_val, max_val = int(gray.min()), int(gray.max())
+    if max_val > min_val:
+        gray = ((gray.astype(np.float32) - min_val) / (max_val - min_val) * 255).astype(np.uint8)
+    hasher = hashlib.sha256()
+    hasher.update(f"{signature}\n{gray.shape[0]}x{gray.shape[1]}\n".encode('utf-8'))
+    hasher.update(np.ascontiguousarray(gray).tobytes())
+    return hasher.hexdigest()
+
+
+class MfrResultCache(object):
+    """公式识别结果缓存，进程内LRU + 可选的SQLite磁盘缓存，磁盘命中的结果会回填到内存中"""
+
+    def __init__(self, max_entries, disk_cache=None):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            latex = self._memory.get(key)
+            if latex is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return latex
+        if self.disk_cache is not None:
+            latex = self.disk_cache.get(key)
+            if latex is not None:
+                self._put_memory(key, latex)
+                with self._lock:
+                    self.disk_hits += 1
+                return latex
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, latex):
+        self._put_memory(key, latex)
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, latex)
+
+    def _put_memory(self, key, latex):
+        with self._lock:
+            self._memory[key] = latex
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+            }
+        if self.disk_cache is not None:
+            stats['disk'] = self.disk_cache.stats()
+        return stats
+
+
+def mfr_cache_init():
+    """
+    根据环境变量创建公式识别缓存，MINERU_MFR_CACHE_ENABLE设置为false时关闭缓存，
+    MINERU_MFR_CACHE_MAX_ENTRIES设置内存缓存条数上限，默认值为50000；
+    设置MINERU_MFR_CACHE_PATH后额外启用磁盘缓存，容量上限由MINERU_MFR_CACHE_SIZE_MB设置，默认值为256。
+    """
+    if os.getenv('MINERU_MFR_CACHE_ENABLE', 'true').lower() not in ('true', '1', 't'):
+        return None
+    max_entries = int(os.getenv('MINERU_MFR_CACHE_MAX_ENTRIES', '50000'))
+    disk_cache = None
+    cache_path = os.getenv('MINERU_MFR_CACHE_PATH')
+    if cache_path:
+        max_size_bytes = int(float(os.getenv('MINERU_MFR_CACHE_SIZE_MB', '256')) * 1024 * 1024)
+        try:
+            disk_cache = SqliteLRUCache(cache_path, max_size_bytes, table_name='mfr_results')
+        except Exception as e:
+            logger.warning(f"公式识别磁盘缓存初始化失败，仅使用内存缓存: {e}")
+    return MfrResultCache(max_entries, disk_cache)
@@ -1,7 +1,14 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import torch
+from loguru import logger
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 
+from ..mfr_cache import mfr_cache_init, mfr_cache_key, mfr_cache_signature
+
 
 class MathDataset(Dataset):
     def __init__(self, image_paths, transform=None):
@@ -30,6 +37,16 @@ class UnimernetModel(object):
         if not _device_.startswith("cpu"):
             self.model = self.model.to(dtype=torch.float16)
         self.model.eval()
+        # 公式图像预处理(裁边、缩放、归一化)的并行线程数
+        self.preprocess_workers = int(os.getenv('MINERU_MFR_PREPROCESS_WORKERS', min(8, os.cpu_count() or 1)))
+        # 逐序列提前退出的贪心解码，仅在生成配置为纯贪心时启用，保证与generate结果一致
+        early_exit_enable = os.getenv('MINERU_MFR_EARLY_EXIT', 'true').lower() in ('true', '1', 't')
+        self.early_exit = early_exit_enable and self.model.early_exit_supported()
+        if early_exit_enable and not self.early_exit:
+            logger.info("MFR generation config is not plain greedy, early exit decoding disabled")
+        # 按裁边归一化后的公式图像缓存识别结果，重复出现的公式跳过解码
+        self.cache = mfr_cache_init()
+        self.cache_signature = mfr_cache_signature(weight_dir, self.model) if self.cache is not None else ''
 
     def predict(self, mfd_res, image):
         formula_list = []
@@ -65,7 +82,7 @@ class UnimernetModel(object):
         images_formula_list = []
         mf_image_list = []
         backfill_list = []
-        image_info = []  # Store (area, original_index, image) tuples
+        image_info = []  # Store (aspect_ratio, original_index, image) tuples
 
         # Collect images with their original indices
         for image_index in range(len(images_mfd_res)):
@@ -85,51 +102,91 @@ class UnimernetModel(object):
                 }
                 formula_list.append(new_item)
                 bbox_img = pil_img.crop((xmin, ymin, xmax, ymax))
-                area = (xmax - xmin) * (ymax - ymin)
+                aspect_ratio = (xmax - xmin) / max(ymax - ymin, 1)
 
                 curr_idx = len(mf_image_list)
-                image_info.append((area, curr_idx, bbox_img))
+                image_info.append((aspect_ratio, curr_idx, bbox_img))
                 mf_image_list.append(bbox_img)
 
             images_formula_list.append(formula_list)
             backfill_list += formula_list
 
-        # Stable sort by area
-        image_info.sort(key=lambda x: x[0])  # sort by area
+        # 查询缓存，命中的公式不再解码，本批中重复的公式只解码一次
+        latex_results = [None] * len(mf_image_list)
+        cache_keys = self._compute_cache_keys(mf_image_list)
+        duplicate_indices = {}
+        decode_indices = set()
+        for idx, key in enumerate(cache_keys):
+            if key is None:
+                decode_indices.add(idx)
+            elif key in duplicate_indices:
+                duplicate_indices[key].append(idx)
+            else:
+                latex = self.cache.get(key)
+                if latex is not None:
+                    latex_results[idx] = latex
+                else:
+                    duplicate_indices[key] = [idx]
+                    decode_indices.add(idx)
+        image_info = [info for info in image_info if info[1] in decode_indices]
+
+        # 按宽高比(预测输出长度的近似)稳定排序，相邻的公式输出长度接近，组成的batch解码步数更一致
+        image_info.sort(key=lambda x: x[0])
         sorted_indices = [x[1] for x in image_info]
         sorted_images = [x[2] for x in image_info]
 
-        # Create mapping for results
-        index_mapping = {new_idx: old_idx for new_idx, old_idx in enumerate(sorted_indices)}
-
-        # Create dataset with sorted images
-        dataset = MathDataset(sorted_images, transform=self.model.transform)
-        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=0)
-
         # Process batches and store results
         mfr_res = []
-        # for mf_img in dataloader:
-
         with tqdm(total=len(sorted_images), desc="MFR Predict") as pbar:
-            for index, mf_img in enumerate(dataloader):
+            for mf_img in self._iter_preprocessed_batches(sorted_images, batch_size):
                 mf_img = mf_img.to(dtype=self.model.dtype)
                 mf_img = mf_img.to(self.device)
                 with torch.no_grad():
-                    output = self.model.generate({"image": mf_img})
+                    if self.early_exit:
+                        output = self.model.generate_early_exit({"image": mf_img})
+                    else:
+                        output = self.model.generate({"image": mf_img})
                 mfr_res.extend(output["fixed_str"])
-
-                # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
-                current_batch_size = min(batch_size, len(sorted_images) - index * batch_size)
-                pbar.update(current_batch_size)
+                pbar.update(mf_img.shape[0])
 
         # Restore original order
-        unsorted_results = [""] * len(mfr_res)
-        for new_idx, latex in enumerate(mfr_res):
-            original_idx = index_mapping[new_idx]
-            unsorted_results[original_idx] = latex
+        for original_idx, latex in zip(sorted_indices, mfr_res):
+            key = cache_keys[original_idx]
+            if key is None:
+                latex_results[original_idx] = latex
+                continue
+            self.cache.put(key, latex)
+            for idx in duplicate_indices[key]:
+                latex_results[idx] = latex
+
+        if self.cache is not None and len(mf_image_list) > 0:
+            logger.info(f"MFR cache: {len(mf_image_list) - len(sorted_images)}/{len(mf_image_list)} formulas skipped decoding, stats: {self.cache.stats()}")
 
         # Fill results back
-        for res, latex in zip(backfill_list, unsorted_results):
+        for res, latex in zip(backfill_list, latex_results):
             res["latex"] = latex
 
         return images_formula_list
+
+    def _iter_preprocessed_batches(self, images: list, batch_size: int):
+        """
+        多线程并行预处理公式图像并按batch产出张量，
+        当前batch在GPU上解码时，下一个batch已经在CPU上预处理，预处理结果最多只保留两个batch
+        """
+        batches = [images[index: index + batch_size] for index in range(0, len(images), batch_size)]
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, self.preprocess_workers)) as executor:
+            next_futures = [executor.submit(self.model.transform, image) for image in batches[0]]
+            for batch_index in range(len(batches)):
+                current_futures = next_futures
+                if batch_index + 1 < len(batches):
+                    next_futures = [executor.submit(self.model.transform, image) for image in batches[batch_index + 1]]
+                yield torch.stack([future.result() for future in current_futures])
+
+    def _compute_cache_keys(self, images: list) -> list:
+        """并行计算公式图像的缓存key，未启用缓存时全部返回None"""
+        if self.cache is None or not images:
+            return [None] * len(images)
+        with ThreadPoolExecutor(max_workers=max(1, self.preprocess_workers)) as executor:
+            return list(executor.map(partial(mfr_cache_key, signature=self.cache_signature), images))
@@ -3,6 +3,7 @@ import re
 import warnings
 from typing import Optional
 
+import numpy as np
 import torch
 from ftfy import fix_text
 from loguru import logger
@@ -488,8 +489,96 @@ class UnimernetModel(VisionEncoderDecoderModel):
         )
 
         outputs = outputs[:, 1:].cpu().numpy()
+        return self._decode_outputs(outputs)
+
+    def _decode_outputs(self, outputs):
         pred_tokens = self.tokenizer.detokenize(outputs)
         pred_str = self.tokenizer.token2str(outputs)
         fixed_str = [latex_rm_whitespace(s) for s in pred_str]
         return {"pred_ids": outputs, "pred_tokens": pred_tokens, "pred_str": pred_str, "fixed_str": fixed_str}
 
+    def early_exit_supported(self) -> bool:
+        """只有纯贪心解码且没有额外的logits处理时，逐序列提前退出的解码结果才与generate一致"""
+        generation_config = self.generation_config
+        return (
+            (generation_config.num_beams or 1) == 1
+            and not generation_config.do_sample
+            and not generation_config.no_repeat_ngram_size
+            and generation_config.repetition_penalty in (None, 1.0)
+            and not generation_config.bad_words_ids
+            and not generation_config.min_length
+            and not generation_config.min_new_tokens
+            and not generation_config.suppress_tokens
+            and not generation_config.begin_suppress_tokens
+            and generation_config.forced_bos_token_id is None
+        )
+
+    @torch.no_grad()
+    def generate_early_exit(self, samples):
+        """
+        贪心解码，每一步把已经输出eos的序列从batch中移除(同时裁剪encoder输出和kv cache)，
+        剩余序列继续解码，避免整批等待最长的公式。输出格式与generate一致。
+        """
+        pixel_values = samples["image"]
+        num_channels = pixel_values.shape[1]
+        if num_channels == 1:
+            pixel_values = pixel_values.repeat(1, 3, 1, 1)
+
+        encoder_hidden_states = self.encoder(pixel_values=pixel_values)[0]
+        if (
+            self.encoder.config.hidden_size != self.decoder.config.hidden_size
+            and self.decoder.config.cross_attention_hidden_size is None
+        ):
+            encoder_hidden_states = self.enc_to_dec_proj(encoder_hidden_states)
+
+        device = encoder_hidden_states.device
+        batch_size = encoder_hidden_states.shape[0]
+        eos_token_id = self.generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = self.tokenizer.eos_token_id
+        eos_token_ids = set(eos_token_id) if isinstance(eos_token_id, (list, tuple)) else {eos_token_id}
+        forced_eos_token_id = self.generation_config.forced_eos_token_id
+        max_new_tokens = self.tokenizer.tokenizer.model_max_length
+
+        active = torch.arange(batch_size, device=device)
+        input_ids = torch.full((batch_size, 1), self.tokenizer.tokenizer.bos_token_id, dtype=torch.long, device=device)
+        past_key_values = None
+        sequences = [[] for _ in range(batch_size)]
+        for step in range(max_new_tokens):
+            # 与generate中prepare_inputs_for_generation构造的全1 attention_mask保持一致
+            attention_mask = input_ids.new_ones((input_ids.shape[0], step + 1))
+            decoder_outputs = self.decoder(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                encoder_hidden_states=encoder_hidden_states,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True,
+            )
+            next_tokens = decoder_outputs.logits[:, -1, :].argmax(dim=-1)
+            if forced_eos_token_id is not None and step == max_new_tokens - 1:
+                next_tokens = torch.full_like(next_tokens, forced_eos_token_id)
+
+            keep = []
+            for row, (seq_idx, token) in enumerate(zip(active.tolist(), next_tokens.tolist())):
+                sequences[seq_idx].append(token)
+                if token not in eos_token_ids:
+                    keep.append(row)
+            if not keep:
+                break
+
+            past_key_values = decoder_outputs.past_key_values
+            if len(keep) < len(next_tokens):
+                keep_idx = torch.tensor(keep, dtype=torch.long, device=device)
+                active = active.index_select(0, keep_idx)
+                next_tokens = next_tokens.index_select(0, keep_idx)
+                encoder_hidden_states = encoder_hidden_states.index_select(0, keep_idx)
+                past_key_values = self.decoder._reorder_cache(past_key_values, keep_idx)
+            input_ids = next_tokens.unsqueeze(-1)
+
+        max_len = max(len(seq) for seq in sequences)
+        outputs = np.full((batch_size, max_len), self.tokenizer.pad_token_id, dtype=np.int64)
+        for seq_idx, seq in enumerate(sequences):
+            outputs[seq_idx, :len(seq)] = seq
+        return self._decode_outputs(outputs)
+
@@ -192,15 +192,41 @@ class PytorchPaddleOCR(TextSystem):
         return filter_boxes, filter_rec_res
 
 if __name__ == '__main__':
-    pytorch_paddle_ocr = PytorchPaddleOCR()
-    img = cv2.imread("/Users/myhloli/Downloads/screenshot-20250326-194348.png")
-    dt_boxes, rec_res = pytorch_paddle_ocr(img)
-    ocr_res = []
-    if not dt_boxes and not rec_res:
-        ocr_res.append(None)
-    else:
-        tmp_res = [[box.tolist(), res] for box, res in zip(dt_boxes, rec_res)]
-        ocr_res.append(tmp_res)
-    print(ocr_res)
-
-
+    """
+    OCR det/rec推理精度与内存布局的精度-速度benchmark：
+    python -m mineru.model.ocr.paddleocr2pytorch.pytorch_paddle [pdf_path] [lang]
+    默认使用仓库自带的input/sample_2.pdf，以fp32结果为基准，输出各模式的耗时和文本一致率
+    """
+    import difflib
+    import sys
+    import time
+
+    from mineru.utils.pdf_image_tools import load_images_from_pdf
+
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else str(root_dir.parents[3] / 'input' / 'sample_2.pdf')
+    bench_lang = sys.argv[2] if len(sys.argv) > 2 else 'ch'
+    with open(pdf_path, 'rb') as f:
+        images_list, _ = load_images_from_pdf(f.read())
+    bench_images = [cv2.cvtColor(np.asarray(image_dict['img_pil']), cv2.COLOR_RGB2BGR) for image_dict in images_list]
+
+    bench_modes = [('fp32', False), ('fp32', True), ('fp16', False), ('fp16', True), ('bf16', False)]
+    baseline_texts = None
+    for precision, channels_last in bench_modes:
+        ocr_model = PytorchPaddleOCR(lang=bench_lang, precision=precision, channels_last=channels_last)
+        # 预热，排除cudnn选择算法的耗时
+        ocr_model.ocr(bench_images[0])
+        start = time.perf_counter()
+        page_texts = []
+        for bench_img in bench_images:
+            page_res = ocr_model.ocr(bench_img)[0] or []
+            page_texts.append('\n'.join(text for _, (text, _) in page_res))
+        cost = time.perf_counter() - start
+        if baseline_texts is None:
+            baseline_texts = page_texts
+        agreement = sum(
+            difflib.SequenceMatcher(None, base, text).ratio() for base, text in zip(baseline_texts, page_texts)
+        ) / max(1, len(page_texts))
+        logger.info(
+            f'precision={ocr_model.text_detector.dtype}, channels_last={channels_last}: '
+            f'{len(bench_images) / cost:.2f} pages/s, text agreement with fp32: {agreement:.4f}'
+        )
@@ -1,7 +1,35 @@
 import os
+import numpy as np
 import torch
+from loguru import logger
 from .modeling.architectures.base_model import BaseModel
 
+PRECISION_DTYPES = {
+    'fp32': torch.float32,
+    'fp16': torch.float16,
+    'bf16': torch.bfloat16,
+}
+
+
+class PinnedHostBuffer:
+    """
+    跨batch复用的锁页内存输入缓冲区，容量不足时按需扩大。
+
+    numpy batch先拷贝到锁页内存再以non_blocking方式传到GPU，省去每个batch重新分配可分页内存和驱动侧的中转拷贝。
+    下一个batch写入缓冲区前，上一个batch的输出已经通过.cpu()同步回来，因此异步拷贝不会读到被覆盖的数据。
+    """
+
+    def __init__(self):
+        self.buffer = None
+
+    def to_device(self, array: np.ndarray, device) -> torch.Tensor:
+        numel = array.size
+        if self.buffer is None or self.buffer.numel() < numel:
+            self.buffer = torch.empty(numel, dtype=torch.float32, pin_memory=True)
+        host_tensor = self.buffer[:numel].view(array.shape)
+        host_tensor.copy_(torch.from_numpy(array))
+        return host_tensor.to(device, non_blocking=True)
+
 class BaseOCRV20:
     def __init__(self, config, **kwargs):
         self.config = config
@@ -33,6 +61,36 @@ class BaseOCRV20:
         self.net.load_state_dict(torch.load(weights_path, weights_only=True))
         # print('model is loaded: {}'.format(weights_path))
 
+    def set_inference_mode(self, device, precision='fp32', channels_last=False):
+        """
+        设置网络的推理精度和内存布局。fp16/bf16只在非CPU设备上生效，
+        channels_last只作用于4维的卷积权重和输入张量。
+        """
+        precision = str(precision).lower()
+        if precision not in PRECISION_DTYPES:
+            logger.warning(f"Unknown OCR precision '{precision}', fallback to fp32.")
+            precision = 'fp32'
+        if precision != 'fp32' and str(device).startswith('cpu'):
+            precision = 'fp32'
+        self.device = device
+        self.dtype = PRECISION_DTYPES[precision]
+        self.channels_last = channels_last
+        self.net.to(device=device, dtype=self.dtype)
+        if channels_last:
+            self.net.to(memory_format=torch.channels_last)
+        self.pinned_buffer = PinnedHostBuffer() if str(device).startswith('cuda') else None
+
+    def to_input_tensor(self, array: np.ndarray) -> torch.Tensor:
+        """numpy float32 batch转为网络输入：拷贝到设备、转换精度，4维输入按需转为channels_last"""
+        if self.pinned_buffer is not None:
+            inp = self.pinned_buffer.to_device(array, self.device)
+        else:
+            inp = torch.from_numpy(np.ascontiguousarray(array)).to(self.device)
+        inp = inp.to(self.dtype)
+        if self.channels_last and inp.dim() == 4:
+            inp = inp.contiguous(memory_format=torch.channels_last)
+        return inp
+
     def inference(self, inputs):
         with torch.no_grad():
             infer = self.net(inputs)
@@ -179,10 +179,13 @@ class CTCLabelDecode(BaseRecLabelDecode):
                  **kwargs):
         super(CTCLabelDecode, self).__init__(character_dict_path,
                                              use_space_char)
+        self.character_array = np.array(self.character, dtype=object)
 
     def __call__(self, preds, label=None, return_word_box=False, *args, **kwargs):
+        if label is None and not return_word_box:
+            return self.batch_decode(preds)
         if isinstance(preds, torch.Tensor):
-            preds = preds.numpy()
+            preds = preds.float().cpu().numpy()
         preds_idx = preds.argmax(axis=2)
         preds_prob = preds.max(axis=2)
         text = self.decode(
@@ -202,6 +205,41 @@ class CTCLabelDecode(BaseRecLabelDecode):
         label = self.decode(label)
         return text, label
 
+    def batch_decode(self, preds):
+        """
+        向量化的CTC贪心解码，结果与decode(is_remove_duplicate=True)完全一致。
+        preds为torch.Tensor时argmax/max与去重去blank的mask都在其所在设备上完成，
+        只把保留下来的字符下标、置信度和每行的字符数拷回host。
+        """
+        if isinstance(preds, torch.Tensor):
+            preds = preds.float()
+            preds_idx = preds.argmax(dim=2)
+            preds_prob = preds.max(dim=2).values
+            keep = preds_idx != 0
+            keep[:, 1:] &= preds_idx[:, 1:] != preds_idx[:, :-1]
+            counts = keep.sum(dim=1).cpu().numpy()
+            selected_idx = preds_idx[keep].cpu().numpy()
+            selected_prob = preds_prob[keep].cpu().numpy()
+        else:
+            preds_idx = preds.argmax(axis=2)
+            preds_prob = preds.max(axis=2)
+            keep = preds_idx != 0
+            keep[:, 1:] &= preds_idx[:, 1:] != preds_idx[:, :-1]
+            counts = keep.sum(axis=1)
+            selected_idx = preds_idx[keep]
+            selected_prob = preds_prob[keep]
+
+        selected_chars = self.character_array[selected_idx]
+        result_list = []
+        start = 0
+        for count in counts.tolist():
+            end = start + count
+            # 没有保留字符时与decode一致，返回np.mean([])得到的nan
+            score = np.mean(selected_prob[start:end]) if count > 0 else np.mean([])
+            result_list.append((''.join(selected_chars[start:end]), score))
+            start = end
+        return result_list
+
     def add_special_char(self, dict_character):
         dict_character = ['blank'] + dict_character
         return dict_character
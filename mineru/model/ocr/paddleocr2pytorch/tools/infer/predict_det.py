@@ -42,6 +42,7 @@ class TextDetector(BaseOCRV20):
             postprocess_params["unclip_ratio"] = args.det_db_unclip_ratio
             postprocess_params["use_dilation"] = args.use_dilation
             postprocess_params["score_mode"] = args.det_db_score_mode
+            postprocess_params["postprocess_workers"] = args.det_db_postprocess_workers
         elif self.det_algorithm == "DB++":
             postprocess_params['name'] = 'DBPostProcess'
             postprocess_params["thresh"] = args.det_db_thresh
@@ -50,6 +51,7 @@ class TextDetector(BaseOCRV20):
             postprocess_params["unclip_ratio"] = args.det_db_unclip_ratio
             postprocess_params["use_dilation"] = args.use_dilation
             postprocess_params["score_mode"] = args.det_db_score_mode
+            postprocess_params["postprocess_workers"] = args.det_db_postprocess_workers
             pre_process_list[1] = {
                 'NormalizeImage': {
                     'std': [1.0, 1.0, 1.0],
@@ -115,7 +117,7 @@ class TextDetector(BaseOCRV20):
         super(TextDetector, self).__init__(network_config, **kwargs)
         self.load_pytorch_weights(self.weights_path)
         self.net.eval()
-        self.net.to(self.device)
+        self.set_inference_mode(self.device, args.precision, args.channels_last)
 
     def _batch_process_same_size(self, img_list):
         """
@@ -133,11 +135,11 @@ class TextDetector(BaseOCRV20):
         # 预处理所有图像
         batch_data = []
         batch_shapes = []
-        ori_imgs = []
+        ori_shapes = []
 
         for img in img_list:
-            ori_im = img.copy()
-            ori_imgs.append(ori_im)
+            # 后处理只用到原图尺寸，不需要拷贝整张图
+            ori_shapes.append(img.shape)
 
             data = {'image': img}
             data = transform(data, self.preprocess_op)
@@ -163,25 +165,24 @@ class TextDetector(BaseOCRV20):
 
         # 批处理推理
         with torch.no_grad():
-            inp = torch.from_numpy(batch_tensor)
-            inp = inp.to(self.device)
+            inp = self.to_input_tensor(batch_tensor)
             outputs = self.net(inp)
 
         # 处理输出
         preds = {}
         if self.det_algorithm == "EAST":
-            preds['f_geo'] = outputs['f_geo'].cpu().numpy()
-            preds['f_score'] = outputs['f_score'].cpu().numpy()
+            preds['f_geo'] = outputs['f_geo'].float().cpu().numpy()
+            preds['f_score'] = outputs['f_score'].float().cpu().numpy()
         elif self.det_algorithm == 'SAST':
-            preds['f_border'] = outputs['f_border'].cpu().numpy()
-            preds['f_score'] = outputs['f_score'].cpu().numpy()
-            preds['f_tco'] = outputs['f_tco'].cpu().numpy()
-            preds['f_tvo'] = outputs['f_tvo'].cpu().numpy()
+            preds['f_border'] = outputs['f_border'].float().cpu().numpy()
+            preds['f_score'] = outputs['f_score'].float().cpu().numpy()
+            preds['f_tco'] = outputs['f_tco'].float().cpu().numpy()
+            preds['f_tvo'] = outputs['f_tvo'].float().cpu().numpy()
         elif self.det_algorithm in ['DB', 'PSE', 'DB++']:
-            preds['maps'] = outputs['maps'].cpu().numpy()
+            preds['maps'] = outputs['maps'].float().cpu().numpy()
         elif self.det_algorithm == 'FCE':
             for i, (k, output) in enumerate(outputs.items()):
-                preds['level_{}'.format(i)] = output.cpu().numpy()
+                preds['level_{}'.format(i)] = output.float().cpu().numpy()
         else:
             raise NotImplementedError
 
@@ -189,26 +190,34 @@ class TextDetector(BaseOCRV20):
         batch_results = []
         total_elapse = time.time() - starttime
 
+        # DB后处理支持整批输入，batch内各图在线程池中并行处理
+        batch_post_result = None
+        if self.det_algorithm in ['DB', 'DB++']:
+            batch_post_result = self.postprocess_op(preds, batch_shapes)
+
         for i in range(len(img_list)):
-            # 提取单个图像的预测结果
-            single_preds = {}
-            for key, value in preds.items():
-                if isinstance(value, np.ndarray):
-                    single_preds[key] = value[i:i + 1]  # 保持批次维度
-                else:
-                    single_preds[key] = value
-
-            # 后处理
-            post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
-            dt_boxes = post_result[0]['points']
+            if batch_post_result is not None:
+                dt_boxes = batch_post_result[i]['points']
+            else:
+                # 提取单个图像的预测结果
+                single_preds = {}
+                for key, value in preds.items():
+                    if isinstance(value, np.ndarray):
+                        single_preds[key] = value[i:i + 1]  # 保持批次维度
+                    else:
+                        single_preds[key] = value
+
+                # 后处理
+                post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
+                dt_boxes = post_result[0]['points']
 
             # 过滤和裁剪检测框
             if (self.det_algorithm == "SAST" and
                 self.det_sast_polygon) or (self.det_algorithm in ["PSE", "FCE"] and
                                            self.postprocess_op.box_type == 'poly'):
-                dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_imgs[i].shape)
+                dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_shapes[i])
             else:
-                dt_boxes = self.filter_tag_det_res(dt_boxes, ori_imgs[i].shape)
+                dt_boxes = self.filter_tag_det_res(dt_boxes, ori_shapes[i])
 
             batch_results.append((dt_boxes, total_elapse / len(img_list)))
 
@@ -225,7 +234,7 @@ class TextDetector(BaseOCRV20):
         Returns:
             batch_results: 批处理结果列表，每个元素为(dt_boxes, elapse)
         """
-        if not img_list:
+        if len(img_list) == 0:
             return []
 
         batch_results = []
@@ -293,7 +302,7 @@ class TextDetector(BaseOCRV20):
         return dt_boxes
 
     def __call__(self, img):
-        ori_im = img.copy()
+        ori_shape = img.shape
         data = {'image': img}
         data = transform(data, self.preprocess_op)
         img, shape_list = data
@@ -301,28 +310,26 @@ class TextDetector(BaseOCRV20):
             return None, 0
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
         starttime = time.time()
 
         with torch.no_grad():
-            inp = torch.from_numpy(img)
-            inp = inp.to(self.device)
+            inp = self.to_input_tensor(img)
             outputs = self.net(inp)
 
         preds = {}
         if self.det_algorithm == "EAST":
-            preds['f_geo'] = outputs['f_geo'].cpu().numpy()
-            preds['f_score'] = outputs['f_score'].cpu().numpy()
+            preds['f_geo'] = outputs['f_geo'].float().cpu().numpy()
+            preds['f_score'] = outputs['f_score'].float().cpu().numpy()
         elif self.det_algorithm == 'SAST':
-            preds['f_border'] = outputs['f_border'].cpu().numpy()
-            preds['f_score'] = outputs['f_score'].cpu().numpy()
-            preds['f_tco'] = outputs['f_tco'].cpu().numpy()
-            preds['f_tvo'] = outputs['f_tvo'].cpu().numpy()
+            preds['f_border'] = outputs['f_border'].float().cpu().numpy()
+            preds['f_score'] = outputs['f_score'].float().cpu().numpy()
+            preds['f_tco'] = outputs['f_tco'].float().cpu().numpy()
+            preds['f_tvo'] = outputs['f_tvo'].float().cpu().numpy()
         elif self.det_algorithm in ['DB', 'PSE', 'DB++']:
-            preds['maps'] = outputs['maps'].cpu().numpy()
+            preds['maps'] = outputs['maps'].float().cpu().numpy()
         elif self.det_algorithm == 'FCE':
             for i, (k, output) in enumerate(outputs.items()):
-                preds['level_{}'.format(i)] = output
+                preds['level_{}'.format(i)] = output.float()
         else:
             raise NotImplementedError
 
@@ -331,9 +338,9 @@ class TextDetector(BaseOCRV20):
         if (self.det_algorithm == "SAST" and
             self.det_sast_polygon) or (self.det_algorithm in ["PSE", "FCE"] and
                                        self.postprocess_op.box_type == 'poly'):
-            dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_im.shape)
+            dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_shape)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_shape)
 
         elapse = time.time() - starttime
         return dt_boxes, elapse
@@ -9,6 +9,7 @@ from tqdm import tqdm
 from ...pytorchocr.base_ocr_v20 import BaseOCRV20
 from . import pytorchocr_utility as utility
 from ...pytorchocr.postprocess import build_post_process
+from ...pytorchocr.postprocess.rec_postprocess import CTCLabelDecode
 
 
 class TextRecognizer(BaseOCRV20):
@@ -92,7 +93,7 @@ class TextRecognizer(BaseOCRV20):
 
         self.load_state_dict(weights)
         self.net.eval()
-        self.net.to(self.device)
+        self.set_inference_mode(self.device, args.precision, args.channels_last)
 
     def resize_norm_img(self, img, max_wh_ratio):
         imgC, imgH, imgW = self.rec_image_shape
@@ -358,7 +359,6 @@ class TextRecognizer(BaseOCRV20):
                         norm_img = norm_img[np.newaxis, :]
                         norm_img_batch.append(norm_img)
                 norm_img_batch = np.concatenate(norm_img_batch)
-                norm_img_batch = norm_img_batch.copy()
 
                 if self.rec_algorithm == "SRN":
                     starttime = time.time()
@@ -370,17 +370,16 @@ class TextRecognizer(BaseOCRV20):
                         gsrm_slf_attn_bias2_list)
 
                     with torch.no_grad():
-                        inp = torch.from_numpy(norm_img_batch)
+                        inp = self.to_input_tensor(norm_img_batch)
                         encoder_word_pos_inp = torch.from_numpy(encoder_word_pos_list)
                         gsrm_word_pos_inp = torch.from_numpy(gsrm_word_pos_list)
                         gsrm_slf_attn_bias1_inp = torch.from_numpy(gsrm_slf_attn_bias1_list)
                         gsrm_slf_attn_bias2_inp = torch.from_numpy(gsrm_slf_attn_bias2_list)
 
-                        inp = inp.to(self.device)
                         encoder_word_pos_inp = encoder_word_pos_inp.to(self.device)
                         gsrm_word_pos_inp = gsrm_word_pos_inp.to(self.device)
-                        gsrm_slf_attn_bias1_inp = gsrm_slf_attn_bias1_inp.to(self.device)
-                        gsrm_slf_attn_bias2_inp = gsrm_slf_attn_bias2_inp.to(self.device)
+                        gsrm_slf_attn_bias1_inp = gsrm_slf_attn_bias1_inp.to(self.device, self.dtype)
+                        gsrm_slf_attn_bias2_inp = gsrm_slf_attn_bias2_inp.to(self.device, self.dtype)
 
                         backbone_out = self.net.backbone(inp) # backbone_feat
                         prob_out = self.net.head(backbone_out, [encoder_word_pos_inp, gsrm_word_pos_inp, gsrm_slf_attn_bias1_inp, gsrm_slf_attn_bias2_inp])
@@ -396,8 +395,7 @@ class TextRecognizer(BaseOCRV20):
                     # ]
 
                     with torch.no_grad():
-                        inp = torch.from_numpy(norm_img_batch)
-                        inp = inp.to(self.device)
+                        inp = self.to_input_tensor(norm_img_batch)
                         preds = self.net(inp)
 
                 elif self.rec_algorithm == "CAN":
@@ -407,10 +405,10 @@ class TextRecognizer(BaseOCRV20):
                     inputs = [norm_img_batch, norm_img_mask_batch, word_label_list]
 
                     inp = [torch.from_numpy(e_i) for e_i in inputs]
-                    inp = [e_i.to(self.device) for e_i in inp]
+                    inp = [e_i.to(self.device, self.dtype) if e_i.is_floating_point() else e_i.to(self.device) for e_i in inp]
                     with torch.no_grad():
                         outputs = self.net(inp)
-                        outputs = [v.cpu().numpy() for k, v in enumerate(outputs)]
+                        outputs = [v.float().cpu().numpy() for k, v in enumerate(outputs)]
 
                     preds = outputs
 
@@ -418,14 +416,16 @@ class TextRecognizer(BaseOCRV20):
                     starttime = time.time()
 
                     with torch.no_grad():
-                        inp = torch.from_numpy(norm_img_batch)
-                        inp = inp.to(self.device)
+                        inp = self.to_input_tensor(norm_img_batch)
                         prob_out = self.net(inp)
 
                     if isinstance(prob_out, list):
-                        preds = [v.cpu().numpy() for v in prob_out]
+                        preds = [v.float().cpu().numpy() for v in prob_out]
+                    elif isinstance(self.postprocess_op, CTCLabelDecode):
+                        # CTC解码直接在设备上完成，只拷回保留下来的字符下标和置信度
+                        preds = prob_out
                     else:
-                        preds = prob_out.cpu().numpy()
+                        preds = prob_out.float().cpu().numpy()
 
                 rec_result = self.postprocess_op(preds)
                 for rno in range(len(rec_result)):
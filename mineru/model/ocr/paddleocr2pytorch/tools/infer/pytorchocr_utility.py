@@ -25,6 +25,9 @@ def init_args():
     # parser.add_argument("--use_fp16", type=str2bool, default=False)
     parser.add_argument("--gpu_mem", type=int, default=500)
     parser.add_argument("--warmup", type=str2bool, default=False)
+    # det/rec网络的推理精度(fp32/fp16/bf16)与是否使用channels_last内存布局，CPU上始终使用fp32
+    parser.add_argument("--precision", type=str, default=os.getenv('MINERU_OCR_PRECISION', 'fp32'))
+    parser.add_argument("--channels_last", type=str2bool, default=os.getenv('MINERU_OCR_CHANNELS_LAST', 'false'))
 
     # params for text detector
     parser.add_argument("--image_dir", type=str)
@@ -39,7 +42,10 @@ def init_args():
     parser.add_argument("--det_db_unclip_ratio", type=float, default=1.5)
     parser.add_argument("--max_batch_size", type=int, default=10)
     parser.add_argument("--use_dilation", type=str2bool, default=False)
-    parser.add_argument("--det_db_score_mode", type=str, default="fast")
+    # fast/slow为逐轮廓计算得分，component为基于连通域的向量化得分计算
+    parser.add_argument("--det_db_score_mode", type=str, default=os.getenv('MINERU_OCR_DET_SCORE_MODE', 'fast'))
+    parser.add_argument("--det_db_postprocess_workers", type=int,
+                        default=int(os.getenv('MINERU_OCR_DET_POSTPROCESS_WORKERS', min(4, os.cpu_count() or 1))))
 
     # EAST parmas
     parser.add_argument("--det_east_score_thresh", type=float, default=0.8)
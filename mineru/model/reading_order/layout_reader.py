@@ -74,6 +74,30 @@ def boxes2inputs(boxes: List[List[int]]) -> Dict[str, torch.Tensor]:
     }
 
 
+def boxes2batch_inputs(boxes_list: List[List[List[int]]]) -> Dict[str, torch.Tensor]:
+    """多页boxes拼成一个padding后的batch，padding方式与DataCollator一致"""
+    bbox = []
+    input_ids = []
+    attention_mask = []
+    for boxes in boxes_list:
+        bbox.append([[0, 0, 0, 0]] + boxes + [[0, 0, 0, 0]])
+        input_ids.append([CLS_TOKEN_ID] + [UNK_TOKEN_ID] * len(boxes) + [EOS_TOKEN_ID])
+        attention_mask.append([1] + [1] * len(boxes) + [1])
+
+    max_len = max(len(x) for x in bbox)
+    for i in range(len(bbox)):
+        pad_len = max_len - len(bbox[i])
+        bbox[i] = bbox[i] + [[0, 0, 0, 0]] * pad_len
+        input_ids[i] = input_ids[i] + [EOS_TOKEN_ID] * pad_len
+        attention_mask[i] = attention_mask[i] + [0] * pad_len
+
+    return {
+        "bbox": torch.tensor(bbox),
+        "attention_mask": torch.tensor(attention_mask),
+        "input_ids": torch.tensor(input_ids),
+    }
+
+
 def prepare_inputs(
     inputs: Dict[str, torch.Tensor], model: LayoutLMv3ForTokenClassification
 ) -> Dict[str, torch.Tensor]:
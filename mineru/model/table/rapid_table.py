@@ -1,5 +1,9 @@
 import os
 import html
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from loguru import logger
@@ -8,6 +12,8 @@ from openai import OpenAI
 import base64
 import io
 
+from mineru.model.table.table_cache import table_cache_init, table_cache_key
+
 # from mineru.utils.enum_class import ModelPath #不再需要
 # from mineru.utils.models_download_utils import auto_download_and_get_model_root_path #不再需要
 
@@ -21,16 +27,110 @@ def escape_html(input_string):
     return html.escape(input_string)
 
 
+def is_complete_table_html(html_code):
+    """大模型返回的表格是否完整(以</table>或</html>结尾)，被截断的结果不写入缓存也不采用"""
+    if not html_code:
+        return False
+    html_code = html_code.strip()
+    return html_code.endswith('</html>') or html_code.endswith('</table>')
+
+
+TABLE_PROMPT = """
+        ## 角色
+        你是一位精通网页设计的科研内容专家，擅长将学术图像中的表格内容准确提取、翻译，并生成语义清晰、结构合理、视觉美观的 HTML 页面代码。
+
+        ## 任务
+        根据提供的学术研究类表格图片，完成以下任务：
+        1. 提取图片中的所有表格内容；
+        2. 特别注意识别因换行或竖排造成的术语断裂；
+        3. 使用语义化的 HTML 标签构建结构清晰的网页表格；
+        4. 输出完整 HTML 代码。
+        5. 特别注意不要把两个靠的比较近的列合并，比如发表年份材料制备方法，不要合并，分成"年份、材料、制备方法"三列
+
+        ## 输出注意点
+        - 表格结构应使用标准 HTML 表格语义标签，包括：
+        - <table> 表格容器；
+        - <thead> 表头区域；
+        - <tbody> 表格主体；
+        - <tr> 表格行；
+        - <th> 表头单元格（加粗、居中）；
+        - <td> 数据单元格（居中）；
+        - 所有内容应忠实还原图片中的行列顺序与数据；
+        - 不得添加任何解释性文字，仅输出 HTML 源代码。
+
+        ## 输出示例
+
+        ### 正确的输出示例
+        <table>
+        <thead>
+            <tr>
+            <th>Material</th>
+            <th>Property</th>
+            <th>Performance</th>
+            </tr>
+        </thead>
+        <tbody>
+            <tr>
+            <td>Cellulose</td>
+            <td>Thermal Stability</td>
+            <td>High</td>
+            </tr>
+            <tr>
+            <td>Graphene</td>
+            <td>Conductivity</td>
+            <td>Excellent</td>
+            </tr>
+        </tbody>
+        </table>
+        ### 错误的输出示例
+        <h1>表格内容</h1>
+        <p>纤维</p >
+        <p>素</p >
+        <!-- 错误1：未合并换行词语，未翻译 -->
+        <!-- 错误2：使用了不语义化的标签结构 -->
+        """
+
+
+class RateLimiter(object):
+    """线程安全的简单限速器，保证相邻两次请求的发起间隔不小于1/rate秒，rate<=0时不限速"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def acquire(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class RapidTableModel(object):
     def __init__(self):
         """
         初始化RapidTableModel，使用Qwen作为表格识别引擎。
         """
+        # 重试由batch_predict/predict自行控制，关闭SDK内置重试避免重复
         self.client = OpenAI(
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url=os.getenv("DASHSCOPE_BASE_URL"),
+            max_retries=0,
         )
         self.stream_request = os.getenv('DASHSCOPE_STREAM_REQUEST', 'False').lower() in ('true', '1', 't')
+        self.model_name = os.getenv('DASHSCOPE_TABLE_MODEL', 'qwen-vl-max-latest')
+        # 并发数、单次请求超时(秒)、失败重试次数、每秒请求数上限(0为不限速)
+        self.concurrency = max(1, int(os.getenv('DASHSCOPE_TABLE_CONCURRENCY', '4')))
+        self.request_timeout = float(os.getenv('DASHSCOPE_TABLE_TIMEOUT', '120'))
+        self.max_retries = max(0, int(os.getenv('DASHSCOPE_TABLE_MAX_RETRIES', '2')))
+        self.retry_backoff = float(os.getenv('DASHSCOPE_TABLE_RETRY_BACKOFF', '1.0'))
+        self.rate_limiter = RateLimiter(float(os.getenv('DASHSCOPE_TABLE_RATE_LIMIT', '0')))
+        # 按表格图像内容+prompt+模型名缓存识别结果，重复转换时跳过远程请求
+        self.cache = table_cache_init()
         logger.info("RapidTableModel (VLM-based) initialized.")
         # slanet_plus_model_path = os.path.join(auto_download_and_get_model_root_path(ModelPath.slanet_plus), ModelPath.slanet_plus)
         # input_args = RapidTableInput(model_type='slanet_plus', model_path=slanet_plus_model_path)
@@ -104,7 +204,7 @@ class RapidTableModel(object):
     def predict(self, image):
         """
         使用大语言模型（VLM）从图片中识别表格并返回HTML。
-        根据配置，此方法可以以流式或非流式方式工作。
+        根据配置，此方法可以以流式或非流式方式工作，失败时按配置退避重试。
 
         Args:
             image: PIL.Image.Image, 输入的表格图片。
@@ -116,134 +216,107 @@ class RapidTableModel(object):
             - logic_points: None (not provided by this model).
             - elapse: A float representing the processing time.
         """
-        logger.info(f"使用大模型解析表格 (流式: {self.stream_request})...")
         start_time = cv2.getTickCount()
 
-        base64_image = encode_image(image)
-
-        prompt = """
-        ## 角色
-        你是一位精通网页设计的科研内容专家，擅长将学术图像中的表格内容准确提取、翻译，并生成语义清晰、结构合理、视觉美观的 HTML 页面代码。
-
-        ## 任务
-        根据提供的学术研究类表格图片，完成以下任务：
-        1. 提取图片中的所有表格内容；
-        2. 特别注意识别因换行或竖排造成的术语断裂；
-        3. 使用语义化的 HTML 标签构建结构清晰的网页表格；
-        4. 输出完整 HTML 代码。
-        5. 特别注意不要把两个靠的比较近的列合并，比如发表年份材料制备方法，不要合并，分成"年份、材料、制备方法"三列
-
-        ## 输出注意点
-        - 表格结构应使用标准 HTML 表格语义标签，包括：
-        - <table> 表格容器；
-        - <thead> 表头区域；
-        - <tbody> 表格主体；
-        - <tr> 表格行；
-        - <th> 表头单元格（加粗、居中）；
-        - <td> 数据单元格（居中）；
-        - 所有内容应忠实还原图片中的行列顺序与数据；
-        - 不得添加任何解释性文字，仅输出 HTML 源代码。
-
-        ## 输出示例
+        cache_key = None
+        if self.cache is not None:
+            cache_key = table_cache_key(image, TABLE_PROMPT, self.model_name)
+            html_code = self.cache.get(cache_key)
+            if html_code is not None:
+                elapse = (cv2.getTickCount() - start_time) / cv2.getTickFrequency()
+                logger.info("表格识别命中缓存")
+                return html_code, None, None, elapse
 
-        ### 正确的输出示例
-        <table>
-        <thead>
-            <tr>
-            <th>Material</th>
-            <th>Property</th>
-            <th>Performance</th>
-            </tr>
-        </thead>
-        <tbody>
-            <tr>
-            <td>Cellulose</td>
-            <td>Thermal Stability</td>
-            <td>High</td>
-            </tr>
-            <tr>
-            <td>Graphene</td>
-            <td>Conductivity</td>
-            <td>Excellent</td>
-            </tr>
-        </tbody>
-        </table>
-        ### 错误的输出示例
-        <h1>表格内容</h1>
-        <p>纤维</p >
-        <p>素</p >
-        <!-- 错误1：未合并换行词语，未翻译 -->
-        <!-- 错误2：使用了不语义化的标签结构 -->
-        """
-        
+        logger.info(f"使用大模型解析表格 (流式: {self.stream_request})...")
         try:
-            if self.stream_request:
-                # --- 流式请求 ---
-                stream = self.client.chat.completions.create(
-                    model="qwen-vl-max-latest",
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            },
-                            {"type": "text", "text": prompt}
-                        ]
-                    }],
-                    stream=True,
-                    max_tokens=4000,
-                )
-
-                html_code_pieces = []
-                for chunk in stream:
-                    content = chunk.choices[0].delta.content
-                    if content is not None:
-                        html_code_pieces.append(content)
-                
-                html_code = "".join(html_code_pieces)
-            
-            else:
-                # --- 非流式请求 ---
-                response = self.client.chat.completions.create(
-                    model="qwen-vl-max-latest",
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            },
-                            {"type": "text", "text": prompt}
-                        ]
-                    }],
-                    stream=False,
-                    max_tokens=4000,
-                )
-                html_code = response.choices[0].message.content
-
-            # 清理返回结果，去除可能的markdown标记
-            if html_code.strip().startswith("```html"):
-                html_code = html_code.strip()[7:].strip()
-                if html_code.endswith("```"):
-                    html_code = html_code[:-3].strip()
-            
+            html_code = self._request_html_with_retry(image)
             elapse = (cv2.getTickCount() - start_time) / cv2.getTickFrequency()
             logger.info(f"大模型解析表格成功，耗时: {elapse:.2f}s")
+            if cache_key is not None and is_complete_table_html(html_code):
+                self.cache.put(cache_key, html_code)
             return html_code, None, None, elapse
-
         except Exception as e:
             logger.error(f"调用大模型解析表格失败: {e}")
-            # 在非流式模式下，我们可能已经有完整的 html_code
-            error_context = ""
-            try:
-                if 'html_code' in locals() and html_code:
-                    error_context = f"模型返回结果: {html_code}"
-            except NameError:
-                pass
-            logger.error(f"调用大模型解析表格失败: {e}. {error_context}")
             return None, None, None, None
+
+    def batch_predict(self, images, concurrency=None):
+        """
+        并发识别多张表格图片，返回结果与images一一对应，每个元素与predict的返回值相同。
+        并发数默认取环境变量DASHSCOPE_TABLE_CONCURRENCY，请求共享同一个限速器。
+        """
+        if len(images) == 0:
+            return []
+        workers = min(concurrency or self.concurrency, len(images))
+        if workers <= 1:
+            results = [self.predict(image) for image in images]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="table_predict") as executor:
+                results = list(executor.map(self.predict, images))
+        if self.cache is not None:
+            logger.info(f"表格识别缓存统计: {self.cache.stats()}")
+        return results
+
+    def _request_html_with_retry(self, image):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return self._request_html(image)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                backoff = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"大模型解析表格失败，{backoff:.1f}s后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(backoff)
+
+    def _request_html(self, image):
+        """发起一次表格识别请求并返回清理后的HTML，失败时抛出异常"""
+        base64_image = encode_image(image)
+        messages = [{
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}"
+                    }
+                },
+                {"type": "text", "text": TABLE_PROMPT}
+            ]
+        }]
+
+        if self.stream_request:
+            # --- 流式请求 ---
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=True,
+                max_tokens=4000,
+                timeout=self.request_timeout,
+            )
+
+            html_code_pieces = []
+            for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    html_code_pieces.append(content)
+
+            html_code = "".join(html_code_pieces)
+
+        else:
+            # --- 非流式请求 ---
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=False,
+                max_tokens=4000,
+                timeout=self.request_timeout,
+            )
+            html_code = response.choices[0].message.content
+
+        # 清理返回结果，去除可能的markdown标记
+        if html_code.strip().startswith("```html"):
+            html_code = html_code.strip()[7:].strip()
+            if html_code.endswith("```"):
+                html_code = html_code[:-3].strip()
+
+        return html_code
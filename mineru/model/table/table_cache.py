@@ -0,0 +1,42 @@
+import hashlib
+import os
+
+from loguru import logger
+
+from mineru.utils.result_cache import SqliteLRUCache
+
+
+def get_table_cache_path():
+    """
+    表格识别结果缓存文件路径，可通过环境变量MINERU_TABLE_CACHE_PATH设置，
+    默认位于~/.cache/mineru/table_cache.sqlite3。
+    """
+    cache_path = os.getenv('MINERU_TABLE_CACHE_PATH')
+    if cache_path:
+        return cache_path
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'table_cache.sqlite3')
+
+
+def table_cache_key(image, prompt, model_name):
+    """按裁剪后表格图像的原始像素、prompt和模型名计算内容寻址的缓存key"""
+    hasher = hashlib.sha256()
+    hasher.update(f"{model_name}\n{image.mode}_{image.width}x{image.height}\n".encode('utf-8'))
+    hasher.update(hashlib.sha256(prompt.encode('utf-8')).digest())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+def table_cache_init():
+    """
+    根据环境变量创建表格识别缓存，MINERU_TABLE_CACHE_ENABLE设置为false时关闭缓存，
+    MINERU_TABLE_CACHE_SIZE_MB设置缓存上限，默认值为512。
+    """
+    if os.getenv('MINERU_TABLE_CACHE_ENABLE', 'true').lower() not in ('true', '1', 't'):
+        return None
+    max_size_bytes = int(float(os.getenv('MINERU_TABLE_CACHE_SIZE_MB', '512')) * 1024 * 1024)
+    cache_path = get_table_cache_path()
+    try:
+        return SqliteLRUCache(cache_path, max_size_bytes, table_name='table_results')
+    except Exception as e:
+        logger.warning(f"表格识别缓存初始化失败，将不使用缓存: {e}")
+        return None
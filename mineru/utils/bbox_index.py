@@ -0,0 +1,70 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+
+
+class BboxIndex:
+    """bbox空间索引。
+
+    按x0排序后用二分查找截断候选区间，再对剩余候选做向量化的相交判断，
+    用于替代span/block之间的全量两两比较。查询结果只保证是"可能相交"的超集
+    (闭区间相交)，精确的重叠比例仍由调用方使用boxbase中的函数计算，保证结果不变。
+    """
+
+    def __init__(self, bboxes):
+        boxes = np.asarray([list(bbox[:4]) for bbox in bboxes], dtype=np.float64).reshape(-1, 4)
+        self.boxes = boxes
+        self.order = np.argsort(boxes[:, 0], kind='stable')
+        self.sorted_boxes = boxes[self.order]
+        self.sorted_x0 = self.sorted_boxes[:, 0]
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def query(self, bbox) -> np.ndarray:
+        """返回与bbox(闭区间)相交的所有box下标，按原始下标升序排列"""
+        if len(self.boxes) == 0:
+            return np.empty(0, dtype=np.int64)
+        x0, y0, x1, y1 = bbox[:4]
+        end = np.searchsorted(self.sorted_x0, x1, side='right')
+        candidates = self.sorted_boxes[:end]
+        mask = (candidates[:, 2] >= x0) & (candidates[:, 1] <= y1) & (candidates[:, 3] >= y0)
+        return np.sort(self.order[:end][mask])
+
+    def overlapping_pairs(self) -> list:
+        """返回每个box的相交候选列表(不含自身)，结果按原始下标升序"""
+        return [
+            [j for j in self.query(bbox).tolist() if j != i]
+            for i, bbox in enumerate(self.boxes)
+        ]
+
+
+class PageGeometryIndex:
+    """页面级span/block几何索引，在page_model_info_to_page_info中构建一次，供各个span与block匹配的步骤共用。
+
+    span索引建立在页面完整的span列表上，后续各步骤传入的spans都是该列表保持原有顺序的子序列，
+    查询时按对象id过滤出当前仍然有效的span，返回顺序与原列表一致。
+    """
+
+    def __init__(self, spans):
+        self.spans = list(spans)
+        self.span_index = BboxIndex([span['bbox'] for span in self.spans])
+        self.blocks = []
+        self.block_count = 0
+        self.block_index = BboxIndex([])
+
+    def set_blocks(self, all_bboxes, all_discarded_blocks):
+        """all_bboxes与all_discarded_blocks拼接后建立block索引，下标小于block_count的属于all_bboxes"""
+        self.blocks = all_bboxes + all_discarded_blocks
+        self.block_count = len(all_bboxes)
+        self.block_index = BboxIndex([block[0:4] for block in self.blocks])
+
+    def query_spans(self, bbox, alive_ids=None) -> list:
+        """返回与bbox可能相交的span，alive_ids不为None时只返回id在其中的span"""
+        spans = [self.spans[i] for i in self.span_index.query(bbox).tolist()]
+        if alive_ids is not None:
+            spans = [span for span in spans if id(span) in alive_ids]
+        return spans
+
+    def query_blocks(self, bbox) -> list:
+        """返回与bbox可能相交的block在blocks中的下标(升序)"""
+        return self.block_index.query(bbox).tolist()
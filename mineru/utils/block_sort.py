@@ -12,13 +12,47 @@ from mineru.utils.enum_class import BlockType, ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
 
 
+# layoutreader最高支持510line(layout_reader.MAX_LEN)，超过该行数的页面使用xycut排序
+LAYOUTREADER_MAX_LINES = 510
+LAYOUTREADER_BASE_BATCH_SIZE = 16
+
+
 def sort_blocks_by_bbox(blocks, page_w, page_h, footnote_blocks):
 
+    """获取所有line并对line排序"""
+    reading_order_job = prepare_reading_order(blocks, page_w, page_h, footnote_blocks)
+    orders = predict_reading_orders([reading_order_job['boxes']])[0]
+
+    return finish_reading_order(reading_order_job, orders)
+
+
+def prepare_reading_order(blocks, page_w, page_h, footnote_blocks):
+    """
+    阅读顺序预测的准备阶段：收集页面的line并转换为layoutreader的输入boxes。
+    与模型推理解耦，便于把多个页面/文档的预测合并成batch。
+    """
+
     """获取所有line并计算正文line的高度"""
     line_height = get_line_height(blocks)
 
-    """获取所有line并对line排序"""
-    sorted_bboxes = sort_lines_by_model(blocks, page_w, page_h, line_height, footnote_blocks)
+    page_line_list = get_page_lines(blocks, page_w, page_h, line_height, footnote_blocks)
+    if len(page_line_list) > LAYOUTREADER_MAX_LINES:
+        logger.warning(f'page lines: {len(page_line_list)} > {LAYOUTREADER_MAX_LINES}, use xycut to sort blocks')
+        boxes = None
+    else:
+        boxes = lines_to_layoutreader_boxes(page_line_list, page_w, page_h)
+
+    return {'blocks': blocks, 'page_line_list': page_line_list, 'boxes': boxes}
+
+
+def finish_reading_order(reading_order_job, orders):
+    """根据预测的line顺序(为None时使用xycut)计算block顺序并完成排序"""
+    blocks = reading_order_job['blocks']
+    if orders is not None:
+        page_line_list = reading_order_job['page_line_list']
+        sorted_bboxes = [page_line_list[i] for i in orders]
+    else:
+        sorted_bboxes = None
 
     """根据line的中位数算block的序列关系"""
     blocks = cal_block_index(blocks, sorted_bboxes)
@@ -37,6 +71,32 @@ def sort_blocks_by_bbox(blocks, page_w, page_h, footnote_blocks):
     return sorted_blocks
 
 
+def predict_reading_orders(boxes_list, batch_size=None):
+    """
+    批量预测多个页面的line阅读顺序，boxes为None的页面返回None(使用xycut)。
+    按line数排序后分桶组batch以减少padding，batch大小可通过环境变量
+    MINERU_LAYOUTREADER_BATCH_SIZE设置。
+    """
+    orders_list = [None if boxes is None else [] for boxes in boxes_list]
+    valid_indices = [i for i, boxes in enumerate(boxes_list) if boxes]
+    if len(valid_indices) == 0:
+        return orders_list
+
+    if batch_size is None:
+        batch_size = int(os.getenv('MINERU_LAYOUTREADER_BATCH_SIZE', LAYOUTREADER_BASE_BATCH_SIZE))
+
+    valid_indices.sort(key=lambda i: len(boxes_list[i]))
+    model_manager = ModelSingleton()
+    model = model_manager.get_model('layoutreader')
+    with torch.no_grad():
+        for start in range(0, len(valid_indices), batch_size):
+            batch_indices = valid_indices[start:start + batch_size]
+            batch_orders = do_batch_predict([boxes_list[i] for i in batch_indices], model)
+            for index, orders in zip(batch_indices, batch_orders):
+                orders_list[index] = orders
+    return orders_list
+
+
 def get_line_height(blocks):
     page_line_height_list = []
     for block in blocks:
@@ -54,7 +114,7 @@ def get_line_height(blocks):
         return 10
 
 
-def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+def get_page_lines(fix_blocks, page_w, page_h, line_height, footnote_blocks):
     page_line_list = []
 
     def add_lines_to_block(b):
@@ -87,9 +147,10 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
         footnote_block = {'bbox': block[:4]}
         add_lines_to_block(footnote_block)
 
-    if len(page_line_list) > 200:  # layoutreader最高支持512line
-        return None
+    return page_line_list
+
 
+def lines_to_layoutreader_boxes(page_line_list, page_w, page_h):
     # 使用layoutreader排序
     x_scale = 1000.0 / page_w
     y_scale = 1000.0 / page_h
@@ -125,13 +186,8 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
             1000 >= right >= left >= 0 and 1000 >= bottom >= top >= 0
         ), f'Invalid box. right: {right}, left: {left}, bottom: {bottom}, top: {top}'  # noqa: E126, E121
         boxes.append([left, top, right, bottom])
-    model_manager = ModelSingleton()
-    model = model_manager.get_model('layoutreader')
-    with torch.no_grad():
-        orders = do_predict(boxes, model)
-    sorted_bboxes = [page_line_list[i] for i in orders]
 
-    return sorted_bboxes
+    return boxes
 
 
 def insert_lines_into_block(block_bbox, line_height, page_w, page_h):
@@ -225,17 +281,17 @@ class ModelSingleton:
         return self._models[model_name]
 
 
-def do_predict(boxes: List[List[int]], model) -> List[int]:
+def do_batch_predict(boxes_list: List[List[List[int]]], model) -> List[List[int]]:
     from mineru.model.reading_order.layout_reader import (
-        boxes2inputs, parse_logits, prepare_inputs)
+        boxes2batch_inputs, parse_logits, prepare_inputs)
 
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
 
-        inputs = boxes2inputs(boxes)
+        inputs = boxes2batch_inputs(boxes_list)
         inputs = prepare_inputs(inputs, model)
-        logits = model(**inputs).logits.cpu().squeeze(0)
-    return parse_logits(logits, len(boxes))
+        logits = model(**inputs).logits.cpu()
+    return [parse_logits(logits[i], len(boxes)) for i, boxes in enumerate(boxes_list)]
 
 
 def cal_block_index(fix_blocks, sorted_bboxes):
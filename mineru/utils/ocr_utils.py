@@ -408,4 +408,65 @@ def get_rotate_crop_image(img, points):
     dst_img_height, dst_img_width = dst_img.shape[0:2]
     if dst_img_height * 1.0 / dst_img_width >= 1.5:
         dst_img = np.rot90(dst_img)
-    return dst_img
\ No newline at end of file
+    return dst_img
+
+def pack_ocr_det_canvases(shapes, stride=32, max_pad_ratio=0.3, max_canvas_side=None):
+    """
+    将OCR检测的裁剪图按尺寸装箱到少量画布尺寸中，减少batch分组数量。
+
+    每张图的尺寸先向上取整到stride的倍数，按从大到小的顺序依次处理：能放入已有画布且
+    padding占比不超过max_pad_ratio时放入padding最少的画布，否则以自身对齐后的尺寸新建画布。
+    检测模型会对长边超过max_canvas_side的图像做缩放，为了不改变缩放比例，
+    超过该尺寸的画布只接收对齐后尺寸完全相同的图像。
+
+    Args:
+        shapes: [(h, w), ...] 裁剪图尺寸
+        stride: 画布尺寸对齐的倍数
+        max_pad_ratio: 单张图在画布中允许的最大padding面积占比
+        max_canvas_side: 可合并画布的最大边长，None表示不合并不同尺寸的图像
+
+    Returns:
+        [((canvas_h, canvas_w), [原始下标, ...]), ...]
+    """
+    def align(x):
+        return max(((x + stride - 1) // stride) * stride, stride)
+
+    aligned = [(align(h), align(w)) for h, w in shapes]
+    order = sorted(range(len(shapes)), key=lambda i: (aligned[i][0], aligned[i][1]), reverse=True)
+
+    canvases = []
+    for i in order:
+        h, w = shapes[i]
+        aligned_h, aligned_w = aligned[i]
+        mergeable = max_canvas_side is not None and max(aligned_h, aligned_w) <= max_canvas_side
+        best_canvas, best_pad_ratio = None, None
+        for canvas in canvases:
+            canvas_h, canvas_w = canvas[0]
+            if (canvas_h, canvas_w) == (aligned_h, aligned_w):
+                best_canvas = canvas
+                break
+            if not mergeable or max(canvas_h, canvas_w) > max_canvas_side:
+                continue
+            if canvas_h < aligned_h or canvas_w < aligned_w:
+                continue
+            pad_ratio = 1 - (h * w) / (canvas_h * canvas_w)
+            if pad_ratio <= max_pad_ratio and (best_pad_ratio is None or pad_ratio < best_pad_ratio):
+                best_canvas, best_pad_ratio = canvas, pad_ratio
+        if best_canvas is None:
+            best_canvas = ((aligned_h, aligned_w), [])
+            canvases.append(best_canvas)
+        best_canvas[1].append(i)
+
+    for canvas in canvases:
+        canvas[1].sort()
+    return canvases
+
+
+def build_padded_batch(images, canvas_shape, pad_value=255):
+    """把同一画布中的图像一次性拷贝到预分配的uint8 batch缓冲区中(左上角对齐)"""
+    canvas_h, canvas_w = canvas_shape
+    batch = np.full((len(images), canvas_h, canvas_w, 3), pad_value, dtype=np.uint8)
+    for index, img in enumerate(images):
+        h, w = img.shape[:2]
+        batch[index, :h, :w] = img
+    return batch
@@ -1,4 +1,5 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import hashlib
 from io import BytesIO
 
 import pypdfium2 as pdfium
@@ -6,28 +7,53 @@ from loguru import logger
 from PIL import Image
 
 from mineru.data.data_reader_writer import FileBasedDataWriter
-from mineru.utils.pdf_reader import image_to_b64str, image_to_bytes, page_to_image
+from mineru.utils.pdf_reader import image_to_b64str, image_to_bytes, page_to_image, render_pages_parallel, \
+    get_render_workers, PARALLEL_RENDER_MIN_PAGES
 from .hash_utils import str_sha256
 
 
+class LazyImageDict(dict):
+    """页面图像字典，img_base64与img_md5在首次访问时才计算。
+
+    pipeline后端只需要页面标识，不再为每页做PNG编码；VLM等需要编码图像的调用方
+    访问img_base64时才会触发编码，结果会被缓存。
+    """
+
+    def __missing__(self, key):
+        if key == "img_base64":
+            value = image_to_b64str(self["img_pil"])
+        elif key == "img_md5":
+            value = pil_img_md5(self["img_pil"])
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+
+def pil_img_md5(pil_img: Image.Image) -> str:
+    """基于原始位图缓冲区计算页面图像的md5，代价远低于PNG编码后再哈希"""
+    hasher = hashlib.md5()
+    hasher.update(f"{pil_img.mode}_{pil_img.width}x{pil_img.height}".encode("utf-8"))
+    hasher.update(pil_img.tobytes())
+    return hasher.hexdigest()
+
+
 def pdf_page_to_image(page: pdfium.PdfPage, dpi=200) -> dict:
-    """Convert pdfium.PdfDocument to image, Then convert the image to base64.
+    """Convert pdfium.PdfPage to image.
 
     Args:
         page (_type_): pdfium.PdfPage
         dpi (int, optional): reset the dpi of dpi. Defaults to 200.
 
     Returns:
-        dict:  {'img_base64': str, 'img_pil': pil_img, 'scale': float }
+        dict:  {'img_pil': pil_img, 'scale': float }, 'img_base64' and 'img_md5' are computed lazily on access
     """
     pil_img, scale = page_to_image(page, dpi=dpi)
-    img_base64 = image_to_b64str(pil_img)
 
-    image_dict = {
-        "img_base64": img_base64,
-        "img_pil": pil_img,
-        "scale": scale,
-    }
+    image_dict = LazyImageDict(
+        img_pil=pil_img,
+        scale=scale,
+    )
     return image_dict
 
 
@@ -37,23 +63,46 @@ def load_images_from_pdf(
     start_page_id=0,
     end_page_id=None,
 ):
-    images_list = []
     pdf_doc = pdfium.PdfDocument(pdf_bytes)
-    pdf_page_num = len(pdf_doc)
-    end_page_id = end_page_id if end_page_id is not None and end_page_id >= 0 else pdf_page_num - 1
-    if end_page_id > pdf_page_num - 1:
-        logger.warning("end_page_id is out of range, use images length")
-        end_page_id = pdf_page_num - 1
-
-    for index in range(0, pdf_page_num):
-        if start_page_id <= index <= end_page_id:
-            page = pdf_doc[index]
-            image_dict = pdf_page_to_image(page, dpi=dpi)
-            images_list.append(image_dict)
-
+    images_list = load_images_from_pdf_doc(pdf_doc, dpi, start_page_id, end_page_id, pdf_bytes=pdf_bytes)
     return images_list, pdf_doc
 
 
+def load_images_from_pdf_doc(
+    pdf_doc: pdfium.PdfDocument,
+    dpi=200,
+    start_page_id=0,
+    end_page_id=None,
+    pdf_bytes: bytes = None,
+    page_indices: list = None,
+):
+    """从已打开的pdf_doc中渲染[start_page_id, end_page_id]范围内的页面，便于按窗口分段渲染。
+    传入page_indices时只渲染其中的页面(可以不连续)，忽略start_page_id和end_page_id。
+    传入pdf_bytes且页数足够多时，使用多进程并行渲染。"""
+    if page_indices is None:
+        pdf_page_num = len(pdf_doc)
+        end_page_id = end_page_id if end_page_id is not None and end_page_id >= 0 else pdf_page_num - 1
+        if end_page_id > pdf_page_num - 1:
+            logger.warning("end_page_id is out of range, use images length")
+            end_page_id = pdf_page_num - 1
+
+        page_indices = list(range(start_page_id, end_page_id + 1))
+    num_workers = get_render_workers()
+    if pdf_bytes is not None and num_workers > 1 and len(page_indices) >= PARALLEL_RENDER_MIN_PAGES:
+        return [
+            LazyImageDict(img_pil=pil_img, scale=scale)
+            for pil_img, scale in render_pages_parallel(pdf_bytes, page_indices, dpi=dpi, num_workers=num_workers)
+        ]
+
+    images_list = []
+    for index in page_indices:
+        page = pdf_doc[index]
+        image_dict = pdf_page_to_image(page, dpi=dpi)
+        images_list.append(image_dict)
+
+    return images_list
+
+
 def cut_image(bbox: tuple, page_num: int, page_pil_img, return_path, image_writer: FileBasedDataWriter, scale=2):
     """从第page_num页的page中，根据bbox进行裁剪出一张jpg图片，返回图片路径 save_path：需要同时支持s3和本地,
     图片存放在save_path下，文件名是:
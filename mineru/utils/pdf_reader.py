@@ -1,8 +1,15 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import base64
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
+from multiprocessing import shared_memory
 from typing import Union, Optional
 
+import numpy as np
 from loguru import logger
 from PIL import Image
 from pypdfium2 import PdfBitmap, PdfDocument, PdfPage
@@ -30,6 +37,217 @@ def page_to_image(
     return image, scale
 
 
+# 页数少于该值时直接在当前进程渲染，避免进程池调度开销
+PARALLEL_RENDER_MIN_PAGES = 8
+
+_render_executor = None
+_render_executor_workers = 0
+_render_release_barrier = None
+# 每次渲染结束时各工作进程释放已打开文档的等待上限(秒)
+RENDER_RELEASE_TIMEOUT = 5
+
+
+def get_render_workers() -> int:
+    """
+    页面渲染进程数，可通过环境变量MINERU_PDF_RENDER_WORKERS设置，
+    默认值为min(cpu核数, 8)，设置为1则关闭多进程渲染。
+    """
+    render_workers = os.getenv('MINERU_PDF_RENDER_WORKERS')
+    if render_workers is not None:
+        return max(1, int(render_workers))
+    return min(os.cpu_count() or 1, 8)
+
+
+def _get_render_executor(num_workers: int) -> ProcessPoolExecutor:
+    global _render_executor, _render_executor_workers, _render_release_barrier
+    if _render_executor is None or _render_executor_workers != num_workers:
+        if _render_executor is not None:
+            _render_executor.shutdown(wait=True)
+        # spawn避免在已加载pdfium/torch的进程中fork
+        mp_context = multiprocessing.get_context('spawn')
+        _render_release_barrier = mp_context.Barrier(num_workers)
+        _render_executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=mp_context,
+            initializer=_init_render_worker,
+            initargs=(_render_release_barrier,),
+        )
+        _render_executor_workers = num_workers
+    return _render_executor
+
+
+_worker_document = None
+_worker_release_barrier = None
+
+
+def _init_render_worker(release_barrier):
+    global _worker_release_barrier
+    _worker_release_barrier = release_barrier
+
+
+def _release_worker_document():
+    """
+    工作进程：关闭本次渲染打开的文档并释放pdf字节的副本，随后在屏障处等待其余进程，
+    保证同时提交的num_workers个释放任务分别落在不同的工作进程上。
+    """
+    global _worker_document
+    if _worker_document is not None:
+        _worker_document[1].close()
+        _worker_document = None
+    try:
+        _worker_release_barrier.wait(timeout=RENDER_RELEASE_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+
+
+def _release_render_workers(executor: ProcessPoolExecutor, num_workers: int):
+    """
+    渲染结束后让每个工作进程关闭缓存的文档：常驻进程池不会在调用之间保留上一份pdf，
+    同一路径的文件被原地修改后再次渲染也不会读到旧文档。
+    """
+    if _render_release_barrier.broken:
+        _render_release_barrier.reset()
+    try:
+        futures = [executor.submit(_release_worker_document) for _ in range(num_workers)]
+    except BrokenProcessPool:
+        return
+    wait(futures)
+
+
+def _open_worker_document(pdf_source):
+    """
+    工作进程：打开pdf_source指向的文档，同一次渲染的后续页面复用已打开的文档，渲染结束时由_release_worker_document关闭。
+    pdf_source为文件路径，或(共享内存名, 字节数)——pdf字节只由主进程写入一份共享内存，不随每个任务pickle。
+    """
+    global _worker_document
+    if _worker_document is not None and _worker_document[0] == pdf_source:
+        return _worker_document[1]
+    if _worker_document is not None:
+        _worker_document[1].close()
+        _worker_document = None
+    if isinstance(pdf_source, tuple):
+        shm_name, size = pdf_source
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            pdf = shm.buf[:size].tobytes()
+        finally:
+            shm.close()
+    else:
+        pdf = pdf_source
+    _worker_document = (pdf_source, PdfDocument(pdf))
+    return _worker_document[1]
+
+
+def _render_page_to_shm(pdf_source, index: int, dpi: int, max_width_or_height: int) -> tuple:
+    """工作进程：渲染一页并将像素写入共享内存，只回传共享内存描述信息"""
+    image, scale = page_to_image(_open_worker_document(pdf_source)[index], dpi, max_width_or_height)
+    image_array = np.asarray(image)
+    shm = shared_memory.SharedMemory(create=True, size=max(image_array.nbytes, 1))
+    try:
+        np.ndarray(image_array.shape, dtype=image_array.dtype, buffer=shm.buf)[:] = image_array
+    finally:
+        shm.close()
+    return index, shm.name, image_array.shape, image_array.dtype.str, image.mode, scale
+
+
+def _image_from_shm(shm_name: str, shape: tuple, dtype: str, mode: str) -> Image.Image:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        image = Image.frombytes(mode, (shape[1], shape[0]), shm.buf[:nbytes])
+    finally:
+        shm.close()
+        shm.unlink()
+    return image
+
+
+def _discard_shm(shm_name: str):
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _render_pages_serial(pdf: Union[str, bytes], page_indices: list[int], dpi: int, max_width_or_height: int):
+    doc = PdfDocument(pdf)
+    try:
+        return [page_to_image(doc[i], dpi, max_width_or_height) for i in page_indices]
+    finally:
+        doc.close()
+
+
+def render_pages_parallel(
+    pdf: Union[str, bytes],
+    page_indices: list[int],
+    dpi: int = 144,
+    max_width_or_height: int = 2560,
+    num_workers: Optional[int] = None,
+) -> list[tuple[Image.Image, float]]:
+    """
+    多进程渲染pdf页面，每页一个任务，同时在途的任务不超过2倍进程数，完成一页就从共享内存取回一页，
+    渲染结果经共享内存传回而不是pickle PIL图像。返回顺序与page_indices一致。
+    共享内存不可用(OSError)时退回当前进程串行渲染。
+    """
+    if num_workers is None:
+        num_workers = get_render_workers()
+    num_workers = min(num_workers, len(page_indices))
+
+    if num_workers <= 1:
+        return _render_pages_serial(pdf, page_indices, dpi, max_width_or_height)
+
+    pdf_shm = None
+    rendered = {}
+    try:
+        if isinstance(pdf, str):
+            pdf_source = pdf
+        else:
+            pdf_shm = shared_memory.SharedMemory(create=True, size=max(len(pdf), 1))
+            pdf_shm.buf[:len(pdf)] = pdf
+            pdf_source = (pdf_shm.name, len(pdf))
+        _render_pages_with_executor(pdf_source, page_indices, dpi, max_width_or_height, num_workers, rendered)
+    except OSError as e:
+        logger.warning(f"shared memory unavailable, render remaining pages serially: {e}")
+        missing = [i for i in page_indices if i not in rendered]
+        rendered.update(zip(missing, _render_pages_serial(pdf, missing, dpi, max_width_or_height)))
+    finally:
+        if pdf_shm is not None:
+            pdf_shm.close()
+            pdf_shm.unlink()
+    return [rendered[i] for i in page_indices]
+
+
+def _render_pages_with_executor(pdf_source, page_indices, dpi, max_width_or_height, num_workers, rendered):
+    """按页提交渲染任务，结果写入rendered；无论是否出错，所有已完成任务报告的共享内存都会被释放"""
+    executor = _get_render_executor(num_workers)
+    max_in_flight = num_workers * 2
+    pending_indices = iter(page_indices)
+    in_flight = set()
+    try:
+        while True:
+            for index in pending_indices:
+                in_flight.add(executor.submit(_render_page_to_shm, pdf_source, index, dpi, max_width_or_height))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                index, shm_name, shape, dtype, mode, scale = future.result()
+                rendered[index] = (_image_from_shm(shm_name, shape, dtype, mode), scale)
+    finally:
+        # 出错时取消未开始的任务，并释放已经在运行的任务写出的共享内存
+        for future in in_flight:
+            future.cancel()
+        for future in in_flight:
+            if future.cancelled() or future.exception() is not None:
+                continue
+            _discard_shm(future.result()[1])
+        _release_render_workers(executor, num_workers)
+
+
 def image_to_bytes(
     image: Image.Image,
     image_format: str = "PNG",  # 也可以用 "JPEG"
@@ -62,9 +280,15 @@ def pdf_to_images(
         logger.warning("end_page_id is out of range, use images length")
         end_page_id = page_num - 1
 
+    page_indices = list(range(start_page_id, end_page_id + 1))
+    num_workers = get_render_workers()
+    if not isinstance(pdf, PdfDocument) and num_workers > 1 and len(page_indices) >= PARALLEL_RENDER_MIN_PAGES:
+        doc.close()
+        return [image for image, _ in render_pages_parallel(pdf, page_indices, dpi, max_width_or_height, num_workers)]
+
     images = []
     try:
-        for i in range(start_page_id, end_page_id + 1):
+        for i in page_indices:
             image, _ = page_to_image(doc[i], dpi, max_width_or_height)
             images.append(image)
     finally:
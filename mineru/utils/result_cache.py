@@ -0,0 +1,163 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from loguru import logger
+
+"""get命中后刷新的访问时间先记在内存中，累计到该数量或下一次put时再批量写入，避免每次读取都提交一次事务"""
+ACCESS_FLUSH_BATCH = 256
+
+_open_caches = weakref.WeakSet()
+
+
+def flush_all_caches():
+    """把所有缓存中尚未写入的访问时间写回数据库，转换结束时和进程退出时调用"""
+    for cache in list(_open_caches):
+        try:
+            cache.flush()
+        except sqlite3.Error as e:
+            logger.warning(f"缓存访问时间写回失败({cache.cache_path}): {e}")
+
+
+atexit.register(flush_all_caches)
+
+
+class SqliteLRUCache(object):
+    """基于SQLite的key-文本结果持久化缓存，用于缓存表格、公式等模型识别结果。
+
+    按总字节数做LRU淘汰，每次命中刷新访问时间；线程安全，可在并发识别中共享。
+    总字节数保存在单行的meta表中，与写入在同一个事务内更新，put时不需要扫描全表；
+    只有超出上限时才按访问时间顺序淘汰。size列排在value之前，读取size时不必访问value的溢出页。
+    """
+
+    def __init__(self, cache_path, max_size_bytes, table_name='result_cache'):
+        self.cache_path = cache_path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._table = table_name
+        self._meta_table = f'{table_name}_meta'
+        self._pending_access = {}
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._table} ('
+                'key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL, value TEXT NOT NULL)'
+            )
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_{self._table}_last_access ON {self._table}(last_access)'
+            )
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._meta_table} ('
+                'id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)'
+            )
+            self._conn.execute(
+                f'INSERT OR IGNORE INTO {self._meta_table} (id, total_size) '
+                f'SELECT 0, COALESCE(SUM(size), 0) FROM {self._table}'
+            )
+        _open_caches.add(self)
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(f'SELECT value FROM {self._table} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_access[key] = time.time()
+            if len(self._pending_access) >= ACCESS_FLUSH_BATCH:
+                with self._transaction():
+                    self._flush_access()
+            return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_size_bytes:
+            return
+        with self._lock, self._transaction():
+            self._flush_access()
+            row = self._conn.execute(f'SELECT size FROM {self._table} WHERE key = ?', (key,)).fetchone()
+            old_size = row[0] if row is not None else 0
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self._table} (key, size, last_access, value) VALUES (?, ?, ?, ?)',
+                (key, size, time.time(), value),
+            )
+            self._conn.execute(
+                f'UPDATE {self._meta_table} SET total_size = total_size + ? WHERE id = 0', (size - old_size,)
+            )
+            self._evict()
+
+    def _flush_access(self):
+        if self._pending_access:
+            self._conn.executemany(
+                f'UPDATE {self._table} SET last_access = ? WHERE key = ?',
+                [(access_time, key) for key, access_time in self._pending_access.items()],
+            )
+            self._pending_access.clear()
+
+    def _total_size(self):
+        return self._conn.execute(f'SELECT total_size FROM {self._meta_table} WHERE id = 0').fetchone()[0]
+
+    def _evict(self):
+        total_size = self._total_size()
+        if total_size <= self.max_size_bytes:
+            return
+        evict_keys = []
+        evicted_size = 0
+        for key, size in self._conn.execute(f'SELECT key, size FROM {self._table} ORDER BY last_access ASC'):
+            if total_size - evicted_size <= self.max_size_bytes:
+                break
+            evict_keys.append((key,))
+            evicted_size += size
+        self._conn.executemany(f'DELETE FROM {self._table} WHERE key = ?', evict_keys)
+        self._conn.execute(
+            f'UPDATE {self._meta_table} SET total_size = total_size - ? WHERE id = 0', (evicted_size,)
+        )
+        self.evictions += len(evict_keys)
+
+    def flush(self):
+        """把内存中尚未写入的访问时间写回数据库"""
+        with self._lock:
+            if not self._pending_access:
+                return
+            with self._transaction():
+                self._flush_access()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(f'SELECT COUNT(*) FROM {self._table}').fetchone()[0]
+            total_size = self._total_size()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_bytes': total_size,
+        }
+
+
+class _Transaction(object):
+    """BEGIN IMMEDIATE事务，异常时回滚，多个进程共用同一缓存文件时meta表中的总字节数保持一致"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
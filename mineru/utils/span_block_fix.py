@@ -1,11 +1,19 @@
 # Copyright (c) Opendatalab. All rights reserved.
+from mineru.utils.bbox_index import PageGeometryIndex
 from mineru.utils.boxbase import calculate_overlap_area_in_bbox1_area_ratio
 from mineru.utils.enum_class import BlockType, ContentType
 from mineru.utils.ocr_utils import __is_overlaps_y_exceeds_threshold
 
 
-def fill_spans_in_blocks(blocks, spans, radio):
-    """将allspans中的span按位置关系，放入blocks中."""
+def fill_spans_in_blocks(blocks, spans, radio, geometry_index=None):
+    """将allspans中的span按位置关系，放入blocks中.
+
+    geometry_index为页面级几何索引，spans需要是建立索引时span列表的保序子序列；未传入时按spans现建。
+    """
+    if geometry_index is None:
+        geometry_index = PageGeometryIndex(spans)
+    alive_ids = {id(span) for span in spans}
+
     block_with_spans = []
     for block in blocks:
         block_type = block[7]
@@ -20,7 +28,7 @@ def fill_spans_in_blocks(blocks, spans, radio):
         ]:
             block_dict['group_id'] = block[-1]
         block_spans = []
-        for span in spans:
+        for span in geometry_index.query_spans(block_bbox, alive_ids):
             span_bbox = span['bbox']
             if calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > radio and span_block_type_compatible(
                     span['type'], block_type):
@@ -30,10 +38,10 @@ def fill_spans_in_blocks(blocks, spans, radio):
         block_with_spans.append(block_dict)
 
         # 从spans删除已经放入block_spans中的span
-        if len(block_spans) > 0:
-            for span in block_spans:
-                spans.remove(span)
+        for span in block_spans:
+            alive_ids.discard(id(span))
 
+    spans[:] = [span for span in spans if id(span) in alive_ids]
     return block_with_spans, spans
 
 
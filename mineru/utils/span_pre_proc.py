@@ -6,6 +6,7 @@ import cv2
 import numpy as np
 from loguru import logger
 
+from mineru.utils.bbox_index import BboxIndex, PageGeometryIndex
 from mineru.utils.boxbase import calculate_overlap_area_in_bbox1_area_ratio, calculate_iou, \
     get_minbox_if_overlap_by_ratio
 from mineru.utils.enum_class import BlockType, ContentType
@@ -13,20 +14,12 @@ from mineru.utils.pdf_image_tools import get_crop_img
 from mineru.utils.pdf_text_tool import get_page
 
 
-def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
-    def get_block_bboxes(blocks, block_type_list):
-        return [block[0:4] for block in blocks if block[7] in block_type_list]
-
-    image_bboxes = get_block_bboxes(all_bboxes, [BlockType.IMAGE_BODY])
-    table_bboxes = get_block_bboxes(all_bboxes, [BlockType.TABLE_BODY])
-    other_block_type = []
-    for block_type in BlockType.__dict__.values():
-        if not isinstance(block_type, str):
-            continue
-        if block_type not in [BlockType.IMAGE_BODY, BlockType.TABLE_BODY]:
-            other_block_type.append(block_type)
-    other_block_bboxes = get_block_bboxes(all_bboxes, other_block_type)
-    discarded_block_bboxes = get_block_bboxes(all_discarded_blocks, [BlockType.DISCARDED])
+def remove_outside_spans(spans, all_bboxes, all_discarded_blocks, geometry_index=None):
+    if geometry_index is None:
+        geometry_index = PageGeometryIndex(spans)
+        geometry_index.set_blocks(all_bboxes, all_discarded_blocks)
+    blocks = geometry_index.blocks
+    block_count = geometry_index.block_count
 
     new_spans = []
 
@@ -34,6 +27,22 @@ def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
         span_bbox = span['bbox']
         span_type = span['type']
 
+        discarded_block_bboxes = []
+        image_bboxes = []
+        table_bboxes = []
+        other_block_bboxes = []
+        for block_index in geometry_index.query_blocks(span_bbox):
+            block = blocks[block_index]
+            if block_index >= block_count:
+                if block[7] == BlockType.DISCARDED:
+                    discarded_block_bboxes.append(block[0:4])
+            elif block[7] == BlockType.IMAGE_BODY:
+                image_bboxes.append(block[0:4])
+            elif block[7] == BlockType.TABLE_BODY:
+                table_bboxes.append(block[0:4])
+            else:
+                other_block_bboxes.append(block[0:4])
+
         if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.4 for block_bbox in
                discarded_block_bboxes):
             new_spans.append(span)
@@ -55,52 +64,95 @@ def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
     return new_spans
 
 
+def _span_equal_classes(spans):
+    """按值相等(dict ==)给spans划分等价类，返回每个span的类编号。
+
+    相等的span其bbox必然相等，因此只需在bbox相同的分组内两两比较。
+    """
+    class_ids = [0] * len(spans)
+    groups = {}
+    next_class_id = 0
+    for index, span in enumerate(spans):
+        bbox = span['bbox']
+        group = groups.setdefault((isinstance(bbox, list), tuple(bbox)), [])
+        for member_index in group:
+            if spans[member_index] == span:
+                class_ids[index] = class_ids[member_index]
+                break
+        else:
+            class_ids[index] = next_class_id
+            next_class_id += 1
+        group.append(index)
+    return class_ids
+
+
+def _remove_dropped_spans(spans, class_ids, dropped_classes):
+    """等价于对每个dropped span执行一次spans.remove: 删除每个被丢弃等价类中下标最小的那个span"""
+    new_spans = []
+    removed_classes = set()
+    for index, span in enumerate(spans):
+        class_id = class_ids[index]
+        if class_id in dropped_classes and class_id not in removed_classes:
+            removed_classes.add(class_id)
+            continue
+        new_spans.append(span)
+    return new_spans
+
+
 def remove_overlaps_low_confidence_spans(spans):
     dropped_spans = []
+    dropped_classes = set()
+    class_ids = _span_equal_classes(spans)
+    candidates_list = BboxIndex([span['bbox'] for span in spans]).overlapping_pairs()
     #  删除重叠spans中置信度低的的那些
-    for span1 in spans:
-        for span2 in spans:
-            if span1 != span2:
-                # span1 或 span2 任何一个都不应该在 dropped_spans 中
-                if span1 in dropped_spans or span2 in dropped_spans:
-                    continue
+    for i, span1 in enumerate(spans):
+        for j in candidates_list[i]:
+            # span1 或 span2 任何一个都不应该在 dropped_spans 中
+            if class_ids[i] in dropped_classes:
+                break
+            if class_ids[i] == class_ids[j] or class_ids[j] in dropped_classes:
+                continue
+            span2 = spans[j]
+            if calculate_iou(span1['bbox'], span2['bbox']) > 0.9:
+                if span1['score'] < span2['score']:
+                    span_need_remove, remove_class_id = span1, class_ids[i]
                 else:
-                    if calculate_iou(span1['bbox'], span2['bbox']) > 0.9:
-                        if span1['score'] < span2['score']:
-                            span_need_remove = span1
-                        else:
-                            span_need_remove = span2
-                        if (
-                            span_need_remove is not None
-                            and span_need_remove not in dropped_spans
-                        ):
-                            dropped_spans.append(span_need_remove)
+                    span_need_remove, remove_class_id = span2, class_ids[j]
+                dropped_spans.append(span_need_remove)
+                dropped_classes.add(remove_class_id)
 
     if len(dropped_spans) > 0:
-        for span_need_remove in dropped_spans:
-            spans.remove(span_need_remove)
+        spans[:] = _remove_dropped_spans(spans, class_ids, dropped_classes)
 
     return spans, dropped_spans
 
 
 def remove_overlaps_min_spans(spans):
     dropped_spans = []
+    dropped_classes = set()
+    class_ids = _span_equal_classes(spans)
+    # bbox值 -> 第一个拥有该bbox的span下标
+    first_index_by_bbox = {}
+    for index, span in enumerate(spans):
+        bbox = span['bbox']
+        first_index_by_bbox.setdefault((isinstance(bbox, list), tuple(bbox)), index)
+    candidates_list = BboxIndex([span['bbox'] for span in spans]).overlapping_pairs()
     #  删除重叠spans中较小的那些
-    for span1 in spans:
-        for span2 in spans:
-            if span1 != span2:
-                # span1 或 span2 任何一个都不应该在 dropped_spans 中
-                if span1 in dropped_spans or span2 in dropped_spans:
-                    continue
-                else:
-                    overlap_box = get_minbox_if_overlap_by_ratio(span1['bbox'], span2['bbox'], 0.65)
-                    if overlap_box is not None:
-                        span_need_remove = next((span for span in spans if span['bbox'] == overlap_box), None)
-                        if span_need_remove is not None and span_need_remove not in dropped_spans:
-                            dropped_spans.append(span_need_remove)
+    for i, span1 in enumerate(spans):
+        for j in candidates_list[i]:
+            # span1 或 span2 任何一个都不应该在 dropped_spans 中
+            if class_ids[i] in dropped_classes:
+                break
+            if class_ids[i] == class_ids[j] or class_ids[j] in dropped_classes:
+                continue
+            overlap_box = get_minbox_if_overlap_by_ratio(span1['bbox'], spans[j]['bbox'], 0.65)
+            if overlap_box is not None:
+                remove_index = first_index_by_bbox[(isinstance(overlap_box, list), tuple(overlap_box))]
+                if class_ids[remove_index] not in dropped_classes:
+                    dropped_spans.append(spans[remove_index])
+                    dropped_classes.add(class_ids[remove_index])
     if len(dropped_spans) > 0:
-        for span_need_remove in dropped_spans:
-            spans.remove(span_need_remove)
+        spans[:] = _remove_dropped_spans(spans, class_ids, dropped_classes)
 
     return spans, dropped_spans
 
@@ -119,7 +171,7 @@ def __replace_unicode(text: str):
 
 
 """pdf_text dict方案 char级别"""
-def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded_blocks):
+def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded_blocks, geometry_index=None):
 
     page_dict = get_page(pdf_page)
 
@@ -152,15 +204,19 @@ def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded
     unuseful_spans = []
     # 纵向span的两个特征：1. 高度超过多个line 2. 高宽比超过某个值
     vertical_spans = []
+    if geometry_index is None:
+        geometry_index = PageGeometryIndex(spans)
+        geometry_index.set_blocks(all_bboxes, all_discarded_blocks)
     for span in spans:
         if span['type'] in [ContentType.TEXT]:
-            for block in all_bboxes + all_discarded_blocks:
+            for block_index in geometry_index.query_blocks(span['bbox']):
+                block = geometry_index.blocks[block_index]
                 if block[7] in [BlockType.IMAGE_BODY, BlockType.TABLE_BODY, BlockType.INTERLINE_EQUATION]:
                     continue
                 if calculate_overlap_area_in_bbox1_area_ratio(span['bbox'], block[0:4]) > 0.5:
                     if span['height'] > median_span_height * 3 and span['height'] > span['width'] * 3:
                         vertical_spans.append(span)
-                    elif block in all_bboxes:
+                    elif block_index < geometry_index.block_count:
                         useful_spans.append(span)
                     else:
                         unuseful_spans.append(span)
@@ -213,12 +269,8 @@ def fill_char_in_spans(spans, all_chars):
     # 简单从上到下排一下序
     spans = sorted(spans, key=lambda x: x['bbox'][1])
 
-    for char in all_chars:
-
-        for span in spans:
-            if calculate_char_in_span(char['bbox'], span['bbox'], char['char']):
-                span['chars'].append(char)
-                break
+    for span, char_indices in zip(spans, assign_chars_to_spans(spans, all_chars)):
+        span['chars'].extend(all_chars[char_index] for char_index in char_indices)
 
     need_ocr_spans = []
     for span in spans:
@@ -231,6 +283,64 @@ def fill_char_in_spans(spans, all_chars):
     return need_ocr_spans
 
 
+def assign_chars_to_spans(spans, all_chars, span_height_radio=None):
+    """向量化实现的char到span分配，与逐个调用calculate_char_in_span的结果一致。
+
+    每个char分配给spans顺序中第一个满足条件的span。所有判定分支都要求char中心点的y严格落在
+    span的(y0, y1)内，因此先按char中心y排序，每个span只需二分截取y区间内的char再做向量化判定。
+    返回与spans一一对应的char下标列表(升序)。
+    """
+    if span_height_radio is None:
+        span_height_radio = Span_Height_Radio
+    result = [[] for _ in spans]
+    if len(spans) == 0 or len(all_chars) == 0:
+        return result
+
+    char_bboxes = np.array(
+        [[char['bbox'][0], char['bbox'][1], char['bbox'][2], char['bbox'][3]] for char in all_chars],
+        dtype=np.float64,
+    )
+    is_stop = np.array([char['char'] in LINE_STOP_FLAG for char in all_chars], dtype=bool)
+    is_start = np.array([char['char'] in LINE_START_FLAG for char in all_chars], dtype=bool) & ~is_stop
+    char_center_x = (char_bboxes[:, 0] + char_bboxes[:, 2]) / 2
+    char_center_y = (char_bboxes[:, 1] + char_bboxes[:, 3]) / 2
+
+    y_order = np.argsort(char_center_y, kind='stable')
+    sorted_center_y = char_center_y[y_order]
+    assigned = np.zeros(len(all_chars), dtype=bool)
+
+    for span_index, span in enumerate(spans):
+        x0, y0, x1, y1 = span['bbox'][0], span['bbox'][1], span['bbox'][2], span['bbox'][3]
+        begin = np.searchsorted(sorted_center_y, y0, side='right')
+        end = np.searchsorted(sorted_center_y, y1, side='left')
+        if begin >= end:
+            continue
+        candidates = y_order[begin:end]
+        candidates = candidates[~assigned[candidates]]
+        if len(candidates) == 0:
+            continue
+
+        span_center_y = (y0 + y1) / 2
+        span_height = y1 - y0
+        cx = char_center_x[candidates]
+        cy = char_center_y[candidates]
+        bboxes = char_bboxes[candidates]
+        y_ok = (y0 < cy) & (cy < y1) & (np.abs(cy - span_center_y) < span_height * span_height_radio)
+
+        center_in = (x0 < cx) & (cx < x1)
+        # 结尾符号: 左边界在span右侧一个行高范围内
+        stop_in = is_stop[candidates] & ((x1 - span_height) < bboxes[:, 0]) & (bboxes[:, 0] < x1) & (cx > x0)
+        # 开头符号: 右边界在span左侧一个行高范围内
+        start_in = is_start[candidates] & (x0 < bboxes[:, 2]) & (bboxes[:, 2] < (x0 + span_height)) & (cx < x1)
+
+        matched = candidates[y_ok & (center_in | stop_in | start_in)]
+        if len(matched) > 0:
+            assigned[matched] = True
+            result[span_index] = np.sort(matched).tolist()
+
+    return result
+
+
 LINE_STOP_FLAG = ('.', '!', '?', '。', '！', '？', ')', '）', '"', '”', ':', '：', ';', '；', ']', '】', '}', '}', '>', '》', '、', ',', '，', '-', '—', '–',)
 LINE_START_FLAG = ('(', '（', '"', '“', '【', '{', '《', '<', '「', '『', '【', '[',)
 
@@ -283,17 +393,19 @@ def chars_to_content(span):
         # Calculate the median width
         median_width = statistics.median(char_widths)
 
-        content = ''
-        for char in span['chars']:
+        content_parts = []
+        chars = span['chars']
+        for char_index, char in enumerate(chars):
 
             # 如果下一个char的x0和上一个char的x1距离超过0.25个字符宽度，则需要在中间插入一个空格
             char1 = char
-            char2 = span['chars'][span['chars'].index(char) + 1] if span['chars'].index(char) + 1 < len(span['chars']) else None
+            char2 = chars[char_index + 1] if char_index + 1 < len(chars) else None
             if char2 and char2['bbox'][0] - char1['bbox'][2] > median_width * 0.25 and char['char'] != ' ' and char2['char'] != ' ':
-                content += f"{char['char']} "
+                content_parts.append(f"{char['char']} ")
             else:
-                content += char['char']
+                content_parts.append(char['char'])
 
+        content = ''.join(content_parts)
         content = __replace_unicode(content)
         content = __replace_ligatures(content)
         content = __replace_ligatures(content)
@@ -324,4 +436,29 @@ def calculate_contrast(img, img_mode) -> float:
     # 对比度定义为标准差除以平均值（加上小常数避免除零错误）
     contrast = std_dev / (mean_value + 1e-6)
     # logger.debug(f"contrast: {contrast}")
-    return round(contrast, 2)
\ No newline at end of file
+    return round(contrast, 2)
+
+if __name__ == '__main__':
+    # 微基准：模拟5k个span的稠密页面(如财务报表)，统计重叠span消除的单页耗时
+    import random
+    import time
+
+    random.seed(0)
+    bench_spans = []
+    for row in range(100):
+        for col in range(50):
+            x0, y0 = col * 12 + random.uniform(0, 2), row * 10 + random.uniform(0, 2)
+            bench_spans.append({'bbox': [x0, y0, x0 + 10, y0 + 8], 'score': random.random(), 'type': ContentType.TEXT})
+            if random.random() < 0.1:
+                bench_spans.append({'bbox': [x0 + 0.2, y0 + 0.2, x0 + 10, y0 + 8], 'score': random.random(), 'type': ContentType.TEXT})
+
+    start_time = time.perf_counter()
+    bench_spans, _ = remove_overlaps_low_confidence_spans(bench_spans)
+    low_confidence_cost = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    bench_spans, _ = remove_overlaps_min_spans(bench_spans)
+    min_spans_cost = time.perf_counter() - start_time
+    logger.info(
+        f'spans: {len(bench_spans)}, remove_overlaps_low_confidence_spans: {round(low_confidence_cost * 1000, 2)}ms, '
+        f'remove_overlaps_min_spans: {round(min_spans_cost * 1000, 2)}ms'
+    )
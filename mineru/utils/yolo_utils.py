@@ -0,0 +1,127 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from tqdm import tqdm
+
+LETTERBOX_PAD_VALUE = 114
+
+
+def group_images_by_shape(images: list) -> dict:
+    """按(高, 宽)对图像分组，返回{shape: [原始下标]}，组内下标保持原顺序"""
+    groups = {}
+    for index, image in enumerate(images):
+        if isinstance(image, np.ndarray):
+            shape = image.shape[:2]
+        else:
+            shape = (image.height, image.width)
+        groups.setdefault(shape, []).append(index)
+    return groups
+
+
+def images_to_uint8_tensor(images: list, device) -> torch.Tensor:
+    """将同尺寸的RGB图像堆叠为NHWC的uint8张量并一次性拷贝到设备上"""
+    batch = np.stack([np.asarray(image) for image in images])
+    return torch.from_numpy(batch).to(device, non_blocking=True)
+
+
+class PageTensorCache:
+    """
+    一个batch内页面图像的设备端uint8张量缓存。
+
+    每页只做一次PIL到张量的转换和一次host到device拷贝，同尺寸页面堆叠为一个NHWC张量，
+    layout与MFD检测都从这里按各自的imgsz做letterbox，避免重复的CPU预处理和PCIe传输。
+    """
+
+    def __init__(self, images: list, device):
+        self.device = device
+        self.num_images = len(images)
+        self.groups = {}
+        for shape, indices in group_images_by_shape(images).items():
+            self.groups[shape] = (indices, images_to_uint8_tensor([images[i] for i in indices], device))
+
+    def __len__(self):
+        return self.num_images
+
+    def iter_batches(self, batch_size: int):
+        """按尺寸分组依次产出(shape, 原始下标列表, NHWC uint8张量切片)"""
+        for shape, (indices, tensor) in self.groups.items():
+            for start in range(0, len(indices), batch_size):
+                yield shape, indices[start: start + batch_size], tensor[start: start + batch_size]
+
+
+def iter_shape_batches(images: list, batch_size: int, device, page_tensors: PageTensorCache = None):
+    """有共享缓存时直接切片复用，否则逐批把同尺寸图像拷贝到设备上"""
+    if page_tensors is not None:
+        yield from page_tensors.iter_batches(batch_size)
+        return
+    for shape, indices in group_images_by_shape(images).items():
+        for start in range(0, len(indices), batch_size):
+            batch_indices = indices[start: start + batch_size]
+            yield shape, batch_indices, images_to_uint8_tensor([images[i] for i in batch_indices], device)
+
+
+def letterbox_shape(orig_shape, imgsz: int, stride: int = 32):
+    """
+    与ultralytics中LetterBox(auto=True, center=True)的计算方式保持一致，
+    返回缩放后尺寸(new_h, new_w)和上下左右的padding
+    """
+    h, w = orig_shape
+    r = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = np.mod(imgsz - new_w, stride) / 2, np.mod(imgsz - new_h, stride) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return (new_h, new_w), (top, bottom, left, right)
+
+
+def letterbox_batch(images_uint8: torch.Tensor, imgsz: int, stride: int = 32) -> torch.Tensor:
+    """
+    对同尺寸的NHWC uint8图像张量做向量化letterbox，整批在设备上完成缩放和填充，
+    返回NCHW、取值0~1的float张量，可直接作为ultralytics predict的输入
+    """
+    (new_h, new_w), (top, bottom, left, right) = letterbox_shape(images_uint8.shape[1:3], imgsz, stride)
+    batch = images_uint8.permute(0, 3, 1, 2).float()
+    if (new_h, new_w) != tuple(batch.shape[2:]):
+        batch = F.interpolate(batch, size=(new_h, new_w), mode='bilinear', align_corners=False)
+        batch = batch.round_().clamp_(0, 255)
+    batch = F.pad(batch, (left, right, top, bottom), value=LETTERBOX_PAD_VALUE)
+    return batch.div_(255.0).contiguous()
+
+
+def scale_boxes_to_original(boxes_data: torch.Tensor, input_shape, orig_shape) -> torch.Tensor:
+    """
+    将letterbox输入坐标系下的检测结果映射回原图坐标，计算方式与ultralytics的scale_boxes一致。
+    boxes_data前4列为xyxy，其余列(conf, cls)原样保留
+    """
+    in_h, in_w = input_shape
+    orig_h, orig_w = orig_shape
+    gain = min(in_h / orig_h, in_w / orig_w)
+    pad_x = round((in_w - orig_w * gain) / 2 - 0.1)
+    pad_y = round((in_h - orig_h * gain) / 2 - 0.1)
+    x = ((boxes_data[:, [0, 2]] - pad_x) / gain).clamp(0, orig_w)
+    y = ((boxes_data[:, [1, 3]] - pad_y) / gain).clamp(0, orig_h)
+    xyxy = torch.stack([x[:, 0], y[:, 0], x[:, 1], y[:, 1]], dim=1)
+    return torch.cat([xyxy, boxes_data[:, 4:]], dim=1)
+
+
+def yolo_batch_predict(model, images: list, batch_size: int, imgsz: int, device, desc=None,
+                       page_tensors: PageTensorCache = None, **predict_kwargs) -> list:
+    """
+    同尺寸图像按batch_size组成真正的批次送入ultralytics模型，letterbox在设备上整批完成，
+    传入page_tensors时复用其中已在设备上的页面张量。
+    返回与images顺序一致的Results列表(已转到cpu，boxes为原图坐标)
+    """
+    results = [None] * len(images)
+    pbar = tqdm(total=len(images), desc=desc)
+    for shape, batch_indices, images_uint8 in iter_shape_batches(images, batch_size, device, page_tensors):
+        batch = letterbox_batch(images_uint8, imgsz)
+        batch_results = model.predict(batch, imgsz=imgsz, device=device, verbose=False, **predict_kwargs)
+        for index, image_res in zip(batch_indices, batch_results):
+            image_res = image_res.cpu()
+            image_res.boxes.data = scale_boxes_to_original(image_res.boxes.data, batch.shape[2:], shape)
+            image_res.boxes.orig_shape = shape
+            image_res.orig_shape = shape
+            results[index] = image_res
+        pbar.update(len(batch_indices))
+    pbar.close()
+    return results
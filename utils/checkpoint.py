@@ -0,0 +1,93 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+
+from loguru import logger
+
+MODEL_STAGE = 'model'
+MIDDLE_STAGE = 'middle'
+
+
+def get_checkpoint_root(output_dir):
+    """
+    断点续跑checkpoint的根目录，可通过环境变量MINERU_CHECKPOINT_DIR设置，
+    默认位于输出目录下的.checkpoints。
+    """
+    return os.getenv('MINERU_CHECKPOINT_DIR') or os.path.join(output_dir, '.checkpoints')
+
+
+def make_job_key(pdf_bytes, **params):
+    """按文档原始内容、页码范围和解析参数计算checkpoint的key，参数不同的两次转换不会共用结果"""
+    hasher = hashlib.sha256()
+    hasher.update(pdf_bytes)
+    hasher.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class JobCheckpoint:
+    """
+    单个文档的断点续跑checkpoint。
+
+    每页的模型输出(model.json中的一项)和page_info(分段等跨页处理之前的middle json页面)各存为一个json文件，
+    先写临时文件再原子替换，进程中途崩溃不会留下不完整的文件。
+    表格识别结果由表格识别缓存持久化，续跑时直接命中，不在这里重复保存。
+    文档的全部产物写出后调用remove()删除，checkpoint只在转换未完成时保留。
+    """
+
+    def __init__(self, root_dir, job_key, file_name=None):
+        self.job_dir = os.path.join(root_dir, job_key)
+        os.makedirs(self.job_dir, exist_ok=True)
+        if file_name is not None:
+            self._write_json(os.path.join(self.job_dir, 'meta.json'), {'file_name': file_name})
+
+    def _page_path(self, stage, page_index):
+        return os.path.join(self.job_dir, f'{stage}_{page_index:05d}.json')
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        except BaseException:
+            # open()本身失败时临时文件不存在，不能让删除时的FileNotFoundError掩盖原始错误
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    def has_pages(self, stage, page_start, page_end) -> bool:
+        """[page_start, page_end]闭区间内的页面是否都已保存了该阶段的结果"""
+        return all(os.path.exists(self._page_path(stage, page_index)) for page_index in range(page_start, page_end + 1))
+
+    def load_pages(self, stage, page_start, page_end):
+        """读取[page_start, page_end]闭区间内各页该阶段的结果，有页面缺失或文件损坏时返回None"""
+        if not self.has_pages(stage, page_start, page_end):
+            return None
+        pages = []
+        try:
+            for page_index in range(page_start, page_end + 1):
+                with open(self._page_path(stage, page_index), 'r', encoding='utf-8') as f:
+                    pages.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"checkpoint文件读取失败，将重新处理第{page_start + 1}-{page_end + 1}页: {e}")
+            return None
+        return pages
+
+    def save_pages(self, stage, page_start, pages):
+        """从page_start开始依次保存各页该阶段的结果，保存失败只影响续跑，不中断转换"""
+        try:
+            for offset, page in enumerate(pages):
+                self._write_json(self._page_path(stage, page_start + offset), page)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"checkpoint保存失败({stage}, 第{page_start + 1}页起): {e}")
+
+    def remove(self):
+        """转换完成后删除该文档的checkpoint目录，根目录已空时一并删除"""
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(self.job_dir))
+        except OSError:
+            pass
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+
+from loguru import logger
+
+from utils.pdf_utils import parse_pdf_to_files
+from utils.docx_utils import convert_markdown_to_word_with_pandoc
+from utils.pdf_converter import process_and_convert_pdf
+
+
+def run_conversion(input_path: str, output_dir: str, mode: str = "format", page_window_size=None, resume=False,
+                   incremental=False) -> dict:
+    """
+    按指定模式转换单个PDF，本地CLI与常驻模型服务共用。
+
+    Args:
+        input_path (str): 输入PDF文件路径。
+        output_dir (str): 输出目录。
+        mode (str): 转换模式，'content'、'format'或'debug'。
+        page_window_size (int, optional): 流式页面窗口大小，仅对PDF解析生效。
+        resume (bool): 是否从上次中断处继续解析，仅对PDF解析生效。
+        incremental (bool): 是否复用之前转换过的相同页面，只处理新增或修改的页面，仅对PDF解析生效。
+
+    Returns:
+        dict: {"success": bool, "outputs": [生成的文件路径], "error": 失败原因}
+    """
+    result = {"success": False, "outputs": [], "error": None}
+
+    # 确保输入文件存在
+    if not os.path.exists(input_path):
+        result["error"] = f"输入文件不存在: {input_path}"
+        logger.error(result["error"])
+        return result
+
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+
+    file_base_name = Path(input_path).stem
+
+    logger.info(f"开始处理文件: {input_path}, 使用模式: {mode}")
+
+    if mode == 'content':
+        # --- 内容模式 ---
+        # 1. 解析PDF到Markdown
+        md_file_path = parse_pdf_to_files(input_path, output_dir, page_window_size=page_window_size, resume=resume,
+                                          incremental=incremental)
+
+        if not md_file_path or not os.path.exists(md_file_path):
+            result["error"] = "PDF解析失败，未生成Markdown文件。"
+            logger.error(result["error"])
+            return result
+
+        logger.info(f"PDF解析完成，生成的Markdown文件: {md_file_path}")
+        result["outputs"].append(md_file_path)
+
+        # 2. 将Markdown转换为Word
+        docx_file_name = f"{file_base_name}_content.docx"
+        docx_file_path = os.path.join(output_dir, docx_file_name)
+
+        logger.info(f"正在将Markdown转换为Word: {docx_file_path}")
+        try:
+            convert_markdown_to_word_with_pandoc(md_file_path, docx_file_path)
+            logger.info(f"内容模式转换成功! 输出文件: {docx_file_path}")
+            result["outputs"].append(docx_file_path)
+            result["success"] = True
+        except Exception as e:
+            result["error"] = f"从Markdown转换为Word失败: {e}"
+            logger.error(result["error"])
+
+    elif mode == 'format':
+        # --- 格式模式 ---
+        docx_file_name = f"{file_base_name}_format.docx"
+        docx_file_path = os.path.join(output_dir, docx_file_name)
+
+        logger.info(f"正在转换PDF为Word（格式模式）: {docx_file_path}")
+        try:
+            process_and_convert_pdf(input_path, docx_file_path)
+            logger.info(f"格式模式转换成功! 输出文件: {docx_file_path}")
+            result["outputs"].append(docx_file_path)
+            result["success"] = True
+        except Exception as e:
+            result["error"] = f"PDF到Word转换失败: {e}"
+            logger.error(result["error"], exc_info=True)
+
+    elif mode == 'debug':
+        # debug模式保持CLI原有行为，不执行任何转换
+        result["success"] = True
+
+    else:
+        result["error"] = f"未知的转换模式: {mode}"
+        logger.error(result["error"])
+
+    return result
@@ -0,0 +1,210 @@
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+"""
+middle json的紧凑二进制格式(.mpk)，可以内存映射后按页延迟加载。
+
+文件结构：
+    文件头   magic(4字节) | 版本号(uint32) | 索引偏移(uint64)
+    页面数据 每页一段紧凑json，其中的bbox替换为该页bbox表中的序号
+    bbox表   所有页面的bbox，连续存放的float32 (N, 4)数组，8字节对齐
+    索引     json：除pdf_info外的顶层字段，以及每页的(数据偏移, 数据长度, bbox起始序号, bbox数量)
+读取时只解析索引，访问某一页时才解码该页的数据；bbox表直接映射为numpy数组，不经过json解析。
+bbox以float32保存，解码页面时还原为保留3位小数的浮点数，需要与原始数值逐位一致时请使用json格式。
+"""
+MIDDLE_PACK_SUFFIX = '.mpk'
+_MAGIC = b'MNRU'
+_VERSION = 1
+_PRELUDE = struct.Struct('<4sIQ')
+
+
+def get_middle_format():
+    """
+    middle json的输出格式，可通过环境变量MINERU_MIDDLE_FORMAT设置：
+    json(默认)、pack(只输出.mpk)或both(两者都输出)。
+    """
+    middle_format = os.getenv('MINERU_MIDDLE_FORMAT', 'json').lower()
+    if middle_format not in ('json', 'pack', 'both'):
+        raise ValueError(f"Unsupported MINERU_MIDDLE_FORMAT: {middle_format}")
+    return middle_format
+
+
+def _is_bbox(value):
+    return isinstance(value, list) and len(value) == 4 and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value
+    )
+
+
+def _extract_bboxes(node, bboxes):
+    """复制node，把其中的bbox替换为在bboxes中的序号"""
+    if isinstance(node, dict):
+        packed = {}
+        for key, value in node.items():
+            if key == 'bbox' and _is_bbox(value):
+                packed[key] = len(bboxes)
+                bboxes.append(value)
+            else:
+                packed[key] = _extract_bboxes(value, bboxes)
+        return packed
+    if isinstance(node, list):
+        return [_extract_bboxes(item, bboxes) for item in node]
+    return node
+
+
+def _restore_bboxes(node, bboxes):
+    """原地把node中的bbox序号还原为bbox"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'bbox' and isinstance(value, int):
+                node[key] = bboxes[value]
+            else:
+                _restore_bboxes(value, bboxes)
+    elif isinstance(node, list):
+        for item in node:
+            _restore_bboxes(item, bboxes)
+
+
+class MiddlePackWriter:
+    """逐页写出.mpk文件，内存中只保留bbox表和页面索引"""
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = meta or {}
+        self._tmp_path = f'{path}.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(_PRELUDE.pack(_MAGIC, _VERSION, 0))
+        self._pages = []
+        self._bboxes = []
+
+    def add_page(self, page_info):
+        page_bboxes = []
+        blob = json.dumps(
+            _extract_bboxes(page_info, page_bboxes), ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
+        self._pages.append((self._file.tell(), len(blob), len(self._bboxes), len(page_bboxes)))
+        self._file.write(blob)
+        self._bboxes.extend(page_bboxes)
+
+    def close(self):
+        f = self._file
+        f.write(b'\0' * (-f.tell() % 8))
+        bbox_offset = f.tell()
+        f.write(np.asarray(self._bboxes, dtype='<f4').reshape(-1, 4).tobytes())
+        index_offset = f.tell()
+        f.write(json.dumps({
+            'meta': self.meta,
+            'pages': self._pages,
+            'bbox_offset': bbox_offset,
+            'bbox_count': len(self._bboxes),
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        f.seek(0)
+        f.write(_PRELUDE.pack(_MAGIC, _VERSION, index_offset))
+        f.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_middle_pack(middle_json, path):
+    """把完整的middle json写为.mpk文件"""
+    with MiddlePackWriter(path, {k: v for k, v in middle_json.items() if k != 'pdf_info'}) as writer:
+        for page_info in middle_json['pdf_info']:
+            writer.add_page(page_info)
+
+
+class MiddlePack:
+    """
+    内存映射读取.mpk文件，表现为只读的页面序列：len()、下标访问和迭代都按页延迟解码，
+    每次访问返回新解码的page_info，修改它不会影响文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset = _PRELUDE.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise ValueError(f"not a middle pack file (v{_VERSION}): {path}")
+        index = json.loads(self._mmap[index_offset:].decode('utf-8'))
+        self.meta = index['meta']
+        self._pages = index['pages']
+        self._bbox_table = np.frombuffer(
+            self._mmap, dtype='<f4', count=index['bbox_count'] * 4, offset=index['bbox_offset'],
+        ).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def page_bboxes(self, page_index):
+        """第page_index页所有bbox组成的(n, 4) float32数组，直接映射自文件，无需解码页面数据"""
+        _, _, bbox_start, bbox_count = self._pages[page_index]
+        return self._bbox_table[bbox_start: bbox_start + bbox_count]
+
+    def __getitem__(self, page_index):
+        if isinstance(page_index, slice):
+            return [self[i] for i in range(*page_index.indices(len(self)))]
+        offset, length, _, _ = self._pages[page_index]
+        page_info = json.loads(self._mmap[offset: offset + length].decode('utf-8'))
+        _restore_bboxes(page_info, np.round(self.page_bboxes(page_index).astype(np.float64), 3).tolist())
+        return page_info
+
+    def __iter__(self):
+        for page_index in range(len(self)):
+            yield self[page_index]
+
+    def to_middle_json(self):
+        """完整解码为与json格式相同结构的middle json"""
+        return {**self.meta, 'pdf_info': list(self)}
+
+    def close(self):
+        # 仍有numpy视图引用映射时不能关闭，交给垃圾回收释放
+        self._bbox_table = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_middle_json(path):
+    """
+    读取middle json，.mpk文件的pdf_info为按页延迟加载的MiddlePack，其它文件按json读取。
+    两种情况下都可以对pdf_info使用len()、下标访问和迭代。
+    """
+    if str(path).endswith(MIDDLE_PACK_SUFFIX):
+        pdf_info = MiddlePack(path)
+        return {**pdf_info.meta, 'pdf_info': pdf_info}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    # 格式转换：python -m utils.middle_pack input_middle.json output_middle.mpk(或反向导出为json)
+    src_path, dst_path = sys.argv[1], sys.argv[2]
+    if dst_path.endswith(MIDDLE_PACK_SUFFIX):
+        write_middle_pack(load_middle_json(src_path), dst_path)
+    else:
+        with MiddlePack(src_path) as pack, open(dst_path, 'w', encoding='utf-8') as f:
+            json.dump(pack.to_middle_json(), f, ensure_ascii=False, indent=4)
@@ -0,0 +1,261 @@
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+
+def get_server_address():
+    """
+    常驻模型服务的监听地址，可通过环境变量MINERU_SERVER_HOST、MINERU_SERVER_PORT设置，
+    默认只监听本机127.0.0.1:8765。服务会直接读写请求中给出的本地路径，不应暴露到本机以外。
+    """
+    return os.getenv('MINERU_SERVER_HOST', '127.0.0.1'), int(os.getenv('MINERU_SERVER_PORT', '8765'))
+
+
+def get_server_url():
+    """CLI提交任务使用的服务地址，可通过环境变量MINERU_SERVER_URL覆盖"""
+    host, port = get_server_address()
+    return os.getenv('MINERU_SERVER_URL', f'http://{host}:{port}')
+
+
+TOKEN_HEADER = 'X-MinerU-Token'
+_LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def get_token_path():
+    """
+    服务访问令牌的保存路径，可通过环境变量MINERU_SERVER_TOKEN_FILE设置，默认位于~/.cache/mineru/server_token。
+    服务启动时生成新令牌并以0600权限写入，只有同一用户的CLI能读取并随任务提交。
+    """
+    token_path = os.getenv('MINERU_SERVER_TOKEN_FILE')
+    if token_path:
+        return token_path
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'server_token')
+
+
+def create_token():
+    token = secrets.token_hex(32)
+    token_path = get_token_path()
+    os.makedirs(os.path.dirname(token_path) or '.', exist_ok=True)
+    if os.path.exists(token_path):
+        os.remove(token_path)
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+def read_token():
+    try:
+        with open(get_token_path(), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def _host_name(host_header):
+    """Host请求头中去掉端口后的主机名"""
+    host = host_header.strip().lower()
+    if host.startswith('['):
+        return host[1:host.find(']')]
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+
+def warmup_models(lang='ch'):
+    """预先加载pipeline用到的全部模型，使其常驻在服务进程中"""
+    from mineru.backend.pipeline.model_init import AtomModelSingleton
+    from mineru.backend.pipeline.model_list import AtomicModel
+    from mineru.backend.pipeline.pipeline_analyze import ModelSingleton
+    from mineru.utils.block_sort import ModelSingleton as ReadingOrderModelSingleton
+    from mineru.utils.config_reader import get_formula_enable, get_table_enable
+
+    ModelSingleton().get_model(
+        lang=None,
+        formula_enable=get_formula_enable(True),
+        table_enable=get_table_enable(True),
+    )
+    AtomModelSingleton().get_atom_model(atom_model_name=AtomicModel.OCR, det_db_box_thresh=0.3, lang=lang)
+    ReadingOrderModelSingleton().get_model('layoutreader')
+
+
+class ConversionJobHandler(BaseHTTPRequestHandler):
+    """
+    GET /health 返回服务状态；POST /jobs 提交一个转换任务。
+    /jobs只接受Content-Type为application/json、不带Origin、Host为本机地址且携带正确令牌的请求，
+    防止浏览器中的网页(跨站请求或DNS重绑定)借服务读写本地文件。
+    任务执行期间以NDJSON逐行流式返回日志({"event": "log"})，结束时返回{"event": "result"}。
+    模型只有一份，任务按提交顺序串行执行。
+    """
+
+    job_lock = threading.Lock()
+    token = ''
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {"status": "ok", "pid": os.getpid(), "busy": self.job_lock.locked()})
+        else:
+            self._send_json(404, {"error": f"unknown path: {self.path}"})
+
+    def _check_request(self):
+        """校验任务请求的来源，不通过时返回(状态码, 错误信息)"""
+        content_type = self.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if content_type != 'application/json':
+            return 415, "Content-Type must be application/json"
+        if self.headers.get('Origin') is not None:
+            return 403, "cross-origin requests are not allowed"
+        if _host_name(self.headers.get('Host', '')) not in _LOOPBACK_HOSTS:
+            return 403, "Host must be a loopback address"
+        if not self.token or not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.token):
+            return 403, f"invalid token, see {get_token_path()}"
+        return None
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._send_json(404, {"error": f"unknown path: {self.path}"})
+            return
+        rejected = self._check_request()
+        if rejected is not None:
+            self._send_json(rejected[0], {"error": rejected[1]})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length).decode('utf-8'))
+            job_args = (
+                job['input'], job['output_dir'], job.get('mode', 'format'), job.get('page_window'),
+                bool(job.get('resume', False)), bool(job.get('incremental', False)),
+            )
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"invalid job: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.end_headers()
+
+        events = queue.Queue()
+        with self.job_lock:
+            # 同一时刻只有一个任务在执行，期间所有线程的日志都属于该任务
+            sink_id = logger.add(
+                lambda message: events.put({
+                    "event": "log",
+                    "level": message.record['level'].name,
+                    "message": message.record['message'],
+                }),
+                level=os.getenv('MINERU_SERVER_LOG_LEVEL', 'INFO'),
+                # 服务自身(请求日志、客户端转发)的日志不回传
+                filter=lambda record: record['name'] != __name__,
+            )
+            worker = threading.Thread(target=self._run_job, args=(job_args, events), daemon=True)
+            worker.start()
+            client_alive = True
+            while True:
+                event = events.get()
+                if client_alive:
+                    try:
+                        self.wfile.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+                        self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # 客户端断开后任务继续执行完，结果照常写到输出目录
+                        client_alive = False
+                if event["event"] == "result":
+                    break
+            worker.join()
+            logger.remove(sink_id)
+
+    @staticmethod
+    def _run_job(job_args, events):
+        try:
+            from utils.job_runner import run_conversion
+            result = run_conversion(*job_args)
+        except Exception as e:
+            logger.exception(e)
+            result = {"success": False, "outputs": [], "error": str(e)}
+        events.put({"event": "result", **result})
+
+
+def serve(lang='ch'):
+    """启动常驻模型服务，模型加载完成后才开始接受任务"""
+    host, port = get_server_address()
+    logger.info("正在加载模型...")
+    warmup_models(lang)
+    ConversionJobHandler.token = create_token()
+    server = ThreadingHTTPServer((host, port), ConversionJobHandler)
+    logger.info(f"模型服务已启动: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def server_available(server_url=None, timeout=1.0) -> bool:
+    """检查模型服务是否可用"""
+    server_url = server_url or get_server_url()
+    try:
+        with urllib.request.urlopen(f"{server_url}/health", timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8')).get('status') == 'ok'
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+def submit_job(input_path, output_dir, mode="format", page_window_size=None, resume=False, incremental=False,
+               server_url=None) -> dict:
+    """
+    向模型服务提交转换任务，逐行转发服务端日志，返回与run_conversion相同结构的结果。
+    路径在提交前转为绝对路径，服务端的工作目录可能与CLI不同；访问令牌从get_token_path()读取。
+    """
+    server_url = server_url or get_server_url()
+    job = {
+        "input": os.path.abspath(input_path),
+        "output_dir": os.path.abspath(output_dir),
+        "mode": mode,
+        "page_window": page_window_size,
+        "resume": resume,
+        "incremental": incremental,
+    }
+    request = urllib.request.Request(
+        f"{server_url}/jobs",
+        data=json.dumps(job, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json', TOKEN_HEADER: read_token()},
+        method='POST',
+    )
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        try:
+            error = json.loads(e.read().decode('utf-8')).get('error', str(e))
+        except ValueError:
+            error = str(e)
+        logger.error(f"模型服务拒绝了任务: {error}")
+        return {"success": False, "outputs": [], "error": error}
+    with response:
+        for line in response:
+            if not line.strip():
+                continue
+            event = json.loads(line.decode('utf-8'))
+            if event["event"] == "log":
+                logger.log(event["level"], f"[server] {event['message']}")
+            elif event["event"] == "result":
+                event.pop("event")
+                return event
+    return {"success": False, "outputs": [], "error": "模型服务在返回结果前断开了连接"}
+
@@ -0,0 +1,131 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def get_json_indent():
+    """
+    输出json的缩进，可通过环境变量MINERU_OUTPUT_JSON_INDENT设置(如4)，默认不缩进、不带多余空白的紧凑格式，
+    紧凑格式可以使用C实现的编码器，大文档上序列化速度和文件体积都明显更优。
+    """
+    indent = os.getenv('MINERU_OUTPUT_JSON_INDENT', '')
+    return int(indent) if indent.strip() else None
+
+
+def encode_compact_json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+class JsonListSnapshot:
+    """
+    逐项序列化保存的json列表，元素加入时即编码为紧凑json文本，之后对原对象的修改不再影响它。
+    用于在model_list被middle json生成过程修改之前保留model.json，比deepcopy整份结果更快、更省内存。
+    """
+
+    def __init__(self, items=()):
+        self.encoded_items = []
+        self.extend(items)
+
+    def append(self, item):
+        self.encoded_items.append(encode_compact_json(item))
+
+    def append_encoded(self, text):
+        self.encoded_items.append(text)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+
+def dump_json_stream(obj, path):
+    """
+    把obj写成json文件，不在内存中拼出整个文档的字符串。
+    紧凑格式下顶层list/dict的每个元素(通常是一页)单独编码后写出，结果与一次性json.dumps完全一致；
+    指定了缩进时退回json.dump逐块写出。JsonListSnapshot在紧凑格式下直接拼接已编码的元素。
+    """
+    indent = get_json_indent()
+    with open(path, 'w', encoding='utf-8') as f:
+        if isinstance(obj, JsonListSnapshot) and indent is not None:
+            obj = [json.loads(text) for text in obj.encoded_items]
+        if indent is not None:
+            json.dump(obj, f, ensure_ascii=False, indent=indent)
+            return
+
+        def write_items(encoded_items):
+            f.write('[')
+            for i, text in enumerate(encoded_items):
+                if i:
+                    f.write(',')
+                f.write(text)
+            f.write(']')
+
+        def write_value(value):
+            if isinstance(value, list):
+                write_items(encode_compact_json(item) for item in value)
+            else:
+                f.write(encode_compact_json(value))
+
+        if isinstance(obj, JsonListSnapshot):
+            write_items(obj.encoded_items)
+            return
+
+        if isinstance(obj, dict):
+            f.write('{')
+            for i, (key, value) in enumerate(obj.items()):
+                if i:
+                    f.write(',')
+                f.write(f'{encode_compact_json(key)}:')
+                write_value(value)
+            f.write('}')
+        else:
+            write_value(obj)
+
+
+class OutputPool:
+    """
+    解析结果的写出线程池：各产物(bbox可视化pdf、原始pdf、md、content_list、json)相互独立地并发生成，
+    并且不阻塞下一个文档的推理。线程数可通过环境变量MINERU_OUTPUT_WORKERS设置，默认值为4，设为0时在当前线程同步执行。
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = int(os.getenv('MINERU_OUTPUT_WORKERS', '4'))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mineru-output') \
+            if max_workers > 0 else None
+        self.futures = []
+
+    def submit(self, fn, *args, after=()):
+        """
+        提交一个写出任务，after中的任务完成后才开始执行。
+        线程池按提交顺序取任务，after中的任务总是先于本任务被取走，不会因等待而死锁。
+        """
+        if self.executor is None:
+            return _ImmediateResult(fn(*args))
+
+        def run():
+            for dependency in after:
+                dependency.result()
+            return fn(*args)
+
+        future = self.executor.submit(run)
+        self.futures.append(future)
+        return future
+
+    def join(self):
+        """等待全部任务完成并关闭线程池，有任务失败时抛出第一个异常"""
+        if self.executor is None:
+            return
+        try:
+            wait(self.futures)
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class _ImmediateResult:
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
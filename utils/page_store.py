@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import json
+import os
+
+import pypdfium2 as pdfium
+from loguru import logger
+
+from mineru.utils.result_cache import SqliteLRUCache
+from mineru.version import __version__
+
+
+def get_page_store_path():
+    """
+    增量转换的页面结果库路径，可通过环境变量MINERU_PAGE_STORE_PATH设置，
+    默认位于~/.cache/mineru/page_store.sqlite3。
+    """
+    store_path = os.getenv('MINERU_PAGE_STORE_PATH')
+    if store_path:
+        return store_path
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'page_store.sqlite3')
+
+
+def page_content_hash(page: pdfium.PdfPage) -> str:
+    """
+    计算页面内容的稳定哈希：页面尺寸与旋转、页面文本，以及各页面对象(含form xobject内的对象)的类型、层级、
+    外接框和图片对象的原始数据流。只依赖页面本身的内容与资源，与页面在文档中的位置和文档的其它部分无关。
+    """
+    hasher = hashlib.sha256()
+    page_w, page_h = page.get_size()
+    hasher.update(f"{page_w:.2f}x{page_h:.2f}r{page.get_rotation()}\n".encode('utf-8'))
+
+    textpage = page.get_textpage()
+    try:
+        hasher.update(textpage.get_text_range().encode('utf-8', 'surrogatepass'))
+    finally:
+        textpage.close()
+
+    for page_obj in page.get_objects(max_depth=2):
+        bounds = tuple(round(v, 2) for v in page_obj.get_bounds())
+        hasher.update(f"\n{page_obj.type}:{page_obj.level}:{bounds}".encode('utf-8'))
+        if isinstance(page_obj, pdfium.PdfImage):
+            hasher.update(bytes(page_obj.get_data(decode_simple=False)))
+    return hasher.hexdigest()
+
+
+def _iter_image_spans(node):
+    """遍历page_info中带image_path的span(图片、表格的截图)"""
+    if isinstance(node, dict):
+        if node.get('image_path'):
+            yield node
+        for value in node.values():
+            yield from _iter_image_spans(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _iter_image_spans(item)
+
+
+class PageResultStore:
+    """
+    按页面内容哈希保存每页的模型输出、page_info(分段等跨页处理之前)和该页引用的截图，
+    文档修订后内容未变的页面直接复用上次的结果，只对新页面做渲染和推理。
+    """
+
+    def __init__(self, cache: SqliteLRUCache):
+        self.cache = cache
+
+    @staticmethod
+    def page_key(page_hash, **params):
+        """页面内容哈希与影响解析结果的参数一起组成key，mineru版本变化时自动失效"""
+        hasher = hashlib.sha256()
+        hasher.update(page_hash.encode('utf-8'))
+        hasher.update(json.dumps(dict(params, version=__version__), sort_keys=True).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def get(self, key, page_index, image_writer):
+        """
+        取出一页的(model, page_info)并改写为第page_index页，截图按内容哈希命名写入image_writer，
+        不存在或解析失败时返回None
+        """
+        value = self.cache.get(key)
+        if value is None:
+            return None
+        try:
+            entry = json.loads(value)
+            model, page_info = entry['model'], entry['page_info']
+            image_names = {}
+            for name, image_b64 in entry['images'].items():
+                image_bytes = base64.b64decode(image_b64)
+                new_name = f"{hashlib.sha256(image_bytes).hexdigest()}.jpg"
+                image_writer.write(new_name, image_bytes)
+                image_names[name] = new_name
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"页面结果库中的记录无法解析，将重新处理第{page_index + 1}页: {e}")
+            return None
+        for span in _iter_image_spans(page_info):
+            span['image_path'] = image_names.get(span['image_path'], span['image_path'])
+        model['page_info']['page_no'] = page_index
+        page_info['page_idx'] = page_index
+        return model, page_info
+
+    def put(self, key, model_text, page_info, local_image_dir):
+        """保存一页的结果，model_text为该页已编码的模型输出json，page_info引用的截图从local_image_dir读取后一并保存"""
+        images = {}
+        try:
+            for span in _iter_image_spans(page_info):
+                image_name = span['image_path']
+                if image_name not in images:
+                    with open(os.path.join(local_image_dir, image_name), 'rb') as f:
+                        images[image_name] = base64.b64encode(f.read()).decode('ascii')
+            value = '{"model":%s,"page_info":%s,"images":%s}' % (
+                model_text,
+                json.dumps(page_info, ensure_ascii=False, separators=(',', ':')),
+                json.dumps(images, separators=(',', ':')),
+            )
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"页面结果保存失败，该页下次仍会重新处理: {e}")
+            return
+        self.cache.put(key, value)
+
+
+def page_store_init():
+    """
+    根据环境变量创建增量转换的页面结果库，MINERU_PAGE_STORE_SIZE_MB设置容量上限，默认值为2048，
+    超出后按最近最少使用淘汰。
+    """
+    max_size_bytes = int(float(os.getenv('MINERU_PAGE_STORE_SIZE_MB', '2048')) * 1024 * 1024)
+    store_path = get_page_store_path()
+    try:
+        return PageResultStore(SqliteLRUCache(store_path, max_size_bytes, table_name='page_results'))
+    except Exception as e:
+        logger.warning(f"页面结果库初始化失败，将完整处理所有页面: {e}")
+        return None
@@ -1,8 +1,9 @@
-import json
 import os
 import win32com.client as win32
 from win32com.client import constants
 
+from utils.middle_pack import load_middle_json
+
 class TextBoxWordReconstructor:
     def __init__(self, json_path, output_path="reconstructed_textbox_smart_font.docx"):
         """
@@ -16,9 +17,8 @@ class TextBoxWordReconstructor:
         self.output_path = output_path
         self.json_dir = os.path.dirname(json_path)
         
-        # 加载 JSON 数据
-        with open(json_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        # 加载 JSON 数据，.mpk格式按页延迟加载
+        self.data = load_middle_json(json_path)
     
     def create_document_with_textboxes(self):
         """创建带文本框的 Word 文档，使用分节符处理多页"""
@@ -1,10 +1,9 @@
 # Copyright (c) Opendatalab. All rights reserved.
-import copy
-import json
 import os
 from pathlib import Path
 from typing import Union, List
 
+import pypdfium2 as pdfium
 from loguru import logger
 
 from mineru.cli.common import convert_pdf_bytes_to_bytes_by_pypdfium2, prepare_env, read_fn
@@ -12,10 +11,21 @@ from mineru.data.data_reader_writer import FileBasedDataWriter
 from mineru.utils.draw_bbox import draw_layout_bbox, draw_span_bbox
 from mineru.utils.enum_class import MakeMode
 from mineru.backend.vlm.vlm_analyze import doc_analyze as vlm_doc_analyze
-from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze
+from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze, \
+    doc_analyze_streaming as pipeline_doc_analyze_streaming, doc_analyze_pages as pipeline_doc_analyze_pages, \
+    get_ocr_enable
 from mineru.backend.pipeline.pipeline_middle_json_mkcontent import union_make as pipeline_union_make
-from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
+from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json, \
+    init_middle_json as pipeline_init_middle_json, append_pages_to_middle_json as pipeline_append_pages_to_middle_json, \
+    finalize_middle_json as pipeline_finalize_middle_json
+from mineru.utils.config_reader import get_device
+from mineru.utils.model_utils import clean_memory
 from mineru.backend.vlm.vlm_middle_json_mkcontent import union_make as vlm_union_make
+from mineru.utils.result_cache import flush_all_caches
+from utils.checkpoint import JobCheckpoint, get_checkpoint_root, make_job_key, MODEL_STAGE, MIDDLE_STAGE
+from utils.page_store import page_content_hash, page_store_init
+from utils.output_writer import JsonListSnapshot, OutputPool, dump_json_stream, encode_compact_json
+from utils.middle_pack import MIDDLE_PACK_SUFFIX, get_middle_format, write_middle_pack
 
 
 def _do_parse_internal(
@@ -38,82 +48,113 @@ def _do_parse_internal(
     f_make_md_mode=MakeMode.MM_MD,  # 生成markdown内容的模式，默认为MM_MD
     start_page_id=0,  # 解析的起始页面ID，默认为0
     end_page_id=None,  # 解析的结束页面ID，默认为None（解析到文档末尾）
+    page_window_size=None,  # 流式页面窗口大小，设置后按窗口渲染/推理/写出，默认为None（整本一次处理）
+    resume=False,  # 断点续跑，按窗口保存每页的模型结果和page_info，重新运行时跳过已完成的页面
+    incremental=False,  # 增量转换，按页面内容哈希复用之前转换过的页面，只处理新增或修改的页面
 ):
     """
     内部解析函数，处理单个或批量PDF。
     返回生成的MD或JSON文件路径列表。
     """
+    if page_window_size is None and os.environ.get('MINERU_PAGE_WINDOW_SIZE'):
+        page_window_size = int(os.environ['MINERU_PAGE_WINDOW_SIZE'])
     output_file_paths = []
 
     if backend == "pipeline":
+        checkpoints = None
+        page_store = page_store_init() if incremental else None
+        if resume and page_store is None:
+            # checkpoint的key基于裁剪页码前的原始文档内容，与页码范围、解析参数一起计算
+            checkpoint_root = get_checkpoint_root(output_dir)
+            checkpoints = [
+                JobCheckpoint(checkpoint_root, make_job_key(
+                    pdf_bytes, start_page_id=start_page_id, end_page_id=end_page_id, parse_method=parse_method,
+                    lang=p_lang_list[idx], formula_enable=p_formula_enable, table_enable=p_table_enable,
+                ), pdf_file_names[idx])
+                for idx, pdf_bytes in enumerate(pdf_bytes_list)
+            ]
+
         for idx, pdf_bytes in enumerate(pdf_bytes_list):
             new_pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
             pdf_bytes_list[idx] = new_pdf_bytes
 
-        infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list = pipeline_doc_analyze(pdf_bytes_list, p_lang_list, parse_method=parse_method, formula_enable=p_formula_enable,table_enable=p_table_enable)
-
-        for idx, model_list in enumerate(infer_results):
-            model_json = copy.deepcopy(model_list)
-            pdf_file_name = pdf_file_names[idx]
-            local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
-            image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
-
-            images_list = all_image_lists[idx]
-            pdf_doc = all_pdf_docs[idx]
-            _lang = lang_list[idx]
-            _ocr_enable = ocr_enabled_list[idx]
-            middle_json = pipeline_result_to_middle_json(model_list, images_list, pdf_doc, image_writer, _lang, _ocr_enable, p_formula_enable)
+        if page_store is not None:
+            # 增量转换时每页的结果在处理完即入库，中断后重新运行同样会跳过已完成的页面，不再另建checkpoint
+            middle_json_iter = _pipeline_incremental_middle_json_iter(
+                output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method,
+                p_formula_enable, p_table_enable, page_window_size, page_store,
+            )
+        elif page_window_size or checkpoints:
+            # 断点续跑以页面窗口为单位保存进度，未指定窗口大小时使用流式处理的默认窗口
+            middle_json_iter = _pipeline_streaming_middle_json_iter(
+                output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method,
+                p_formula_enable, p_table_enable, page_window_size, checkpoints,
+            )
+        else:
+            middle_json_iter = _pipeline_middle_json_iter(
+                output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method,
+                p_formula_enable, p_table_enable,
+            )
 
-            pdf_info = middle_json["pdf_info"]
+        # 各产物在线程池中并发写出，写出的同时继续推理下一个文档
+        output_pool = OutputPool()
+        middle_format = get_middle_format()
+        # 推理或生成中途出错时也要等已提交的写出任务结束并关闭线程池
+        try:
+            for idx, model_json, middle_json in middle_json_iter:
+                pdf_file_name = pdf_file_names[idx]
+                local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
+                md_writer = FileBasedDataWriter(local_md_dir)
+                image_dir = str(os.path.basename(local_image_dir))
 
-            pdf_bytes = pdf_bytes_list[idx]
-            if f_draw_layout_bbox:
-                draw_layout_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
+                pdf_info = middle_json["pdf_info"]
 
-            if f_draw_span_bbox:
-                draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
+                pdf_bytes = pdf_bytes_list[idx]
+                if f_draw_layout_bbox:
+                    output_pool.submit(draw_layout_bbox, pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
 
-            if f_dump_orig_pdf:
-                md_writer.write(
-                    f"{pdf_file_name}_origin.pdf",
-                    pdf_bytes,
-                )
+                if f_draw_span_bbox:
+                    output_pool.submit(draw_span_bbox, pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
 
-            if f_dump_md:
-                image_dir = str(os.path.basename(local_image_dir))
-                md_content_str = pipeline_union_make(pdf_info, f_make_md_mode, image_dir)
-                output_file_path = os.path.join(local_md_dir, f"{pdf_file_name}.md")
-                md_writer.write_string(
-                    f"{pdf_file_name}.md",
-                    md_content_str,
-                )
-                output_file_paths.append(output_file_path)
+                if f_dump_orig_pdf:
+                    output_pool.submit(md_writer.write, f"{pdf_file_name}_origin.pdf", pdf_bytes)
 
-            if f_dump_content_list:
-                image_dir = str(os.path.basename(local_image_dir))
-                content_list = pipeline_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir)
-                md_writer.write_string(
-                    f"{pdf_file_name}_content_list.json",
-                    json.dumps(content_list, ensure_ascii=False, indent=4),
-                )
+                # 生成md和content_list时会把span中的全角字符转为半角，middle json要在这之后写出
+                content_futures = []
+                if f_dump_md:
+                    content_futures.append(output_pool.submit(
+                        _write_markdown, pdf_info, f_make_md_mode, image_dir, md_writer, f"{pdf_file_name}.md",
+                    ))
+                    output_file_paths.append(os.path.join(local_md_dir, f"{pdf_file_name}.md"))
 
-            if f_dump_middle_json:
-                output_file_path = os.path.join(local_md_dir, f"{pdf_file_name}_middle.json")
-                md_writer.write_string(
-                    f"{pdf_file_name}_middle.json",
-                    json.dumps(middle_json, ensure_ascii=False, indent=4),
-                )
-                if not f_dump_md: # 如果不输出MD，则返回JSON路径
-                    output_file_paths.append(output_file_path)
+                if f_dump_content_list:
+                    content_futures.append(output_pool.submit(
+                        _write_content_list, pdf_info, image_dir,
+                        os.path.join(local_md_dir, f"{pdf_file_name}_content_list.json"),
+                    ))
 
+                if f_dump_middle_json:
+                    output_file_path = None
+                    if middle_format in ('pack', 'both'):
+                        output_file_path = os.path.join(local_md_dir, f"{pdf_file_name}_middle{MIDDLE_PACK_SUFFIX}")
+                        output_pool.submit(write_middle_pack, middle_json, output_file_path, after=content_futures)
+                    if middle_format in ('json', 'both'):
+                        output_file_path = os.path.join(local_md_dir, f"{pdf_file_name}_middle.json")
+                        output_pool.submit(dump_json_stream, middle_json, output_file_path, after=content_futures)
+                    if not f_dump_md: # 如果不输出MD，则返回JSON路径
+                        output_file_paths.append(output_file_path)
 
-            if f_dump_model_output:
-                md_writer.write_string(
-                    f"{pdf_file_name}_model.json",
-                    json.dumps(model_json, ensure_ascii=False, indent=4),
-                )
+                if f_dump_model_output:
+                    output_pool.submit(dump_json_stream, model_json, os.path.join(local_md_dir, f"{pdf_file_name}_model.json"))
 
-            logger.info(f"local output dir is {local_md_dir}")
+                logger.info(f"local output dir is {local_md_dir}")
+        finally:
+            output_pool.join()
+            # 缓存中按批写回的访问时间在转换结束时落盘，保持磁盘上的LRU顺序
+            flush_all_caches()
+        # 所有产物都已写出，checkpoint不再需要
+        for checkpoint in checkpoints or ():
+            checkpoint.remove()
     else: # VLM backend logic...
         # ... (VLM logic remains the same, but should also append to output_file_paths)
         pass
@@ -121,6 +162,179 @@ def _do_parse_internal(
     return output_file_paths
 
 
+def _write_markdown(pdf_info, make_md_mode, image_dir, md_writer, file_name):
+    md_writer.write_string(file_name, pipeline_union_make(pdf_info, make_md_mode, image_dir))
+
+
+def _write_content_list(pdf_info, image_dir, path):
+    dump_json_stream(pipeline_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir), path)
+
+
+def _pipeline_middle_json_iter(
+    output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method, p_formula_enable, p_table_enable,
+):
+    """整本推理后逐个文档生成middle_json，yield (idx, model_json, middle_json)"""
+    infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list = pipeline_doc_analyze(pdf_bytes_list, p_lang_list, parse_method=parse_method, formula_enable=p_formula_enable,table_enable=p_table_enable)
+
+    for idx, model_list in enumerate(infer_results):
+        model_json = JsonListSnapshot(model_list)
+        local_image_dir, _ = prepare_env(output_dir, pdf_file_names[idx], parse_method)
+        image_writer = FileBasedDataWriter(local_image_dir)
+
+        images_list = all_image_lists[idx]
+        pdf_doc = all_pdf_docs[idx]
+        _lang = lang_list[idx]
+        _ocr_enable = ocr_enabled_list[idx]
+        middle_json = pipeline_result_to_middle_json(model_list, images_list, pdf_doc, image_writer, _lang, _ocr_enable, p_formula_enable)
+
+        # 释放已处理文档的页面图像
+        all_image_lists[idx] = None
+        yield idx, model_json, middle_json
+
+
+def _pipeline_streaming_middle_json_iter(
+    output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method, p_formula_enable, p_table_enable,
+    page_window_size, checkpoints=None,
+):
+    """
+    按页面窗口流式处理每个文档：渲染、推理、生成page_info并写出裁剪图后即释放该窗口的页面图像，
+    页面图像占用的内存只与窗口大小相关。model_json和middle_json的pdf_info仍随整篇文档增长，
+    分段等跨页处理完成后才一次性交给调用方写出。yield (idx, model_json, middle_json)
+
+    传入checkpoints时每个窗口处理完即保存各页的模型结果和page_info：
+    page_info已保存的窗口直接读取，不再渲染和推理；只有模型结果的窗口跳过推理，只重新生成page_info。
+    """
+    for idx, pdf_bytes in enumerate(pdf_bytes_list):
+        local_image_dir, _ = prepare_env(output_dir, pdf_file_names[idx], parse_method)
+        image_writer = FileBasedDataWriter(local_image_dir)
+        _lang = p_lang_list[idx]
+        checkpoint = checkpoints[idx] if checkpoints is not None else None
+
+        model_loader = skip_render = None
+        loaded_model_windows = set()
+        loaded_page_infos = {}
+        if checkpoint is not None:
+            def model_loader(page_start, page_end):
+                model_list = checkpoint.load_pages(MODEL_STAGE, page_start, page_end)
+                if model_list is not None:
+                    loaded_model_windows.add(page_start)
+                return model_list
+
+            def skip_render(page_start, page_end):
+                page_infos = checkpoint.load_pages(MIDDLE_STAGE, page_start, page_end)
+                if page_infos is None:
+                    return False
+                loaded_page_infos[page_start] = page_infos
+                return True
+
+        model_json = JsonListSnapshot()
+        middle_json = pipeline_init_middle_json()
+        pdf_doc = None
+        for page_start, model_list, images_list, pdf_doc, _ocr_enable in pipeline_doc_analyze_streaming(
+            pdf_bytes, _lang, parse_method=parse_method, formula_enable=p_formula_enable,
+            table_enable=p_table_enable, page_window_size=page_window_size,
+            model_loader=model_loader, skip_render=skip_render,
+        ):
+            if images_list is None:
+                model_json.extend(model_list)
+                middle_json["pdf_info"].extend(loaded_page_infos.pop(page_start))
+                continue
+
+            if checkpoint is not None and page_start not in loaded_model_windows:
+                checkpoint.save_pages(MODEL_STAGE, page_start, model_list)
+            model_json.extend(model_list)
+            pipeline_append_pages_to_middle_json(
+                middle_json, model_list, images_list, pdf_doc, image_writer,
+                page_start=page_start, lang=_lang, ocr_enable=_ocr_enable, formula_enabled=p_formula_enable,
+            )
+            if checkpoint is not None:
+                # 分段等跨页处理会修改page_info，这里保存的是其之前的状态
+                checkpoint.save_pages(MIDDLE_STAGE, page_start, middle_json["pdf_info"][-len(model_list):])
+            del images_list
+
+        pipeline_finalize_middle_json(middle_json)
+        if pdf_doc is not None:
+            pdf_doc.close()
+        clean_memory(get_device())
+
+        yield idx, model_json, middle_json
+
+
+def _pipeline_incremental_middle_json_iter(
+    output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, parse_method, p_formula_enable, p_table_enable,
+    page_window_size, page_store,
+):
+    """
+    增量转换：按页面内容哈希在页面结果库中查找每页之前的模型结果和page_info，命中的页面直接复用，
+    只对未命中的页面渲染、推理并生成page_info，处理完的页面随即入库。
+    全部页面按页码合并后再统一做分段等跨页处理。yield (idx, model_json, middle_json)
+    """
+    for idx, pdf_bytes in enumerate(pdf_bytes_list):
+        local_image_dir, _ = prepare_env(output_dir, pdf_file_names[idx], parse_method)
+        image_writer = FileBasedDataWriter(local_image_dir)
+        _lang = p_lang_list[idx]
+        _ocr_enable = get_ocr_enable(pdf_bytes, parse_method)
+
+        pdf_doc = pdfium.PdfDocument(pdf_bytes)
+        page_keys = [
+            page_store.page_key(
+                page_content_hash(pdf_doc[page_index]), parse_method=parse_method, lang=_lang,
+                ocr_enable=_ocr_enable, formula_enable=p_formula_enable, table_enable=p_table_enable,
+            )
+            for page_index in range(len(pdf_doc))
+        ]
+        pdf_doc.close()
+
+        model_pages = {}
+        page_infos = {}
+        changed_page_indices = []
+        for page_index, page_key in enumerate(page_keys):
+            cached = page_store.get(page_key, page_index, image_writer)
+            if cached is None:
+                changed_page_indices.append(page_index)
+            else:
+                model, page_infos[page_index] = cached
+                model_pages[page_index] = encode_compact_json(model)
+        logger.info(
+            f"{pdf_file_names[idx]}: 复用{len(page_keys) - len(changed_page_indices)}页，"
+            f"需要处理{len(changed_page_indices)}页"
+        )
+
+        if changed_page_indices:
+            pdf_doc = None
+            for window_page_indices, model_list, images_list, pdf_doc in pipeline_doc_analyze_pages(
+                pdf_bytes, _lang, changed_page_indices, _ocr_enable, formula_enable=p_formula_enable,
+                table_enable=p_table_enable, page_window_size=page_window_size,
+            ):
+                model_texts = [encode_compact_json(page_model) for page_model in model_list]
+                window_middle_json = pipeline_init_middle_json()
+                pipeline_append_pages_to_middle_json(
+                    window_middle_json, model_list, images_list, pdf_doc, image_writer,
+                    lang=_lang, ocr_enable=_ocr_enable, formula_enabled=p_formula_enable,
+                    page_indices=window_page_indices,
+                )
+                del images_list
+                for page_index, model_text, page_info in zip(
+                    window_page_indices, model_texts, window_middle_json["pdf_info"]
+                ):
+                    # 分段等跨页处理会修改page_info，入库的是其之前的状态
+                    page_store.put(page_keys[page_index], model_text, page_info, local_image_dir)
+                    model_pages[page_index] = model_text
+                    page_infos[page_index] = page_info
+            if pdf_doc is not None:
+                pdf_doc.close()
+            clean_memory(get_device())
+
+        model_json = JsonListSnapshot()
+        for page_index in range(len(page_keys)):
+            model_json.append_encoded(model_pages[page_index])
+        middle_json = pipeline_init_middle_json()
+        middle_json["pdf_info"] = [page_infos[page_index] for page_index in range(len(page_keys))]
+        pipeline_finalize_middle_json(middle_json)
+
+        yield idx, model_json, middle_json
+
+
 def parse_pdfs_to_files(
         path_list: List[Union[str, Path]],
         output_dir,
@@ -131,6 +345,9 @@ def parse_pdfs_to_files(
         start_page_id=0,
         end_page_id=None,
         dump_md=True,
+        page_window_size=None,
+        resume=False,
+        incremental=False,
 ):
     """
     解析多个PDF/图像文件，并返回生成的文件路径。
@@ -157,7 +374,10 @@ def parse_pdfs_to_files(
             start_page_id=start_page_id,
             end_page_id=end_page_id,
             f_dump_md=dump_md,
-            f_dump_middle_json=True # Always dump json for format mode
+            f_dump_middle_json=True, # Always dump json for format mode
+            page_window_size=page_window_size,
+            resume=resume,
+            incremental=incremental,
         )
     except Exception as e:
         logger.exception(e)
@@ -173,11 +393,15 @@ def parse_pdf_to_files(
         start_page_id=0,
         end_page_id=None,
         dump_md=True,
+        page_window_size=None,
+        resume=False,
+        incremental=False,
 ):
     """
     解析单个PDF/图像文件，并返回生成的文件路径。
     """
     results = parse_pdfs_to_files(
-        [path], output_dir, lang, backend, method, server_url, start_page_id, end_page_id, dump_md
+        [path], output_dir, lang, backend, method, server_url, start_page_id, end_page_id, dump_md,
+        page_window_size=page_window_size, resume=resume, incremental=incremental,
     )
     return results[0] if results else None 
\ No newline at end of file
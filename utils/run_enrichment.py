@@ -1,127 +1,199 @@
 import os
 import json
 import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
 from thefuzz import fuzz
 from tqdm import tqdm
 from loguru import logger
 
+from utils.middle_pack import MIDDLE_PACK_SUFFIX, MiddlePackWriter, load_middle_json
+
+INDEX_NGRAM_SIZE = 4  # Length of the character n-grams used as alignment seeds.
+MAX_SEED_PROBES = 16  # At most this many n-grams of a block are looked up in the index.
+MAX_SEED_HITS = 64  # N-grams occurring more often than this in the search range carry no position information.
+MIN_SIMILARITY = 90  # A block takes the matched font size only if fuzz.partial_ratio exceeds this.
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    return _WHITESPACE_RE.sub('', text)
+
+
+class SpanTextAligner:
+    """
+    Aligns layout blocks against the PyMuPDF span stream of the analysis file.
+
+    All spans are normalized once into a single string, with an array mapping each character offset back to its
+    span and the character range of every page. An n-gram index over that string gives seed positions; the seeds of
+    a block vote for an alignment offset (restricted to the block's own page first, the whole document otherwise),
+    and only the winning region is verified with a single bounded fuzzy comparison.
+    """
+
+    def __init__(self, analysis_data):
+        text_parts = []
+        char_spans = []
+        span_sizes = []
+        self.page_ranges = {}
+        offset = 0
+        for page_index, page in enumerate(analysis_data.get('pages', [])):
+            page_start = offset
+            for block in page.get('blocks', []):
+                for line in block.get('lines', []):
+                    for span in line.get('spans', []):
+                        text = normalize_text(span.get('text', ''))
+                        text_parts.append(text)
+                        char_spans.append(np.full(len(text), len(span_sizes), dtype=np.int32))
+                        span_sizes.append(span.get('size', 0))
+                        offset += len(text)
+            self.page_ranges[page.get('page_number', page_index + 1) - 1] = (page_start, offset)
+
+        self.text = ''.join(text_parts)
+        self.char_spans = np.concatenate(char_spans) if char_spans else np.zeros(0, dtype=np.int32)
+        self.span_sizes = np.asarray(span_sizes, dtype=np.float64)
+
+        # Positions are appended in increasing order, so every posting list is sorted.
+        self.ngram_index = defaultdict(list)
+        for pos in tqdm(range(len(self.text) - INDEX_NGRAM_SIZE + 1), desc="Building Index", leave=False):
+            self.ngram_index[self.text[pos: pos + INDEX_NGRAM_SIZE]].append(pos)
+
+    def _seed_hits(self, target, range_start, range_end):
+        """
+        Seed hits of the target's n-grams inside [range_start, range_end), grouped by the stream offset at which
+        each hit places the start of the target: {offset: [(target_offset, stream_pos), ...]}
+        """
+        hits = defaultdict(list)
+        if len(target) < INDEX_NGRAM_SIZE:
+            pos = self.text.find(target, range_start, range_end)
+            if pos >= 0:
+                hits[pos].append((0, pos))
+            return hits
+
+        probe_count = len(target) - INDEX_NGRAM_SIZE + 1
+        for target_offset in np.linspace(0, probe_count - 1, min(probe_count, MAX_SEED_PROBES), dtype=int):
+            target_offset = int(target_offset)
+            positions = self.ngram_index.get(target[target_offset: target_offset + INDEX_NGRAM_SIZE])
+            if not positions:
+                continue
+            lo = bisect_left(positions, range_start)
+            hi = bisect_right(positions, range_end - INDEX_NGRAM_SIZE)
+            if hi - lo > MAX_SEED_HITS:
+                continue
+            for pos in positions[lo:hi]:
+                hits[pos - target_offset].append((target_offset, pos))
+        return hits
+
+    @staticmethod
+    def _best_chain(hits, slack):
+        """
+        Seed hits supporting the best alignment: the offset with the most hits at offsets within slack of it,
+        which tolerates small insertions and deletions. Returned sorted by target offset.
+        """
+        best_chain = []
+        for offset in sorted(hits, key=lambda o: len(hits[o]), reverse=True)[:5]:
+            chain = [hit for other, other_hits in hits.items() if abs(other - offset) <= slack for hit in other_hits]
+            if len(chain) > len(best_chain):
+                best_chain = chain
+        return sorted(best_chain)
+
+    def match(self, target, page_index=None):
+        """
+        Average font size of the spans aligned with the normalized target text,
+        or None when the aligned region is not similar enough.
+        """
+        if not target or not self.text:
+            return None
+
+        hits = {}
+        page_range = self.page_ranges.get(page_index)
+        if page_range is not None:
+            range_start, range_end = page_range
+            hits = self._seed_hits(target, range_start, range_end)
+        if not hits:
+            range_start, range_end = 0, len(self.text)
+            hits = self._seed_hits(target, range_start, range_end)
+        if not hits:
+            return None
+
+        # The aligned region is anchored on the first and last supporting seeds, so indels between them do not
+        # shift its ends.
+        slack = max(2, len(target) // 10)
+        chain = self._best_chain(hits, slack)
+        (first_offset, first_pos), (last_offset, last_pos) = chain[0], chain[-1]
+        start = max(range_start, first_pos - first_offset)
+        end = min(range_end, last_pos + len(target) - last_offset)
+        region = self.text[max(range_start, start - slack): min(range_end, end + slack)]
+        if fuzz.partial_ratio(target, region) <= MIN_SIMILARITY:
+            return None
+
+        sizes = self.span_sizes[np.unique(self.char_spans[start:end])]
+        sizes = sizes[sizes > 0]
+        if sizes.size == 0:
+            return None
+        return round(float(sizes.mean()), 2)
+
+
 def enrich_layout_with_font_size(layout_path, analysis_path, output_path):
     """
     Enriches the layout.json file with average font size information from the analysis.json file.
-    Uses a pre-built index to significantly speed up matching for long text blocks.
+    Each text/title block is located in the analysis spans with SpanTextAligner.
     """
-    import json
-    import re
-    from thefuzz import fuzz
-    from tqdm import tqdm
-
     logger.info("Loading layout file...")
-    with open(layout_path, 'r', encoding='utf-8') as f:
-        layout_data = json.load(f)
+    # .mpk layout files are memory-mapped and decoded page by page
+    layout_data = load_middle_json(layout_path)
 
     logger.info("Loading analysis file...")
     with open(analysis_path, 'r', encoding='utf-8') as f:
         analysis_data = json.load(f)
 
-    logger.info("Extracting spans from analysis data...")
-    analysis_spans = []
-    for page in analysis_data.get('pages', []):
-        for block in page.get('blocks', []):
-            if 'lines' in block:
-                for line in block.get('lines', []):
-                    for span in line.get('spans', []):
-                        analysis_spans.append({
-                            'text': span.get('text', ''),
-                            'size': span.get('size', 0)
-                        })
-
-    # 1. Build a quick-lookup index to find starting positions of text sequences.
-    logger.info("\nBuilding a quick-lookup index for analysis spans...")
-    INDEX_NGRAM_SIZE = 7  # Use a 7-character key for the index.
-    span_index = {}
-    
-    # The index maps a short, normalized text snippet (key) to the starting span index (value).
-    for i in tqdm(range(len(analysis_spans)), desc="Building Index", leave=False):
-        # Create a candidate key by joining a few subsequent spans
-        spans_to_join = analysis_spans[i : i + 5]
-        raw_text = "".join(s['text'] for s in spans_to_join)
-        normalized_text = re.sub(r'\s+', '', raw_text)
-        
-        if len(normalized_text) >= INDEX_NGRAM_SIZE:
-            key = normalized_text[:INDEX_NGRAM_SIZE]
-            if key not in span_index:  # Store only the first occurrence to keep the index small
-                span_index[key] = i
+    # 1. Normalize the analysis spans into one indexed text stream.
+    logger.info("\nBuilding the span alignment index...")
+    aligner = SpanTextAligner(analysis_data)
+    del analysis_data
 
     logger.info("\nIndex built. Starting block matching process...")
 
+    # Enriched pages are streamed straight to an .mpk output; JSON output is dumped at the end.
+    if output_path.endswith(MIDDLE_PACK_SUFFIX):
+        page_writer = MiddlePackWriter(output_path, {k: v for k, v in layout_data.items() if k != 'pdf_info'})
+        save_page = page_writer.add_page
+    else:
+        page_writer = None
+        enriched_pages = []
+        save_page = enriched_pages.append
+
     # 2. Process all blocks.
-    for page_info in tqdm(layout_data.get('pdf_info', []), desc="Processing Pages"):
-        for block in page_info.get('para_blocks', []):
-            if block.get('type') in ['text', 'title']:
-                content_parts = []
-                if 'lines' in block:
-                    for line in block['lines']:
-                        for span in line.get('spans', []):
-                            content_parts.append(span.get('content', ''))
-                
-                target_text = "".join(content_parts)
-                normalized_target = re.sub(r'\s+', '', target_text)
-
-                if not normalized_target:
-                    continue
-
-                best_match_info = {'score': 0, 'avg_size': 0, 'text': ''}
-                
-                # --- OPTIMIZATION LOGIC ---
-                # For long texts, we use the index. For short texts, a full scan is fast enough.
-                if len(normalized_target) >= 20:
-                    # FAST PATH for long texts
-                    search_key = normalized_target[:INDEX_NGRAM_SIZE]
-                    start_pos = span_index.get(search_key)
-
-                    if start_pos is not None:
-                        # Index hit! We only need to search from this one starting position.
-                        for j in range(start_pos, min(start_pos + 50, len(analysis_spans))):
-                            current_text_parts = [s['text'] for s in analysis_spans[start_pos:j+1]]
-                            normalized_current = re.sub(r'\s+', '', "".join(current_text_parts))
-                            
-                            similarity = fuzz.partial_ratio(normalized_target, normalized_current)
-                            if similarity > 90 and len(normalized_current) > len(best_match_info['text']):
-                                sizes = [s['size'] for s in analysis_spans[start_pos:j+1] if s['size'] > 0]
-                                if sizes:
-                                    avg_size = sum(sizes) / len(sizes)
-                                    best_match_info = {'score': similarity, 'avg_size': round(avg_size, 2), 'text': normalized_current}
-                            
-                            if len(normalized_current) > len(normalized_target) + 10:
-                                break
-                else:
-                    # SLOW PATH for short texts (but it's fast enough)
-                    for i in range(len(analysis_spans)):
-                        current_text_parts = []
-                        for j in range(i, min(i + 50, len(analysis_spans))):
-                            current_text_parts.append(analysis_spans[j]['text'])
-                            normalized_current = re.sub(r'\s+', '', "".join(current_text_parts))
-                            
-                            similarity = fuzz.partial_ratio(normalized_target, normalized_current)
-                            if similarity > 90 and len(normalized_current) > len(best_match_info['text']):
-                                sizes = [s['size'] for s in analysis_spans[i:j+1] if s['size'] > 0]
-                                if sizes:
-                                    avg_size = sum(sizes) / len(sizes)
-                                    best_match_info = {'score': similarity, 'avg_size': round(avg_size, 2), 'text': normalized_current}
-                            
-                            if len(normalized_current) > len(normalized_target) + 10:
-                                break
-                        if best_match_info['score'] > 98: # Optimization for short texts: exit if a near-perfect match is found
-                            break
-
-                # Update block with the best match found
-                if best_match_info['score'] > 90:
-                    block['avg_size'] = best_match_info['avg_size']
+    # If matching fails, the partially written .mpk temp file is removed instead of being left behind.
+    try:
+        for page_info in tqdm(layout_data.get('pdf_info', []), desc="Processing Pages"):
+            page_index = page_info.get('page_idx')
+            for block in page_info.get('para_blocks', []):
+                if block.get('type') in ['text', 'title']:
+                    content_parts = []
+                    if 'lines' in block:
+                        for line in block['lines']:
+                            for span in line.get('spans', []):
+                                content_parts.append(span.get('content', ''))
+
+                    avg_size = aligner.match(normalize_text("".join(content_parts)), page_index)
+                    if avg_size is not None:
+                        block['avg_size'] = avg_size
+            save_page(page_info)
+    except BaseException:
+        if page_writer is not None:
+            page_writer.abort()
+        raise
 
     logger.info(f"\nSaving enriched layout to {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(layout_data, f, ensure_ascii=False, indent=4)
-    
+    if page_writer is not None:
+        page_writer.close()
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({**layout_data, 'pdf_info': enriched_pages}, f, ensure_ascii=False, indent=4)
+
     logger.info("Enrichment complete.")
 
 if __name__ == "__main__":
@@ -135,4 +207,4 @@ if __name__ == "__main__":
         logger.error(f"Error: Analysis file not found at {analysis_file}")
     else:
         enrich_layout_with_font_size(layout_file, analysis_file, output_file)
-        logger.info(f"Enriched layout saved to {output_file}") 
\ No newline at end of file
+        logger.info(f"Enriched layout saved to {output_file}")